@@ -1 +1 @@
-
+default_app_config = 'analyses.apps.AnalysesConfig'
@@ -2,10 +2,17 @@ from pathlib import Path
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.http import (
+    Http404, HttpResponse, HttpResponseForbidden, HttpResponseGone,
+    StreamingHttpResponse,
+)
 from django.shortcuts import redirect
 
+from .bundles import (
+    BundleError, collect_files, mod_zip_file_list, stream_tar, stream_zip,
+)
 from .models import Report
+from .retention import find_archived
 
 
 @login_required
@@ -80,19 +87,105 @@ def access_result(request, auth_key, file_path):
         if report.analysis.owner != request.user:
             return HttpResponseForbidden('The requested result is not public.')
 
+    archived_response = archived_result_response(report, file_path)
+    if archived_response is not None:
+        return archived_response
+
+    # results are stored by analysis, and symlinks must not lead outside
+    analysis = report.analysis
+    result_dir = analysis.result_dir.resolve()
+    try:
+        rel_path = (
+            result_dir.joinpath(file_path).resolve().relative_to(result_dir)
+        )
+    except (OSError, RuntimeError, ValueError):
+        raise result_not_found_404
+
     if settings.DEBUG:
         # use Django debug server
         from django.views.static import serve
-        pth = Path(file_path)
-        full_dirname = Path(
-            settings.BIOCLOUD_RESULTS_DIR, str(report.pk), pth.parent
-        )
-        return serve(request, pth.name, full_dirname.as_posix())
+        return serve(request, rel_path.as_posix(), result_dir.as_posix())
     else:
         # use nginx
         response = HttpResponse()
         response['Content-Type'] = ''  # let nginx guess mime type
         response['X-Accel-Redirect'] = (
-            '/protected/result/%s/%s' % (str(report.pk), file_path)
+            '/protected/result/%d/%s' % (analysis.pk, rel_path.as_posix())
         )
         return response
+
+
+def archived_result_response(report, file_path):
+    """Tell a missing result file was archived by the retention policies.
+
+    Returns:
+        HttpResponseGone: or None if the file is not archived.
+    """
+    result_dir = report.analysis.result_dir
+    if result_dir.joinpath(file_path).exists():
+        return None
+    archived = find_archived(result_dir, file_path)
+    if archived is None:
+        return None
+    message = 'The requested result was archived (%s) on %s.' % (
+        archived['action'], archived['date_archived'][:10],
+    )
+    if archived['replaced_by']:
+        message += ' It is now available as %s.' % archived['replaced_by']
+    return HttpResponseGone(message, content_type='text/plain')
+
+
+def access_result_bundle(request, auth_key, archive_format):
+    """Download result files as a single zip or tar archive.
+
+    The files are selected by the ``path`` query parameters, relative
+    paths of files or folders under the result folder. All results are
+    sent if no path is given.
+    """
+    result_not_found_404 = Http404(
+        'Cannot find the given result, or the authentication key is '
+        'invalid or expired'
+    )
+    try:
+        report = Report.objects.get_with_auth_key(auth_key)
+    except Report.DoesNotExist:
+        raise result_not_found_404
+
+    # check if the report is public
+    if not report.is_public:
+        if report.analysis.owner != request.user:
+            return HttpResponseForbidden('The requested result is not public.')
+
+    analysis = report.analysis
+    try:
+        files = collect_files(
+            analysis.result_dir, request.GET.getlist('path'),
+        )
+    except BundleError:
+        raise result_not_found_404
+    if not files:
+        raise result_not_found_404
+
+    if archive_format == 'zip' and not settings.DEBUG:
+        # let nginx build the archive by mod_zip
+        response = HttpResponse(
+            mod_zip_file_list(
+                files, analysis.result_dir,
+                '/protected/result/%d' % analysis.pk,
+            ),
+            content_type='text/plain',
+        )
+        response['X-Archive-Files'] = 'zip'
+    elif archive_format == 'zip':
+        response = StreamingHttpResponse(
+            stream_zip(files), content_type='application/zip',
+        )
+    else:
+        response = StreamingHttpResponse(
+            stream_tar(files), content_type='application/x-tar',
+        )
+    response['Content-Disposition'] = (
+        'attachment; filename="analysis-%d-results.%s"'
+        % (analysis.pk, archive_format)
+    )
+    return response
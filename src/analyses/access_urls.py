@@ -1,7 +1,7 @@
 from django.conf.urls import url
 from .access import (
     canonical_access_report, access_report,
-    access_result,
+    access_result, access_result_bundle,
 )
 
 urlpatterns = [
@@ -18,4 +18,8 @@ urlpatterns = [
         r'^(?P<auth_key>[\w:-]+)/result/(?P<file_path>.*)$',
         access_result, name='access_result'
     ),
+    url(
+        r'^(?P<auth_key>[\w:-]+)/bundle\.(?P<archive_format>zip|tar)$',
+        access_result_bundle, name='access_result_bundle'
+    ),
 ]
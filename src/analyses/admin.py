@@ -3,7 +3,8 @@ from django.contrib import admin
 from django.utils.translation import ugettext_lazy as _
 
 from core.widgets import SimpleMDEWidget
-from .models import GenomeReference, Report
+from .job_queue import dispatch
+from .models import AnalysisTicket, GenomeReference, Report, TicketStatus
 from .forms import GenomeReferenceCreateForm
 
 
@@ -67,6 +68,34 @@ class ReportAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(AnalysisTicket)
+class AnalysisTicketAdmin(admin.ModelAdmin):
+
+    list_display = (
+        'pk', 'pipeline', 'analysis_pk', 'owner', 'priority', 'status',
+        'cores', 'memory', 'disk', 'date_submitted', 'date_dispatched',
+    )
+    list_display_links = ('pk', )
+    list_editable = ('priority', )
+    list_filter = ('status', 'pipeline')
+    readonly_fields = (
+        'date_submitted', 'date_dispatched', 'date_finished',
+    )
+    actions = ['cancel_tickets', 'dispatch_tickets']
+
+    def cancel_tickets(self, request, queryset):
+        queryset.filter(status=TicketStatus.QUEUED.name).update(
+            status=TicketStatus.CANCELLED.name
+        )
+    cancel_tickets.short_description = _('Cancel selected queued tickets')
+
+    def dispatch_tickets(self, request, queryset):
+        dispatch(ticket_pks=set(queryset.values_list('pk', flat=True)))
+    dispatch_tickets.short_description = _(
+        'Dispatch selected queued tickets now'
+    )
+
+
 class AbstractAnalysisAdminUpdateForm(forms.ModelForm):
 
     class Meta:
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class AnalysesConfig(AppConfig):
     name = 'analyses'
+
+    def ready(self):
+        # Connect the signal receivers
+        from . import signals  # noqa
@@ -0,0 +1,262 @@
+"""Stream result files as a zip or tar archive.
+
+The archives are generated while being sent, one chunk at a time, so the
+memory used does not depend on the size of the files and no temporary
+archive is written. Zip members are stored without compression, as most
+results (BAM, gzip) are compressed already, which also lets nginx build
+the same archive by mod_zip.
+"""
+from collections import namedtuple
+import os
+from pathlib import Path
+import struct
+import tarfile
+import time
+from urllib.parse import quote
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+
+BundleFile = namedtuple('BundleFile', ['arcname', 'path', 'size', 'mtime'])
+BundleFile.__doc__ = """A file to put in an archive.
+
+arcname is its relative POSIX path in the archive, path its full path with
+symlinks resolved.
+"""
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_FLAGS = 0x0808  # Sizes after the data, UTF-8 names
+ZIP_VERSION = 20
+ZIP64_VERSION = 45
+
+
+class BundleError(ValueError):
+    """The requested files cannot be bundled."""
+
+
+def collect_files(root, rel_paths):
+    """List the files under the given paths of a folder.
+
+    Args:
+        root (pathlib.Path): Folder the paths are relative to.
+        rel_paths (list of str): Relative paths of files or folders. The
+            whole folder if empty.
+
+    Files in the folders that are symlinks to somewhere outside of the
+    folder are skipped, and symlinked subfolders are not followed.
+
+    Returns:
+        list of BundleFile: the files, sorted and without duplicates.
+
+    Raises:
+        BundleError: A path is outside of the folder or does not exist.
+    """
+    root = Path(root).resolve()
+    if not rel_paths:
+        rel_paths = ['']
+    files = {}
+    for rel_path in rel_paths:
+        norm_path = os.path.normpath(rel_path.strip('/'))
+        full_path = root.joinpath(norm_path)
+        try:
+            if norm_path == '..' or norm_path.startswith('../'):
+                raise ValueError
+            real_path = full_path.resolve()
+            real_path.relative_to(root)
+        except (OSError, RuntimeError, ValueError):
+            real_path = None
+        if real_path is None or not real_path.exists():
+            raise BundleError('Invalid path %s' % rel_path)
+        if real_path.is_dir():
+            for dir_path, dir_names, file_names in os.walk(str(full_path)):
+                dir_names.sort()
+                for file_name in file_names:
+                    _add_file(files, root, Path(dir_path, file_name))
+        else:
+            _add_file(files, root, full_path)
+    return [files[arcname] for arcname in sorted(files)]
+
+
+def _add_file(files, root, path):
+    arcname = path.relative_to(root).as_posix()
+    try:
+        real_path = path.resolve()
+        real_path.relative_to(root)
+        stat = real_path.stat()
+    except (OSError, RuntimeError, ValueError):
+        return  # A broken symlink, a symlink loop or outside of the folder
+    files[arcname] = BundleFile(
+        arcname, real_path, stat.st_size, stat.st_mtime,
+    )
+
+
+def read_chunks(path, size):
+    """Yield exactly size bytes of a file, padded if it shrank."""
+    remaining = size
+    with path.open('rb') as f:
+        while remaining:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    while remaining:
+        padding = min(CHUNK_SIZE, remaining)
+        remaining -= padding
+        yield bytes(padding)
+
+
+def stream_tar(files):
+    """Yield a tar archive of the given files chunk by chunk.
+
+    Args:
+        files (list of BundleFile): Files to archive.
+    """
+    total = 0
+    for bundle_file in files:
+        info = tarfile.TarInfo(bundle_file.arcname)
+        info.size = bundle_file.size
+        info.mtime = int(bundle_file.mtime)
+        info.mode = 0o644
+        header = info.tobuf(
+            format=tarfile.PAX_FORMAT, encoding='utf-8',
+            errors='surrogateescape',
+        )
+        yield header
+        yield from read_chunks(bundle_file.path, bundle_file.size)
+        padding = -bundle_file.size % tarfile.BLOCKSIZE
+        if padding:
+            yield bytes(padding)
+        total += len(header) + bundle_file.size + padding
+    # End of archive marker, then fill the last record like tar does
+    end = 2 * tarfile.BLOCKSIZE
+    end += -(total + end) % tarfile.RECORDSIZE
+    yield bytes(end)
+
+
+def dos_datetime(timestamp):
+    """Return the (time, date) of a timestamp in MS-DOS format."""
+    t = time.localtime(max(timestamp, 315532800))  # Not before 1980
+    return (
+        (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+        ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday,
+    )
+
+
+def stream_zip(files):
+    """Yield a zip archive of the given files chunk by chunk.
+
+    Files are stored without compression. The CRC of a file is computed
+    while sending it and written after its data, so each file is read
+    only once. Zip64 records are used for files and archives larger than
+    4 GB.
+
+    Args:
+        files (list of BundleFile): Files to archive.
+    """
+    offset = 0
+    central_dir = []
+    for bundle_file in files:
+        name = bundle_file.arcname.encode('utf-8')
+        mod_time, mod_date = dos_datetime(bundle_file.mtime)
+        zip64 = bundle_file.size >= ZIP64_LIMIT
+        version = ZIP64_VERSION if zip64 else ZIP_VERSION
+        extra = struct.pack('<HHQQ', 1, 16, 0, 0) if zip64 else b''
+        header = struct.pack(
+            '<IHHHHHIIIHH',
+            0x04034b50, version, ZIP_FLAGS, 0, mod_time, mod_date,
+            0, ZIP64_LIMIT if zip64 else 0, ZIP64_LIMIT if zip64 else 0,
+            len(name), len(extra),
+        ) + name + extra
+        yield header
+
+        crc = 0
+        for chunk in read_chunks(bundle_file.path, bundle_file.size):
+            crc = zlib.crc32(chunk, crc)
+            yield chunk
+        size = bundle_file.size
+        if zip64:
+            descriptor = struct.pack('<IIQQ', 0x08074b50, crc, size, size)
+        else:
+            descriptor = struct.pack('<IIII', 0x08074b50, crc, size, size)
+        yield descriptor
+
+        central_dir.append(_central_dir_header(
+            name, version, mod_time, mod_date, crc, size, offset,
+        ))
+        offset += len(header) + size + len(descriptor)
+
+    central_dir = b''.join(central_dir)
+    yield central_dir
+    yield _end_of_central_dir(len(files), len(central_dir), offset)
+
+
+def _central_dir_header(name, version, mod_time, mod_date, crc, size,
+                        offset):
+    zip64_fields = []
+    if size >= ZIP64_LIMIT:
+        zip64_fields += [size, size]
+    if offset >= ZIP64_LIMIT:
+        zip64_fields.append(offset)
+    extra = b''
+    if zip64_fields:
+        version = ZIP64_VERSION
+        extra = struct.pack(
+            '<HH%dQ' % len(zip64_fields),
+            1, 8 * len(zip64_fields), *zip64_fields
+        )
+    return struct.pack(
+        '<IHHHHHHIIIHHHHHII',
+        0x02014b50, (3 << 8) | version, version, ZIP_FLAGS, 0,
+        mod_time, mod_date, crc,
+        ZIP64_LIMIT if size >= ZIP64_LIMIT else size,
+        ZIP64_LIMIT if size >= ZIP64_LIMIT else size,
+        len(name), len(extra), 0, 0, 0,
+        0o100644 << 16,  # Regular file readable by everyone
+        ZIP64_LIMIT if offset >= ZIP64_LIMIT else offset,
+    ) + name + extra
+
+
+def _end_of_central_dir(num_entries, central_dir_size, central_dir_offset):
+    records = b''
+    if num_entries >= 0xFFFF or central_dir_size >= ZIP64_LIMIT or \
+            central_dir_offset >= ZIP64_LIMIT:
+        zip64_offset = central_dir_offset + central_dir_size
+        records += struct.pack(
+            '<IQHHIIQQQQ',
+            0x06064b50, 44, (3 << 8) | ZIP64_VERSION, ZIP64_VERSION, 0, 0,
+            num_entries, num_entries, central_dir_size, central_dir_offset,
+        )
+        records += struct.pack('<IIQI', 0x07064b50, 0, zip64_offset, 1)
+    return records + struct.pack(
+        '<IHHHHIIH',
+        0x06054b50, 0, 0,
+        min(num_entries, 0xFFFF), min(num_entries, 0xFFFF),
+        min(central_dir_size, ZIP64_LIMIT),
+        min(central_dir_offset, ZIP64_LIMIT),
+        0,
+    )
+
+
+def mod_zip_file_list(files, root, location_prefix):
+    """Return the file list for nginx mod_zip to build a zip archive.
+
+    Each line gives the CRC (unknown), size, internal location and name of
+    a file, see https://github.com/evanmiller/mod_zip. Locations point to
+    the real paths of the files, so nginx follows no symlink.
+
+    Args:
+        files (list of BundleFile): Files to archive.
+        root (pathlib.Path): Folder the location prefix points to.
+        location_prefix (str): Internal nginx location of the folder.
+    """
+    root = Path(root).resolve()
+    return ''.join(
+        '- %d %s/%s %s\n' % (
+            bundle_file.size,
+            location_prefix.rstrip('/'),
+            quote(bundle_file.path.relative_to(root).as_posix()),
+            bundle_file.arcname,
+        )
+        for bundle_file in files
+    )
@@ -0,0 +1,140 @@
+from functools import wraps
+import json
+import logging
+from pathlib import Path
+
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(path):
+    """Return the size, modification time and inode of the files under path.
+
+    A file replaced by another one, even of the same size and modification
+    time, gets another inode. Outputs take hundreds of GB, so they are
+    never hashed.
+
+    Args:
+        path (pathlib.Path): A file or a directory.
+
+    Returns:
+        dict: file path to its ``[size, mtime_ns, inode]``, empty if the
+        path does not exist.
+    """
+    path = Path(path)
+    if path.is_dir():
+        files = sorted(p for p in path.rglob('*') if p.is_file())
+    elif path.exists():
+        files = [path]
+    else:
+        files = []
+    fingerprints = {}
+    for file_path in files:
+        stat = file_path.stat()
+        fingerprints[str(file_path)] = [
+            stat.st_size, stat.st_mtime_ns, stat.st_ino,
+        ]
+    return fingerprints
+
+
+class StepCheckpoint:
+    def __init__(self, manifest_dir, step_name, inputs, outputs, parameters):
+        """Completion manifest of a pipeline step.
+
+        When the step succeeds, a JSON manifest recording its inputs,
+        parameters, exit code and output fingerprints is written under
+        ``manifest_dir``. On the next run, the step is skipped as long as
+        the manifest is still valid, that is, the parameters are the same
+        and none of the inputs or outputs has changed since.
+
+        Args:
+            manifest_dir (pathlib.Path): Folder to store the manifests,
+                usually inside the analysis result folder.
+
+            step_name (str): Name of the step. Ex. ``star:sample_A``.
+
+            inputs (list of pathlib.Path): Files or folders the step reads.
+
+            outputs (list of pathlib.Path): Files or folders the step
+                writes.
+
+            parameters (dict): Anything else that changes the outputs,
+                such as tool versions and options. Must be JSON
+                serializable.
+        """
+        self.manifest_path = Path(
+            manifest_dir, '%s.json' % step_name.replace(':', '__')
+        )
+        self.step_name = step_name
+        self.inputs = [Path(p) for p in inputs]
+        self.outputs = [Path(p) for p in outputs]
+        self.parameters = parameters
+
+    def _fingerprint_all(self, paths):
+        fingerprints = {}
+        for path in paths:
+            fingerprints.update(fingerprint(path))
+        return fingerprints
+
+    def load(self):
+        """Return the recorded manifest, or None if it does not exist."""
+        try:
+            with self.manifest_path.open() as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_valid(self):
+        manifest = self.load()
+        if manifest is None or manifest.get('returncode') != 0:
+            return False
+        # JSON has no tuples, normalize the parameters the same way
+        parameters = json.loads(json.dumps(self.parameters))
+        if manifest.get('parameters') != parameters:
+            return False
+        if manifest.get('inputs') != self._fingerprint_all(self.inputs):
+            return False
+        current_outputs = self._fingerprint_all(self.outputs)
+        return bool(current_outputs) and \
+            manifest.get('outputs') == current_outputs
+
+    def invalidate(self):
+        if self.manifest_path.exists():
+            self.manifest_path.unlink()
+
+    def record(self, returncode):
+        """Write the manifest of a finished step."""
+        manifest = {
+            'step': self.step_name,
+            'date_finished': timezone.now().isoformat(),
+            'returncode': returncode,
+            'parameters': self.parameters,
+            'inputs': self._fingerprint_all(self.inputs),
+            'outputs': self._fingerprint_all(self.outputs),
+        }
+        if not self.manifest_path.parent.exists():
+            self.manifest_path.parent.mkdir(parents=True)
+        # Write to a temporary file first so a crash never leaves a
+        # truncated manifest behind
+        tmp_path = self.manifest_path.with_suffix('.json.tmp')
+        with tmp_path.open('w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        tmp_path.rename(self.manifest_path)
+
+    def wrap(self, func):
+        """Make func skip its work when the manifest is still valid."""
+        @wraps(func)
+        def checkpointed_func(*args, **kwargs):
+            if self.is_valid():
+                logger.info(
+                    'Skip step %s, its outputs are up to date'
+                    % self.step_name
+                )
+                return 0
+            self.invalidate()
+            returncode = func(*args, **kwargs)
+            if not returncode:
+                self.record(returncode)
+            return returncode
+        return checkpointed_func
@@ -0,0 +1,235 @@
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import logging
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import StageStatus
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineStep:
+    def __init__(
+        self, name, func, requires=(), stage=None, cores=1, memory=0,
+        progress=None,
+    ):
+        """A single unit of work in a pipeline dependency graph.
+
+        Args:
+            name (str): Unique name of the step. Ex. ``star:sample_A``.
+
+            func (callable):
+                Function called without arguments to run the step.
+                It returns the exit code, 0 means success.
+
+            requires (iterable of str): Names of the steps this step
+                depends on. The step only runs after all of them succeed.
+
+            stage (str): Name of the stage this step belongs to.
+                Ex. ``stage_alignment``.
+
+            cores (int): Number of CPU cores the step uses.
+
+            memory (int): Memory in bytes the step uses at its peak.
+
+            progress (callable): Called without arguments while the step
+                runs to report how far it is. It returns a
+                :class:`analyses.progress.StepProgress`, or None if the
+                progress is unknown yet.
+        """
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.stage = stage
+        self.cores = cores
+        self.memory = memory
+        self.progress = progress
+        self.status = StageStatus.WAITING
+        # Set once the step starts running
+        self.date_started = None
+
+    def __repr__(self):
+        return "<{cls_name:s}: {name:s} ({status:s})>".format(
+            cls_name=self.__class__.__name__,
+            name=self.name,
+            status=self.status.name,
+        )
+
+
+class StepGraph:
+    def __init__(self):
+        """Directed acyclic graph of pipeline steps.
+
+        Steps whose requirements are all satisfied run concurrently in a
+        thread pool. A failed step marks all its descendants as skipped,
+        while independent branches keep running.
+
+        To run a two-sample alignment followed by a merge::
+
+            graph = StepGraph()
+            graph.add_step('align:A', align_a, stage='stage_alignment')
+            graph.add_step('align:B', align_b, stage='stage_alignment')
+            graph.add_step(
+                'merge', merge, requires=['align:A', 'align:B'],
+                stage='stage_merge',
+            )
+            graph.run(get_pipeline_budget())
+        """
+        self.steps = OrderedDict()
+
+    def add_step(
+        self, name, func, requires=(), stage=None, cores=1, memory=0,
+        progress=None,
+    ):
+        """Add a new step into the graph.
+
+        See :class:`PipelineStep` for the arguments.
+
+        Returns:
+            PipelineStep: the step added.
+        """
+        if name in self.steps:
+            raise ValueError("Step %s already exists in this graph" % name)
+        for required_name in requires:
+            if required_name not in self.steps:
+                raise ValueError(
+                    "Step {name:s} requires an unknown step {required:s}. "
+                    "Steps must be added after their requirements."
+                    .format(name=name, required=required_name)
+                )
+        step = PipelineStep(
+            name, func, requires=requires, stage=stage,
+            cores=cores, memory=memory, progress=progress,
+        )
+        self.steps[name] = step
+        return step
+
+    def steps_of_stage(self, stage):
+        return [step for step in self.steps.values() if step.stage == stage]
+
+    def stage_status(self, stage):
+        """Summarize the status of a stage from the status of its steps."""
+        statuses = set(step.status for step in self.steps_of_stage(stage))
+        if not statuses or statuses == {StageStatus.SKIPED}:
+            return StageStatus.SKIPED
+        if StageStatus.RUNNING in statuses:
+            return StageStatus.RUNNING
+        if StageStatus.WAITING in statuses:
+            if statuses == {StageStatus.WAITING}:
+                return StageStatus.WAITING
+            return StageStatus.RUNNING
+        if statuses == {StageStatus.SUCCESSFUL}:
+            return StageStatus.SUCCESSFUL
+        # Some steps failed or were skipped due to failed requirements
+        return StageStatus.FAILED
+
+    def _ready_steps(self):
+        """Return steps ready to run, skipping those that never can."""
+        ready = []
+        for step in self.steps.values():
+            if step.status is not StageStatus.WAITING:
+                continue
+            required_statuses = [
+                self.steps[name].status for name in step.requires
+            ]
+            if any(
+                status in (StageStatus.FAILED, StageStatus.SKIPED)
+                for status in required_statuses
+            ):
+                logger.info(
+                    'Skip step %s since its requirements are not met'
+                    % step.name
+                )
+                # Steps are stored in topological order, so the descendants
+                # of this step are checked later in the same loop
+                step.status = StageStatus.SKIPED
+                continue
+            if all(
+                status is StageStatus.SUCCESSFUL
+                for status in required_statuses
+            ):
+                ready.append(step)
+        return ready
+
+    def _run_step(self, step):
+        try:
+            return step.func()
+        except Exception:
+            logger.exception('Step %s raised an exception' % step.name)
+            return -1
+        finally:
+            # Steps may use the database, whose connections are per thread
+            connection.close()
+
+    def run(self, budget, on_stage_update=None, poll_interval=5):
+        """Run all steps of the graph.
+
+        A ready step starts only when the budget has enough cores and
+        memory left for it, so steps of other graphs sharing the same
+        budget are taken into account.
+
+        Args:
+            budget (analyses.resources.ResourceBudget):
+                Cores and memory available to the steps.
+            on_stage_update (callable): Called with ``(stage, status)``
+                whenever the summarized status of a stage changes.
+            poll_interval (float): Seconds between re-checking the budget
+                when a ready step waits for resources.
+
+        Returns:
+            bool: Whether all steps succeeded.
+        """
+        stage_statuses = {}
+
+        def notify_stages():
+            if on_stage_update is None:
+                return
+            for stage in set(step.stage for step in self.steps.values()):
+                if stage is None:
+                    continue
+                status = self.stage_status(stage)
+                if stage_statuses.get(stage) is not status:
+                    stage_statuses[stage] = status
+                    on_stage_update(stage, status)
+
+        running = {}
+        with ThreadPoolExecutor(max_workers=budget.cores) as executor:
+            while True:
+                pending = []
+                for step in self._ready_steps():
+                    if not budget.try_acquire(step.cores, step.memory):
+                        pending.append(step)
+                        continue
+                    step.status = StageStatus.RUNNING
+                    step.date_started = timezone.now()
+                    running[executor.submit(self._run_step, step)] = step
+                notify_stages()
+                if not running:
+                    if not pending:
+                        break
+                    # Resources are held by other pipelines
+                    budget.wait_for_release(poll_interval)
+                    continue
+                done, _ = wait(
+                    running,
+                    timeout=poll_interval if pending else None,
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    step = running.pop(future)
+                    budget.release(step.cores, step.memory)
+                    returncode = future.result()
+                    if returncode:
+                        logger.warning(
+                            'Step %s failed with exit code %s'
+                            % (step.name, returncode)
+                        )
+                        step.status = StageStatus.FAILED
+                    else:
+                        step.status = StageStatus.SUCCESSFUL
+        return all(
+            step.status is StageStatus.SUCCESSFUL
+            for step in self.steps.values()
+        )
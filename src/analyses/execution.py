@@ -0,0 +1,98 @@
+from collections import namedtuple
+import logging
+import os
+from pathlib import Path
+import subprocess as sp
+import time
+
+logger = logging.getLogger(__name__)
+
+# Linux reports the block I/O of rusage in 512-byte units
+RUSAGE_BLOCK_SIZE = 512
+
+CommandResult = namedtuple('CommandResult', [
+    'args', 'returncode',
+    'wall_time', 'user_time', 'sys_time', 'max_rss',
+    'bytes_read', 'bytes_written',
+])
+CommandResult.__doc__ = """Outcome and resource usage of a finished command.
+
+Times are in seconds, max_rss and the I/O counters in bytes.
+"""
+
+
+def exit_code_from_status(status):
+    """Convert a wait status into a Popen-like return code."""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def run_command(args, cwd, log_dir, log_name, env=None):
+    """Run a command without touching the state of the current process.
+
+    Unlike changing the working directory by ``os.chdir``, the working
+    directory and the environment only apply to the command itself, so
+    commands can safely run from multiple threads at the same time.
+
+    The stdout and stderr of the command are written to
+    ``<log_dir>/<log_name>.out`` and ``<log_dir>/<log_name>.err``. The
+    logs of a previous run, such as before an analysis is resumed, are
+    moved aside to ``.out.1`` and ``.err.1``, so the progress of the step
+    is never read from them.
+
+    Args:
+        args (list of str): The command and its arguments.
+        cwd (pathlib.Path): Working directory of the command.
+        log_dir (pathlib.Path): Folder of the log files.
+        log_name (str): Name of the log files, usually the step name.
+        env (dict): Environment variables of the command. Inherit those of
+            the current process if not given.
+
+    Returns:
+        CommandResult: return code and resource usage of the command.
+    """
+    args = [str(arg) for arg in args]
+    log_dir = Path(log_dir)
+    if not log_dir.exists():
+        log_dir.mkdir(parents=True, exist_ok=True)
+    out_path = log_dir.joinpath('%s.out' % log_name)
+    err_path = log_dir.joinpath('%s.err' % log_name)
+    for log_path in (out_path, err_path):
+        if log_path.exists():
+            os.replace(str(log_path), '%s.1' % log_path)
+
+    logger.info('Run command: %s' % ' '.join(args))
+    with out_path.open('wb') as out, err_path.open('wb') as err:
+        start_time = time.monotonic()
+        p = sp.Popen(
+            args, cwd=str(cwd), env=env,
+            stdin=sp.DEVNULL, stdout=out, stderr=err,
+        )
+        # Wait the child directly to get its own resource usage, which
+        # is not mixed with other commands running in other threads
+        _, status, rusage = os.wait4(p.pid, 0)
+        wall_time = time.monotonic() - start_time
+    p.returncode = exit_code_from_status(status)
+
+    result = CommandResult(
+        args=args,
+        returncode=p.returncode,
+        wall_time=wall_time,
+        user_time=rusage.ru_utime,
+        sys_time=rusage.ru_stime,
+        max_rss=rusage.ru_maxrss * 1024,  # ru_maxrss is in KB on Linux
+        bytes_read=rusage.ru_inblock * RUSAGE_BLOCK_SIZE,
+        bytes_written=rusage.ru_oublock * RUSAGE_BLOCK_SIZE,
+    )
+    logger.info(
+        '{log_name:s} exited with {returncode:d} in {wall_time:.1f}s '
+        '(user {user_time:.1f}s, sys {sys_time:.1f}s, '
+        'max RSS {max_rss_mb:.0f} MB)'
+        .format(
+            log_name=log_name,
+            max_rss_mb=result.max_rss / 2**20,
+            **result._asdict()
+        )
+    )
+    return result
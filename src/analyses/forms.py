@@ -43,8 +43,11 @@ class AbstractAnalysisCreateForm(
         super().__init__(*args, **kwargs)
         self._current_user_experiments = Experiment.objects.filter(
             owner__exact=self._request.user
-        )
+        ).with_summary()
         self.fields['experiment'].queryset = self._current_user_experiments
+        # Shown to the user once the analysis is created, see
+        # AbstractAnalysisFormView.form_valid
+        self.warnings = []
 
     def check_choice_exists(self):
         if not self.is_bound:
@@ -0,0 +1,132 @@
+"""List the analyses of a user across all pipelines, one page at a time.
+
+Analyses are ordered from the newest, by their creation date, then their
+pipeline and pk so the order is total. Pages are fetched by keyset
+pagination: a page starts after the last analysis of the previous one,
+given as a cursor, so fetching a page costs the same however many
+analyses the user has. Each pipeline model is queried for one page
+with the related objects shown in the list, then the pages are merged.
+"""
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+from django.db.models import Case, Count, IntegerField, Q, When
+from django.utils import timezone
+
+from .models import ExecutionStatus
+from .pipelines import AVAILABLE_PIPELINE_MODELS
+
+PAGE_SIZE = 50
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+AnalysisPage = namedtuple('AnalysisPage', ['analyses', 'next_cursor'])
+AnalysisPage.__doc__ = """A page of the analyses of a user.
+
+next_cursor is the cursor of the following page, or None on the last page.
+"""
+
+
+class InvalidCursor(ValueError):
+    """The cursor of a page cannot be decoded."""
+
+
+def sort_key(analysis):
+    """Return the key analyses are sorted by, in descending order."""
+    return (
+        analysis.date_created, analysis._meta.model_name, analysis.pk,
+    )
+
+
+def encode_cursor(analysis):
+    date_created, model_name, pk = sort_key(analysis)
+    microseconds = (date_created - EPOCH) // timedelta(microseconds=1)
+    return '%d.%s.%d' % (microseconds, model_name, pk)
+
+
+def decode_cursor(cursor):
+    """Return the sort key of the analysis a cursor refers to.
+
+    Raises:
+        InvalidCursor: The cursor is malformed.
+    """
+    try:
+        microseconds, model_name, pk = cursor.split('.')
+        date_created = EPOCH + timedelta(microseconds=int(microseconds))
+        return date_created, model_name, int(pk)
+    except (OverflowError, ValueError):
+        raise InvalidCursor('Invalid cursor %s' % cursor)
+
+
+def after_cursor(model, cursor_key):
+    """Return the condition of the analyses of a model after a cursor."""
+    date_created, model_name, pk = cursor_key
+    before = Q(date_created__lt=date_created)
+    if model._meta.model_name < model_name:
+        return before | Q(date_created=date_created)
+    if model._meta.model_name == model_name:
+        return before | Q(date_created=date_created, pk__lt=pk)
+    return before
+
+
+def analysis_page(owner, status=None, cursor=None, page_size=PAGE_SIZE):
+    """Return a page of the analyses of a user across all pipelines.
+
+    Args:
+        owner: User owning the analyses.
+        status (ExecutionStatus): Only list the analyses of this status.
+        cursor (str): Cursor of the page, None for the first page.
+        page_size (int): Maximal number of analyses in a page.
+
+    Returns:
+        AnalysisPage: the analyses, with their owner, experiment, genome
+        reference and report fetched.
+
+    Raises:
+        InvalidCursor: The cursor is malformed.
+    """
+    cursor_key = None if cursor is None else decode_cursor(cursor)
+    merged = []
+    for model in AVAILABLE_PIPELINE_MODELS:
+        analyses = (
+            model.objects
+            .filter(owner=owner)
+            .select_related(
+                'owner', 'experiment', 'genome_reference', 'report',
+            )
+        )
+        if status is not None:
+            analyses = analyses.filter(execution_status=status.name)
+        if cursor_key is not None:
+            analyses = analyses.filter(after_cursor(model, cursor_key))
+        merged.extend(
+            analyses.order_by('-date_created', '-pk')[:page_size + 1]
+        )
+    merged.sort(key=sort_key, reverse=True)
+    analyses = merged[:page_size]
+    next_cursor = None
+    if len(merged) > page_size:
+        next_cursor = encode_cursor(analyses[-1])
+    return AnalysisPage(analyses, next_cursor)
+
+
+def status_counts(owner):
+    """Count the analyses of a user by execution status.
+
+    The counts of each pipeline model are computed by one aggregate query.
+
+    Returns:
+        OrderedDict: ExecutionStatus to number of analyses, for all status.
+    """
+    counts = OrderedDict((status, 0) for status in ExecutionStatus)
+    for model in AVAILABLE_PIPELINE_MODELS:
+        totals = model.objects.filter(owner=owner).aggregate(**{
+            status.name: Count(Case(
+                When(execution_status=status.name, then=1),
+                output_field=IntegerField(),
+            ))
+            for status in ExecutionStatus
+        })
+        for status in ExecutionStatus:
+            counts[status] += totals[status.name]
+    return counts
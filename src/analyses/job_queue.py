@@ -0,0 +1,316 @@
+"""Priority-aware and fair-share queue of analyses on top of Django-Q.
+
+Analyses are not sent to Django-Q directly. Instead, :func:`submit` records
+an :class:`~analyses.models.AnalysisTicket` and :func:`dispatch` sends the
+queued tickets to the Django-Q workers when
+
+1. a worker is free, and
+2. the cores, memory and disk space requested by the analysis fit into
+   what is left on the node, and
+3. the owner has fewer running analyses than
+   ``BIOCLOUD_QUEUE_MAX_RUNNING_PER_USER``.
+
+Among the queued tickets, those of higher priority go first. Within the
+same priority, tickets of users with fewer running analyses go first, so
+a user submitting many analyses at once does not block everyone else.
+A ticket requesting more disk space than is free on the node, even before
+the reservations of the running analyses, is cancelled and its analysis
+failed instead of blocking the queue.
+
+Dispatching happens on every submission and every time an analysis ends.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+import logging
+import shutil
+
+from django.apps import apps
+from django.conf import settings
+from django.core.signing import BadSignature
+from django.db import transaction
+from django.utils import timezone
+from django_q.models import OrmQ, Task
+from django_q.signing import SignedPackage
+from django_q.tasks import async
+
+from .models import AnalysisTicket, ExecutionStatus, TicketStatus
+from .resources import GB
+
+logger = logging.getLogger(__name__)
+
+
+def submit(
+    analysis, task, task_kwargs, cores, memory, priority=0, disk=0,
+):
+    """Put an analysis into the queue.
+
+    Args:
+        analysis (AbstractAnalysisModel): The analysis to run.
+        task (str): Dotted path to the task function running the analysis.
+        task_kwargs (dict): Keyword arguments of the task function. Must be
+            JSON serializable.
+        cores (int): CPU cores the analysis needs.
+        memory (int): Memory in bytes the analysis needs at its peak.
+        priority (int): Higher priority tickets are dispatched first.
+        disk (int): Disk space in bytes the results of the analysis take.
+
+    Returns:
+        AnalysisTicket: The ticket of the analysis.
+    """
+    ticket = AnalysisTicket.objects.create(
+        owner=analysis.owner,
+        pipeline=analysis._meta.label_lower,
+        analysis_pk=analysis.pk,
+        task=task,
+        task_kwargs=task_kwargs,
+        cores=min(cores, settings.BIOCLOUD_PIPELINE_CORES),
+        memory=min(memory, settings.BIOCLOUD_PIPELINE_MEMORY_GB * GB),
+        disk=disk,
+        priority=priority,
+    )
+    dispatch()
+    return ticket
+
+
+def ticket_group(ticket):
+    return 'analysis-ticket-%d' % ticket.pk
+
+
+def queued_task_groups():
+    """Return the groups of the tasks waiting in or taken from Django-Q.
+
+    With the ORM broker, a task stays in the queue table until a worker
+    has finished it.
+    """
+    groups = set()
+    for orm_q in OrmQ.objects.filter(key=settings.Q_CLUSTER['name']):
+        try:
+            groups.add(SignedPackage.loads(orm_q.payload).get('group'))
+        except (BadSignature, TypeError, ValueError):
+            continue
+    return groups
+
+
+def ticket_analyses(tickets):
+    """Return the analyses of tickets by ticket pk, None if deleted."""
+    pks_by_pipeline = defaultdict(list)
+    for ticket in tickets:
+        pks_by_pipeline[ticket.pipeline].append(ticket.analysis_pk)
+    analyses = {
+        pipeline: apps.get_model(pipeline).objects.in_bulk(pks)
+        for pipeline, pks in pks_by_pipeline.items()
+    }
+    return {
+        ticket.pk: analyses[ticket.pipeline].get(ticket.analysis_pk)
+        for ticket in tickets
+    }
+
+
+def reap_finished_tickets(now=None):
+    """Release the tickets whose analysis is not running anymore.
+
+    Normally the task hook finishes the ticket, but the hook does not run
+    when it fails itself or when the cluster stops before calling it. A
+    dispatched ticket is finished when
+
+    - its analysis has ended or has been deleted, or
+    - Django-Q recorded its task as done, for instance as failed when the
+      task raised or timed out, or
+    - its task is neither recorded nor in the Django-Q queue
+      ``BIOCLOUD_QUEUE_LOST_TASK_MINUTES`` after the dispatch, so it was
+      lost.
+
+    The analysis of a task that ended or got lost without ending the
+    analysis is marked as failed. Queued tickets of deleted analyses are
+    cancelled.
+
+    Note that the task of a worker killed in the middle of an analysis
+    stays in the Django-Q queue until Django-Q retries it (``retry`` of
+    ``Q_CLUSTER``), so its ticket is only released after the retry.
+    """
+    if now is None:
+        now = timezone.now()
+    ended_statuses = [
+        ExecutionStatus.SUCCESSFUL.name, ExecutionStatus.FAILED.name,
+    ]
+    tickets = list(AnalysisTicket.objects.filter(status__in=[
+        TicketStatus.QUEUED.name, TicketStatus.DISPATCHED.name,
+    ]))
+    analyses = ticket_analyses(tickets)
+    dispatched = [
+        ticket for ticket in tickets
+        if ticket.status == TicketStatus.DISPATCHED.name
+    ]
+    done_groups = set(
+        Task.objects
+        .filter(group__in=[ticket_group(ticket) for ticket in dispatched])
+        .values_list('group', flat=True)
+    )
+    lost_before = now - timedelta(
+        minutes=settings.BIOCLOUD_QUEUE_LOST_TASK_MINUTES
+    )
+    queued_groups = None
+    for ticket in tickets:
+        analysis = analyses[ticket.pk]
+        if ticket.status == TicketStatus.QUEUED.name:
+            if analysis is None:
+                logger.warning('Cancel ticket %s of a deleted analysis'
+                               % ticket)
+                ticket.status = TicketStatus.CANCELLED.name
+                ticket.save(update_fields=['status'])
+            continue
+        if analysis is None or analysis.execution_status in ended_statuses:
+            finish_ticket(ticket, now)
+            continue
+        group = ticket_group(ticket)
+        if group not in done_groups:
+            if ticket.date_dispatched is None or \
+                    ticket.date_dispatched > lost_before:
+                continue
+            if queued_groups is None:
+                queued_groups = queued_task_groups()
+            if group in queued_groups:
+                continue
+        logger.warning(
+            'The task of ticket %s ended without ending its analysis'
+            % ticket
+        )
+        analysis.execution_status = ExecutionStatus.FAILED.name
+        analysis.date_finished = now
+        analysis.save(update_fields=['execution_status', 'date_finished'])
+        finish_ticket(ticket, now)
+
+
+def fail_ticket(ticket, reason):
+    """Cancel a queued ticket and mark its analysis as failed."""
+    logger.error(reason)
+    now = timezone.now()
+    analysis = ticket_analyses([ticket])[ticket.pk]
+    if analysis is not None:
+        analysis.execution_status = ExecutionStatus.FAILED.name
+        analysis.date_finished = now
+        analysis.save(update_fields=['execution_status', 'date_finished'])
+    ticket.status = TicketStatus.CANCELLED.name
+    ticket.date_finished = now
+    ticket.save(update_fields=['status', 'date_finished'])
+
+
+def finish_ticket(ticket, now=None):
+    ticket.status = TicketStatus.FINISHED.name
+    ticket.date_finished = now or timezone.now()
+    ticket.save(update_fields=['status', 'date_finished'])
+
+
+def _dispatch_order(queued_tickets, running_per_user):
+    """Sort queued tickets by priority, then fair share, then age."""
+    submitted_before = Counter()
+    ordered = []
+    for ticket in queued_tickets:  # already ordered by date_submitted
+        # The n-th queued ticket of a user counts as if the previous n-1
+        # were already running
+        ordered.append((
+            -ticket.priority,
+            running_per_user[ticket.owner_id] +
+            submitted_before[ticket.owner_id],
+            ticket.date_submitted,
+            ticket,
+        ))
+        submitted_before[ticket.owner_id] += 1
+    ordered.sort(key=lambda item: item[:3])
+    return [item[-1] for item in ordered]
+
+
+def dispatch(ticket_pks=None):
+    """Send as many queued tickets as the node can run to the workers.
+
+    Args:
+        ticket_pks (list of int): Only dispatch these queued tickets, all
+            of them if None. They still wait for the resources they need.
+
+    Returns:
+        list of AnalysisTicket: tickets dispatched.
+    """
+    reap_finished_tickets()
+    dispatched = []
+    with transaction.atomic():
+        # Lock all the active tickets, so concurrent dispatches do not
+        # overcommit the node
+        active_tickets = list(
+            AnalysisTicket.objects
+            .select_for_update()
+            .filter(status__in=[
+                TicketStatus.QUEUED.name, TicketStatus.DISPATCHED.name,
+            ])
+            .order_by('date_submitted')
+        )
+        running_tickets = [
+            ticket for ticket in active_tickets
+            if ticket.status == TicketStatus.DISPATCHED.name
+        ]
+        queued_tickets = [
+            ticket for ticket in active_tickets
+            if ticket.status == TicketStatus.QUEUED.name and (
+                ticket_pks is None or ticket.pk in ticket_pks
+            )
+        ]
+        free_slots = settings.Q_CLUSTER['workers'] - len(running_tickets)
+        free_cores = settings.BIOCLOUD_PIPELINE_CORES - sum(
+            ticket.cores for ticket in running_tickets
+        )
+        free_memory = settings.BIOCLOUD_PIPELINE_MEMORY_GB * GB - sum(
+            ticket.memory for ticket in running_tickets
+        )
+        # Running analyses have not written all their results yet, reserve
+        # their whole disk footprint until they finish
+        unreserved_disk = shutil.disk_usage(
+            str(settings.BIOCLOUD_RESULTS_DIR)
+        ).free
+        free_disk = unreserved_disk - sum(
+            ticket.disk for ticket in running_tickets
+        )
+        running_per_user = Counter(
+            ticket.owner_id for ticket in running_tickets
+        )
+        max_running_per_user = settings.BIOCLOUD_QUEUE_MAX_RUNNING_PER_USER
+
+        for ticket in _dispatch_order(queued_tickets, running_per_user):
+            if free_slots <= 0:
+                break
+            if running_per_user[ticket.owner_id] >= max_running_per_user:
+                continue
+            if ticket.disk > unreserved_disk:
+                # It would never fit and block the whole queue
+                fail_ticket(ticket, 'Not enough disk space for ticket %s'
+                            % ticket)
+                continue
+            if (
+                ticket.cores > free_cores or
+                ticket.memory > free_memory or
+                ticket.disk > free_disk
+            ):
+                # Do not let smaller tickets jump ahead, otherwise large
+                # analyses may starve
+                break
+            ticket.status = TicketStatus.DISPATCHED.name
+            ticket.date_dispatched = timezone.now()
+            ticket.save(update_fields=['status', 'date_dispatched'])
+            free_slots -= 1
+            free_cores -= ticket.cores
+            free_memory -= ticket.memory
+            free_disk -= ticket.disk
+            running_per_user[ticket.owner_id] += 1
+            dispatched.append(ticket)
+
+    # Only send the tasks once the tickets are committed, otherwise a fast
+    # worker could finish before the ticket is marked as dispatched
+    for ticket in dispatched:
+        logger.info('Dispatch analysis ticket %s' % ticket)
+        async(
+            ticket.task,
+            hook='analyses.tasks.analysis_ticket_finished',
+            group=ticket_group(ticket),
+            cores=ticket.cores,
+            memory=ticket.memory,
+            **ticket.task_kwargs
+        )
+    return dispatched
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from analyses.retention import sweep
+
+
+class Command(BaseCommand):
+    help = (
+        'Apply the retention policies to the results of finished analyses, '
+        'such as deleting intermediate files. Run it periodically, for '
+        'example daily by cron.'
+    )
+
+    def handle(self, *args, **options):
+        num_archived = sweep()
+        self.stdout.write('Archived %d results' % num_archived)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 09:12
+from __future__ import unicode_literals
+
+from django.conf import settings
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('analyses', '0005_report_is_public'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisTicket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pipeline', models.CharField(help_text='Label of the pipeline model. Ex. rna_seq.rnaseqmodel.', max_length=128)),
+                ('analysis_pk', models.PositiveIntegerField()),
+                ('task', models.CharField(help_text='Dotted path to the task function running the analysis.', max_length=255)),
+                ('task_kwargs', django.contrib.postgres.fields.jsonb.JSONField(blank=True, default=dict)),
+                ('priority', models.IntegerField(default=0, help_text='Tickets of higher priority are dispatched first.')),
+                ('cores', models.PositiveIntegerField(help_text='Number of CPU cores reserved for the analysis.')),
+                ('memory', models.BigIntegerField(help_text='Memory in bytes reserved for the analysis.')),
+                ('status', models.CharField(choices=[('QUEUED', 'Waiting in the queue'), ('DISPATCHED', 'Dispatched to a worker'), ('FINISHED', 'Finished'), ('CANCELLED', 'Cancelled')], db_index=True, default='QUEUED', max_length=32)),
+                ('date_submitted', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='date submitted')),
+                ('date_dispatched', models.DateTimeField(blank=True, default=None, null=True, verbose_name='date dispatched')),
+                ('date_finished', models.DateTimeField(blank=True, default=None, null=True, verbose_name='date finished')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analysis_tickets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'analysis ticket',
+                'verbose_name_plural': 'analysis tickets',
+                'ordering': ('-priority', 'date_submitted'),
+            },
+        ),
+    ]
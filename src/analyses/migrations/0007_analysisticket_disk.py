@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 11:42
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyses', '0006_analysisticket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisticket',
+            name='disk',
+            field=models.BigIntegerField(default=0, help_text='Disk space in bytes the results will take.'),
+        ),
+    ]
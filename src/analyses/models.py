@@ -1,7 +1,10 @@
 from collections import OrderedDict
 from pathlib import Path
 
+from django.apps import apps
 from django.conf import settings
+from django.contrib.postgres.fields import JSONField
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
 from django.core.urlresolvers import reverse
 from django.core.signing import BadSignature
@@ -32,6 +35,13 @@ class StageStatus(ChoiceEnum):
     SKIPED = _("Skiped")
 
 
+class TicketStatus(ChoiceEnum):
+    QUEUED = _("Waiting in the queue")
+    DISPATCHED = _("Dispatched to a worker")
+    FINISHED = _("Finished")
+    CANCELLED = _("Cancelled")
+
+
 class GenomeReference(models.Model):
 
     identifier = models.CharField(
@@ -96,12 +106,26 @@ class GenomeReference(models.Model):
         return Path(settings.BIOCLOUD_REFERENCES_DIR, self.identifier)
 
 
+REPORT_CACHE_KEY = 'analyses:report:{pk}'
+# Seconds a report looked up by its auth key stays in the cache
+REPORT_CACHE_TIMEOUT = 60 * 60
+
+
+def forget_cached_reports(report_pks):
+    """Remove reports from the cache after they or their owner changed."""
+    cache.delete_many([REPORT_CACHE_KEY.format(pk=pk) for pk in report_pks])
+
+
 class ReportQuerySet(models.QuerySet):
 
     def get_with_auth_key(self, auth_key):
         """
         Obtain the report object based on given auth_key
 
+        Every file of a report is requested with its auth key, so the report
+        with its analysis and owner is kept in the cache. See
+        :mod:`analyses.signals` for its invalidation.
+
         Args:
               auth_key (str): authentication string
         """
@@ -112,9 +136,13 @@ class ReportQuerySet(models.QuerySet):
             raise self.model.DoesNotExist
 
         # get the report object
-        report = self.get(pk=report_pk)
-        if not report.is_analysis_attached():
-            raise self.model.DoesNotExist
+        key = REPORT_CACHE_KEY.format(pk=report_pk)
+        report = cache.get(key)
+        if report is None:
+            report = self.select_related('analysis__owner').get(pk=report_pk)
+            if not report.is_analysis_attached():
+                raise self.model.DoesNotExist
+            cache.set(key, report, REPORT_CACHE_TIMEOUT)
 
         # check if auth_number mismatches user's current auth_number
         # auth_email is also checked so other user cannot forget the auth key
@@ -222,6 +250,13 @@ class AbstractAnalysisModel(models.Model):
         editable=False,
     )
 
+    date_started = models.DateTimeField(
+        verbose_name=_('date started'),
+        blank=True, null=True,
+        default=None,
+        editable=False,
+    )
+
     date_finished = models.DateTimeField(
         verbose_name=_('date finished'),
         blank=True, null=True,
@@ -286,6 +321,7 @@ class AbstractAnalysisModel(models.Model):
                 str(ds.full_file_path): {
                     'path': str(ds.full_file_path),
                     'type': ds.file_type,
+                    'checksum': ds.checksum,
                     'strand': strand,
                     'metadata': ds.metadata,
                 }
@@ -307,3 +343,96 @@ class AbstractAnalysisModel(models.Model):
     @property
     def result_dir(self):
         return settings.BIOCLOUD_RESULTS_DIR.joinpath(str(self.pk))
+
+
+class AnalysisTicket(models.Model):
+    """An analysis waiting in or dispatched from the analysis queue.
+
+    See :mod:`analyses.job_queue` for how tickets are dispatched.
+    """
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='analysis_tickets',
+    )
+
+    pipeline = models.CharField(
+        max_length=128,
+        help_text=_(
+            "Label of the pipeline model. Ex. rna_seq.rnaseqmodel."
+        ),
+    )
+
+    analysis_pk = models.PositiveIntegerField()
+
+    task = models.CharField(
+        max_length=255,
+        help_text=_(
+            "Dotted path to the task function running the analysis."
+        ),
+    )
+
+    task_kwargs = JSONField(
+        blank=True,
+        default=dict,
+    )
+
+    priority = models.IntegerField(
+        default=0,
+        help_text=_(
+            "Tickets of higher priority are dispatched first."
+        ),
+    )
+
+    cores = models.PositiveIntegerField(
+        help_text=_("Number of CPU cores reserved for the analysis."),
+    )
+
+    memory = models.BigIntegerField(
+        help_text=_("Memory in bytes reserved for the analysis."),
+    )
+
+    disk = models.BigIntegerField(
+        default=0,
+        help_text=_("Disk space in bytes the results will take."),
+    )
+
+    status = models.CharField(
+        choices=TicketStatus.choices(),
+        max_length=32,
+        default=TicketStatus.QUEUED.name,
+        db_index=True,
+    )
+
+    date_submitted = models.DateTimeField(
+        verbose_name=_('date submitted'),
+        default=timezone.now,
+        editable=False,
+    )
+
+    date_dispatched = models.DateTimeField(
+        verbose_name=_('date dispatched'),
+        blank=True, null=True,
+        default=None,
+    )
+
+    date_finished = models.DateTimeField(
+        verbose_name=_('date finished'),
+        blank=True, null=True,
+        default=None,
+    )
+
+    class Meta:
+        verbose_name = _('analysis ticket')
+        verbose_name_plural = _('analysis tickets')
+        ordering = ('-priority', 'date_submitted')
+
+    def __str__(self):
+        return '{pipeline:s} #{analysis_pk:d} ({status:s})'.format(
+            pipeline=self.pipeline,
+            analysis_pk=self.analysis_pk,
+            status=self.status,
+        )
+
+    def get_analysis(self):
+        return apps.get_model(self.pipeline).objects.get(pk=self.analysis_pk)
@@ -0,0 +1,152 @@
+from collections import namedtuple
+import logging
+import re
+import threading
+
+from django.db import connection
+
+from .models import StageStatus
+
+logger = logging.getLogger(__name__)
+
+StepProgress = namedtuple('StepProgress', ['percent_done', 'throughput'])
+StepProgress.__doc__ = """How far a running step is.
+
+percent_done is between 0 and 100, throughput is in reads per second. Both
+can be None when the tool does not report them.
+"""
+
+PERCENT_PATTERN = re.compile(r'(\d+(?:\.\d+)?)%')
+
+
+def read_tail(path, size=8192):
+    """Return the last size bytes of a text file, or '' if it is missing.
+
+    Tools log their progress by appending lines or by redrawing a progress
+    bar with carriage returns, so the latest progress is always at the end
+    of the file.
+    """
+    try:
+        with path.open('rb') as f:
+            f.seek(0, 2)
+            f.seek(max(0, f.tell() - size))
+            return f.read().decode('utf-8', errors='replace')
+    except OSError:
+        return ''
+
+
+def last_percent(text, pattern=PERCENT_PATTERN):
+    """Return the last percentage matched in text, or None."""
+    matches = pattern.findall(text)
+    if not matches:
+        return None
+    return min(float(matches[-1]), 100.0)
+
+
+def estimate_remaining_seconds(elapsed_seconds, percent_done):
+    """Extrapolate the time left of a step from its progress so far."""
+    if not percent_done or percent_done <= 0:
+        return None
+    if percent_done >= 100:
+        return 0
+    return elapsed_seconds * (100 - percent_done) / percent_done
+
+
+def critical_path_seconds(remaining, requires):
+    """Return the time left before all the steps of a graph end.
+
+    Each step starts once all its requirements end, assuming there are
+    enough resources to run all the ready steps at once.
+
+    Args:
+        remaining (dict): Step name to its seconds left, 0 once it ended.
+        requires (dict): Step name to the names of the steps it requires.
+
+    Returns:
+        float: Seconds left along the longest path of the graph.
+    """
+    end = {}
+
+    def end_of(name):
+        if name not in end:
+            end[name] = remaining.get(name, 0) + max(
+                (end_of(required) for required in requires.get(name, ())),
+                default=0,
+            )
+        return end[name]
+
+    return max((end_of(name) for name in remaining), default=0)
+
+
+class ProgressMonitor:
+    def __init__(self, graph, on_progress, interval=30):
+        """Periodically collect the progress of the running steps.
+
+        A background thread polls the ``progress`` callable of every running
+        step of the graph and reports it by ``on_progress``. Running steps
+        whose progress is unknown are reported as well, so their start is
+        recorded. Steps that succeeded are reported once as 100% done. Use
+        it as a context manager around :meth:`StepGraph.run`::
+
+            with ProgressMonitor(graph, save_progress):
+                graph.run(budget)
+
+        Args:
+            graph (analyses.dag.StepGraph): Graph being run.
+            on_progress (callable): Called with ``(step, StepProgress)``.
+            interval (float): Seconds between two polls.
+        """
+        self.graph = graph
+        self.on_progress = on_progress
+        self.interval = interval
+        self._completed = set()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='progress-monitor', daemon=True,
+        )
+
+    def poll(self):
+        for step in list(self.graph.steps.values()):
+            if step.name in self._completed:
+                continue
+            if step.status is StageStatus.SUCCESSFUL:
+                self._completed.add(step.name)
+                progress = StepProgress(100.0, None)
+            elif step.status is StageStatus.RUNNING:
+                progress = None
+                if step.progress is not None:
+                    try:
+                        progress = step.progress()
+                    except Exception:
+                        logger.exception(
+                            'Cannot read the progress of step %s'
+                            % step.name
+                        )
+                if progress is None:
+                    progress = StepProgress(None, None)
+            else:
+                continue
+            try:
+                self.on_progress(step, progress)
+            except Exception:
+                logger.exception(
+                    'Cannot report the progress of step %s' % step.name
+                )
+
+    def _run(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                self.poll()
+            # Report the steps finished since the last poll
+            self.poll()
+        finally:
+            # Each thread has its own database connection
+            connection.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stopped.set()
+        self._thread.join()
@@ -0,0 +1,124 @@
+from contextlib import contextmanager
+import threading
+
+from django.conf import settings
+
+GB = 2**30
+
+
+class ResourceBudget:
+    def __init__(self, cores, memory):
+        """Pool of CPU cores and memory shared by concurrent pipeline steps.
+
+        A step reserves its cores and memory before it starts and gives
+        them back when it ends, so the total reserved never exceeds the
+        budget of the node.
+
+        Args:
+            cores (int): Total number of CPU cores in the budget.
+            memory (int): Total memory in bytes in the budget.
+        """
+        self.cores = cores
+        self.memory = memory
+        self.used_cores = 0
+        self.used_memory = 0
+        self._condition = threading.Condition()
+
+    def _clamp(self, cores, memory):
+        # A request larger than the whole budget could never be admitted,
+        # so it is granted the whole budget instead
+        return min(cores, self.cores), min(memory, self.memory)
+
+    def try_acquire(self, cores, memory):
+        """Reserve resources if they are available now.
+
+        Returns:
+            bool: Whether the resources have been reserved.
+        """
+        cores, memory = self._clamp(cores, memory)
+        with self._condition:
+            if (
+                self.used_cores + cores > self.cores or
+                self.used_memory + memory > self.memory
+            ):
+                return False
+            self.used_cores += cores
+            self.used_memory += memory
+            return True
+
+    def release(self, cores, memory):
+        cores, memory = self._clamp(cores, memory)
+        with self._condition:
+            self.used_cores -= cores
+            self.used_memory -= memory
+            self._condition.notify_all()
+
+    def wait_for_release(self, timeout=None):
+        """Block until some resources are released or timeout."""
+        with self._condition:
+            self._condition.wait(timeout)
+
+    @contextmanager
+    def reserved(self, cores, memory):
+        """Hold resources while the block runs.
+
+        It waits until the resources are available. Use it for what the
+        steps share instead of reserving it in each step, such as a genome
+        index in shared memory.
+        """
+        with self._condition:
+            while not self.try_acquire(cores, memory):
+                self._condition.wait()
+        try:
+            yield
+        finally:
+            self.release(cores, memory)
+
+    def split(self, num_jobs, memory_per_job, max_threads=None):
+        """Size the jobs so that running them at once fills the budget.
+
+        Args:
+            num_jobs (int): Number of jobs waiting to run.
+            memory_per_job (int): Memory in bytes each job requires.
+            max_threads (int): Upper bound of threads per job, if any.
+
+        Returns:
+            (int, int): The number of jobs that can run at once, and the
+            number of threads each of them should use.
+        """
+        concurrent_jobs = max(1, min(
+            num_jobs,
+            self.cores,
+            self.memory // memory_per_job if memory_per_job else num_jobs,
+        ))
+        threads = max(1, self.cores // concurrent_jobs)
+        if max_threads is not None:
+            threads = min(threads, max_threads)
+        return concurrent_jobs, threads
+
+    def __repr__(self):
+        return (
+            '<{cls_name:s}: {used_cores:d}/{cores:d} cores, '
+            '{used_memory:.1f}/{memory:.1f} GB>'
+            .format(
+                cls_name=self.__class__.__name__,
+                used_cores=self.used_cores, cores=self.cores,
+                used_memory=self.used_memory / GB, memory=self.memory / GB,
+            )
+        )
+
+
+_pipeline_budget = None
+_pipeline_budget_lock = threading.Lock()
+
+
+def get_pipeline_budget():
+    """Return the resource budget shared by all pipelines of this process."""
+    global _pipeline_budget
+    with _pipeline_budget_lock:
+        if _pipeline_budget is None:
+            _pipeline_budget = ResourceBudget(
+                cores=settings.BIOCLOUD_PIPELINE_CORES,
+                memory=settings.BIOCLOUD_PIPELINE_MEMORY_GB * GB,
+            )
+    return _pipeline_budget
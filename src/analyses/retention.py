@@ -0,0 +1,204 @@
+"""Remove or shrink the intermediate results of finished analyses.
+
+Each pipeline model lists its :class:`RetentionPolicy` by a
+``retention_policies()`` method. A policy matches result files or folders
+by a glob pattern relative to the result folder, and applies its action
+once the analysis finished some days ago, and optionally only once its
+report has been generated. The first policy matching a path decides, so a
+policy without action keeps the matched paths forever.
+
+Paths removed or replaced are recorded in the archive manifest of the
+result folder, so links to them can tell they are archived instead of
+missing. :func:`sweep` applies the policies of all analyses and is meant
+to run periodically, by the ``sweep_results`` command.
+"""
+from collections import namedtuple
+from datetime import timedelta
+import json
+import logging
+import os
+import shutil
+
+from django.utils import timezone
+
+from . import pipelines
+from .models import ExecutionStatus
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_MANIFEST_NAME = 'archived.json'
+
+RetentionPolicy = namedtuple(
+    'RetentionPolicy', ['name', 'pattern', 'action', 'days', 'after_report'],
+)
+RetentionPolicy.__doc__ = """How long results matching a pattern are kept.
+
+Args:
+    name (str): Short description of the action, such as ``deleted``.
+    pattern (str): Glob pattern relative to the result folder.
+    action (callable): Called with ``(analysis, path)``. It returns the
+        path replacing the given one, or None if it is simply removed.
+        None keeps the matched paths.
+    days (int): Days after the analysis finished before the action.
+    after_report (bool): Wait for the report of the analysis.
+"""
+
+
+class RetentionError(Exception):
+    """The action of a retention policy failed."""
+
+
+class RetentionDeferred(RetentionError):
+    """The action of a retention policy cannot apply to a path yet.
+
+    The path is left untouched and tried again by the next sweep.
+    """
+
+
+def delete_artifact(analysis, path):
+    """Retention action removing a file or a folder tree."""
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(str(path))
+    else:
+        path.unlink()
+    return None
+
+
+def manifest_path(result_dir):
+    return result_dir.joinpath(ARCHIVE_MANIFEST_NAME)
+
+
+def load_manifest(result_dir):
+    """Return the archived paths of a result folder.
+
+    Returns:
+        dict: relative path to a dict with the keys ``action``,
+        ``date_archived`` and ``replaced_by`` (relative path or None).
+    """
+    try:
+        with manifest_path(result_dir).open() as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(result_dir, manifest):
+    pth = manifest_path(result_dir)
+    tmp_pth = pth.with_name(pth.name + '.tmp')
+    with tmp_pth.open('w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(str(tmp_pth), str(pth))
+
+
+def find_archived(result_dir, rel_path):
+    """Return the manifest entry of an archived path, or of its folder.
+
+    Returns:
+        dict: the manifest entry, or None if the path was not archived.
+    """
+    manifest = load_manifest(result_dir)
+    parts = rel_path.strip('/').split('/')
+    for i in range(len(parts), 0, -1):
+        entry = manifest.get('/'.join(parts[:i]))
+        if entry is not None:
+            return entry
+    return None
+
+
+def is_due(analysis, policy, now):
+    if policy.action is None:
+        return False
+    if policy.after_report and not (
+        analysis.report is not None and analysis.report.full_path.exists()
+    ):
+        return False
+    return now >= analysis.date_finished + timedelta(days=policy.days)
+
+
+def sweep_analysis(analysis, now=None):
+    """Apply the retention policies of a finished analysis.
+
+    The manifest is saved after each archived path, so the paths archived
+    before a crash are still recorded.
+
+    Returns:
+        int: Number of paths archived.
+    """
+    if now is None:
+        now = timezone.now()
+    result_dir = analysis.result_dir
+    if not result_dir.is_dir():
+        return 0
+    manifest = load_manifest(result_dir)
+    claimed = set()
+    num_archived = 0
+    for policy in analysis.retention_policies():
+        for path in sorted(result_dir.glob(policy.pattern)):
+            if path in claimed or path.name == ARCHIVE_MANIFEST_NAME:
+                continue
+            claimed.add(path)
+            if not is_due(analysis, policy, now):
+                continue
+            rel_path = path.relative_to(result_dir).as_posix()
+            try:
+                replacement = policy.action(analysis, path)
+            except RetentionDeferred as e:
+                logger.info('Defer retention policy %s of %s: %s'
+                            % (policy.name, path, e))
+                continue
+            except (OSError, RetentionError) as e:
+                logger.error(
+                    'Cannot apply retention policy %s to %s: %s'
+                    % (policy.name, path, e)
+                )
+                continue
+            manifest[rel_path] = {
+                'action': policy.name,
+                'date_archived': now.isoformat(),
+                'replaced_by': (
+                    None if replacement is None
+                    else replacement.relative_to(result_dir).as_posix()
+                ),
+            }
+            save_manifest(result_dir, manifest)
+            num_archived += 1
+    if num_archived:
+        logger.info(
+            'Archived %d results of analysis %s' % (num_archived, analysis.pk)
+        )
+    return num_archived
+
+
+def sweep(now=None):
+    """Apply the retention policies of all finished analyses.
+
+    Failed analyses are left untouched, as they may be resumed.
+
+    Returns:
+        int: Number of paths archived.
+    """
+    # Imported here, users.storage depends on this app
+    from users.models import StorageArea
+    from users.storage import record_path_usage
+
+    num_archived = 0
+    for model in pipelines.AVAILABLE_PIPELINE_MODELS:
+        if not hasattr(model, 'retention_policies'):
+            continue
+        analyses = (
+            model.objects
+            .filter(
+                execution_status=ExecutionStatus.SUCCESSFUL.name,
+                date_finished__isnull=False,
+            )
+            .select_related('owner', 'report')
+        )
+        for analysis in analyses:
+            archived = sweep_analysis(analysis, now)
+            if archived:
+                record_path_usage(
+                    analysis.owner, StorageArea.RESULTS, analysis.pk,
+                    analysis.result_dir,
+                )
+            num_archived += archived
+    return num_archived
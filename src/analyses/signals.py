@@ -0,0 +1,47 @@
+"""Remove reports from the cache once they can be accessed differently.
+
+A report looked up by its auth key is cached with its analysis and owner,
+see :meth:`~analyses.models.ReportQuerySet.get_with_auth_key`. It is
+removed when the report is changed or deleted, when its analysis is
+deleted, and when its owner changes, as the auth key depends on the email
+and auth number of the owner.
+
+The storage taken by deleted analyses and reports is removed from the
+storage ledger of their owner as well, see :mod:`users.storage`.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import StorageArea
+from users.storage import forget_deleted_item
+from .models import AbstractAnalysisModel, Report, forget_cached_reports
+
+
+@receiver([post_save, post_delete], sender=Report)
+def report_changed(sender, instance, **kwargs):
+    forget_cached_reports([instance.pk])
+
+
+@receiver(post_delete, sender=Report)
+def report_deleted(sender, instance, **kwargs):
+    forget_deleted_item(StorageArea.REPORTS, instance.pk)
+
+
+@receiver(post_delete)
+def analysis_deleted(sender, instance, **kwargs):
+    if not isinstance(instance, AbstractAnalysisModel):
+        return
+    forget_deleted_item(StorageArea.RESULTS, instance.pk)
+    if instance.report_id is not None:
+        forget_cached_reports([instance.report_id])
+
+
+@receiver(post_save, sender=get_user_model())
+def owner_saved(sender, instance, created, **kwargs):
+    if not created:
+        forget_cached_reports(
+            Report.objects
+            .filter(analysis__owner=instance)
+            .values_list('pk', flat=True)
+        )
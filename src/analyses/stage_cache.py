@@ -0,0 +1,233 @@
+import errno
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import threading
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+ENTRY_META_NAME = '.cache_entry.json'
+
+
+def link_tree(src_dir, dest_dir):
+    """Recreate the files of src_dir under dest_dir by hardlinks.
+
+    Files are copied instead when the two folders are on different file
+    systems.
+    """
+    src_dir, dest_dir = Path(src_dir), Path(dest_dir)
+    for src_root, dir_names, file_names in os.walk(str(src_dir)):
+        rel_root = Path(src_root).relative_to(src_dir)
+        dest_root = dest_dir.joinpath(rel_root)
+        if not dest_root.exists():
+            dest_root.mkdir(parents=True)
+        for file_name in file_names:
+            if file_name == ENTRY_META_NAME:
+                continue
+            src_file = os.path.join(src_root, file_name)
+            dest_file = str(dest_root.joinpath(file_name))
+            if os.path.lexists(dest_file):
+                os.unlink(dest_file)
+            try:
+                os.link(src_file, dest_file)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+                shutil.copy2(src_file, dest_file)
+
+
+def clear_dir(path):
+    """Remove everything inside a folder, if it exists.
+
+    Outputs fetched from the cache are hardlinks of the cache entry, so a
+    step must never rewrite them in place.
+    """
+    path = Path(path)
+    if not path.is_dir():
+        return
+    for child in path.iterdir():
+        if child.is_dir() and not child.is_symlink():
+            shutil.rmtree(str(child))
+        else:
+            child.unlink()
+
+
+def tree_size(path):
+    """Return the bytes the files of a folder tree take.
+
+    Files hardlinked more than once within the tree are counted once.
+    Files hardlinked from the stage cache or from other analyses are still
+    counted in full, as each tree keeps them alive on its own.
+    """
+    total = 0
+    seen_inodes = set()
+    for root, dir_names, file_names in os.walk(str(path)):
+        for file_name in file_names:
+            stat = os.lstat(os.path.join(root, file_name))
+            if stat.st_nlink > 1:
+                inode = (stat.st_dev, stat.st_ino)
+                if inode in seen_inodes:
+                    continue
+                seen_inodes.add(inode)
+            total += stat.st_size
+    return total
+
+
+class StageOutputCache:
+    def __init__(self, root, max_bytes):
+        """Content-addressed store of pipeline step outputs.
+
+        Each entry is the output folder of a step, keyed by the hash of
+        everything that determines the outputs: the tool version, its
+        parameters and the checksums of its inputs. Analyses running the
+        same step over the same inputs hardlink the cached outputs instead
+        of computing them again.
+
+        When the store grows over ``max_bytes``, the least recently used
+        entries are evicted. Since outputs are hardlinked, evicting an
+        entry never removes the files of the analyses using it.
+
+        Args:
+            root (pathlib.Path): Folder of the store. It should be on the
+                same file system as the results so hardlinks can be made.
+            max_bytes (int): Maximal total size of the store.
+        """
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(tool, parameters, input_checksums):
+        """Compute the key of a step.
+
+        Args:
+            tool (str): Tool and its version. Ex. ``STAR_2.5.0``.
+            parameters (dict): Options changing the outputs. Must be JSON
+                serializable.
+            input_checksums (list of str): Checksum of every input, or the
+                key of the step producing it.
+
+        Returns:
+            str: hexadecimal SHA256 digest
+        """
+        content = json.dumps(
+            [tool, parameters, list(input_checksums)], sort_keys=True,
+        )
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def entry_dir(self, key):
+        return self.root.joinpath(key[:2], key)
+
+    def fetch(self, key, dest_dir):
+        """Hardlink the cached outputs of key into dest_dir.
+
+        Returns:
+            bool: Whether the outputs were found in the cache.
+        """
+        entry_dir = self.entry_dir(key)
+        meta_path = entry_dir.joinpath(ENTRY_META_NAME)
+        if not meta_path.exists():
+            return False
+        try:
+            link_tree(entry_dir, dest_dir)
+            # Mark the entry as recently used
+            os.utime(str(meta_path))
+        except OSError:
+            # The entry was evicted while linking
+            logger.warning(
+                'Cache entry %s disappeared while being fetched' % key
+            )
+            return False
+        logger.info('Reuse cached outputs %s at %s' % (key, dest_dir))
+        return True
+
+    def store(self, key, src_dir):
+        """Add the outputs in src_dir into the cache under key."""
+        entry_dir = self.entry_dir(key)
+        if entry_dir.exists():
+            return
+        # Build the entry aside and move it in place at once, so readers
+        # never see a partial entry
+        tmp_dir = self.root.joinpath(
+            'tmp', '%s.%s' % (key, uuid.uuid4().hex)
+        )
+        try:
+            link_tree(src_dir, tmp_dir)
+            with tmp_dir.joinpath(ENTRY_META_NAME).open('w') as f:
+                json.dump({'key': key, 'size': tree_size(tmp_dir)}, f)
+            if not entry_dir.parent.exists():
+                entry_dir.parent.mkdir(parents=True, exist_ok=True)
+            tmp_dir.rename(entry_dir)
+        except OSError:
+            # Another process stored the same entry first
+            logger.info('Cache entry %s is already stored' % key)
+            shutil.rmtree(str(tmp_dir), ignore_errors=True)
+            return
+        self.evict()
+
+    def entries(self):
+        """Yield (last used timestamp, size, entry folder) of every entry."""
+        for meta_path in self.root.glob('??/*/%s' % ENTRY_META_NAME):
+            try:
+                with meta_path.open() as f:
+                    size = json.load(f)['size']
+                last_used = meta_path.stat().st_mtime
+            except (OSError, ValueError, KeyError):
+                continue
+            yield last_used, size, meta_path.parent
+
+    def evict(self):
+        """Remove the least recently used entries until under max_bytes."""
+        with self._evict_lock:
+            entries = sorted(self.entries(), key=lambda entry: entry[0])
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, entry_dir in entries:
+                if total_size <= self.max_bytes:
+                    break
+                logger.info('Evict cache entry %s' % entry_dir.name)
+                shutil.rmtree(str(entry_dir), ignore_errors=True)
+                total_size -= size
+
+    def wrap(self, func, key, output_dir):
+        """Make func reuse the cached outputs of key when available.
+
+        The step runs in an emptied output_dir, since it may hold the
+        outputs of a previous run hardlinked from another cache entry.
+
+        Args:
+            func (callable): Step function returning its exit code.
+            key (str): Cache key of the step, or None if not cacheable.
+            output_dir (pathlib.Path): Folder the step writes into. Only
+                the step writes into it.
+        """
+        def cached_func(*args, **kwargs):
+            if key is not None and self.fetch(key, output_dir):
+                return 0
+            clear_dir(output_dir)
+            returncode = func(*args, **kwargs)
+            if key is not None and not returncode:
+                self.store(key, output_dir)
+            return returncode
+        return cached_func
+
+
+_stage_cache = None
+
+
+def get_stage_cache():
+    """Return the shared stage output cache, or None if it is disabled."""
+    global _stage_cache
+    if settings.BIOCLOUD_STAGE_CACHE_DIR is None:
+        return None
+    if _stage_cache is None:
+        _stage_cache = StageOutputCache(
+            settings.BIOCLOUD_STAGE_CACHE_DIR,
+            settings.BIOCLOUD_STAGE_CACHE_MAX_GB * 2**30,
+        )
+    return _stage_cache
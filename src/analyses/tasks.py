@@ -1,20 +1,14 @@
-from contextlib import contextmanager
-import os
+from .job_queue import dispatch, finish_ticket
+from .models import AnalysisTicket, TicketStatus
 
 
-@contextmanager
-def cd(newdir: str):
-    """
-    Context manager for changing working directory.
-
-    Ref: http://stackoverflow.com/a/24176022
+def analysis_ticket_finished(task):
+    """Django-Q hook called when the task of an analysis ticket ends.
 
-    Args:
-        newdir (str): path to new working directory
+    Release the resources of the ticket and dispatch the next ones.
     """
-    prevdir = os.getcwd()
-    os.chdir(newdir)
-    try:
-        yield
-    finally:
-        os.chdir(prevdir)
+    ticket_pk = int(task.group.rsplit('-', 1)[1])
+    ticket = AnalysisTicket.objects.get(pk=ticket_pk)
+    if ticket.status == TicketStatus.DISPATCHED.name:
+        finish_ticket(ticket)
+    dispatch()
@@ -1,3 +1,617 @@
-from django.test import TestCase
+from collections import Counter
+from datetime import datetime, timedelta
+import io
+import os
+from pathlib import Path
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+import zipfile
 
-# Create your tests here.
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from .bundles import (
+    ZIP64_LIMIT, ZIP_VERSION, BundleError, collect_files, dos_datetime,
+    mod_zip_file_list, stream_tar, stream_zip, _central_dir_header,
+    _end_of_central_dir,
+)
+from .checkpoints import StepCheckpoint
+from .dag import StepGraph
+from .execution import run_command
+from .index import (
+    InvalidCursor, after_cursor, decode_cursor, encode_cursor, sort_key,
+)
+from .job_queue import _dispatch_order
+from .progress import (
+    critical_path_seconds, estimate_remaining_seconds, last_percent,
+)
+from .models import StageStatus
+from .resources import GB, ResourceBudget
+from .stage_cache import ENTRY_META_NAME, StageOutputCache, tree_size
+
+
+class StepGraphTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.graph = StepGraph()
+        self.order = []
+        self.lock = threading.Lock()
+
+    def step(self, name, returncode=0):
+        def func():
+            with self.lock:
+                self.order.append(name)
+            return returncode
+        return func
+
+    def run_graph(self, cores=4, memory=4 * GB):
+        return self.graph.run(
+            ResourceBudget(cores, memory), poll_interval=0.01,
+        )
+
+    def test_steps_run_after_requirements(self):
+        self.graph.add_step('align:A', self.step('align:A'))
+        self.graph.add_step('align:B', self.step('align:B'))
+        self.graph.add_step(
+            'merge', self.step('merge'), requires=['align:A', 'align:B'],
+        )
+        self.graph.add_step('diff', self.step('diff'), requires=['merge'])
+        self.assertTrue(self.run_graph())
+        self.assertEqual(self.order[2:], ['merge', 'diff'])
+        self.assertEqual(set(self.order[:2]), {'align:A', 'align:B'})
+        for step in self.graph.steps.values():
+            self.assertIs(step.status, StageStatus.SUCCESSFUL)
+            self.assertIsNotNone(step.date_started)
+
+    def test_failed_step_skips_its_descendants_only(self):
+        self.graph.add_step('align:A', self.step('align:A', returncode=1))
+        self.graph.add_step('align:B', self.step('align:B'))
+        self.graph.add_step(
+            'cufflinks:A', self.step('cufflinks:A'), requires=['align:A'],
+        )
+        self.graph.add_step(
+            'merge', self.step('merge'), requires=['cufflinks:A'],
+        )
+        self.assertFalse(self.run_graph())
+        statuses = {
+            name: step.status for name, step in self.graph.steps.items()
+        }
+        self.assertEqual(statuses, {
+            'align:A': StageStatus.FAILED,
+            'align:B': StageStatus.SUCCESSFUL,
+            'cufflinks:A': StageStatus.SKIPED,
+            'merge': StageStatus.SKIPED,
+        })
+        self.assertEqual(sorted(self.order), ['align:A', 'align:B'])
+
+    def test_step_raising_fails(self):
+        def broken():
+            raise RuntimeError('broken')
+        self.graph.add_step('broken', broken)
+        with self.assertLogs('analyses.dag', 'ERROR'):
+            self.assertFalse(self.run_graph())
+        self.assertIs(self.graph.steps['broken'].status, StageStatus.FAILED)
+
+    def test_add_step_rejects_unknown_or_duplicate_step(self):
+        self.graph.add_step('a', self.step('a'))
+        with self.assertRaises(ValueError):
+            self.graph.add_step('a', self.step('a'))
+        with self.assertRaises(ValueError):
+            self.graph.add_step('b', self.step('b'), requires=['c'])
+
+    def test_steps_share_the_budget(self):
+        running = []
+        max_running = []
+
+        def func():
+            with self.lock:
+                running.append(1)
+                max_running.append(len(running))
+            time.sleep(0.05)
+            with self.lock:
+                running.pop()
+            return 0
+        for name in 'abc':
+            self.graph.add_step(name, func, cores=2, memory=GB)
+        self.assertTrue(self.run_graph(cores=4, memory=4 * GB))
+        self.assertEqual(max(max_running), 2)
+
+    def test_stage_status(self):
+        self.graph.add_step('a', self.step('a'), stage='stage_qc')
+        self.graph.add_step('b', self.step('b', 1), stage='stage_qc')
+        self.assertIs(self.graph.stage_status('stage_qc'), StageStatus.WAITING)
+        self.assertIs(
+            self.graph.stage_status('stage_other'), StageStatus.SKIPED,
+        )
+        updates = []
+        self.graph.run(
+            ResourceBudget(4, 4 * GB),
+            on_stage_update=lambda stage, status: updates.append(status),
+            poll_interval=0.01,
+        )
+        self.assertIs(self.graph.stage_status('stage_qc'), StageStatus.FAILED)
+        self.assertEqual(updates[-1], StageStatus.FAILED)
+
+
+class BundleTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp()).resolve()
+        self.addCleanup(shutil.rmtree, str(self.tmp_dir))
+        self.root = self.tmp_dir.joinpath('result')
+        self.root.joinpath('sub').mkdir(parents=True)
+        self.root.joinpath('a.txt').write_bytes(b'a' * 10)
+        self.root.joinpath('sub', 'b.txt').write_bytes(b'b' * 1000)
+        self.outside = self.tmp_dir.joinpath('outside')
+        self.outside.mkdir()
+        self.outside.joinpath('secret.txt').write_bytes(b'secret')
+
+    def arcnames(self, files):
+        return [bundle_file.arcname for bundle_file in files]
+
+    def test_collect_whole_folder(self):
+        files = collect_files(self.root, [])
+        self.assertEqual(self.arcnames(files), ['a.txt', 'sub/b.txt'])
+        self.assertEqual(files[1].size, 1000)
+
+    def test_collect_skips_symlinked_file_outside(self):
+        os.symlink(
+            str(self.outside.joinpath('secret.txt')),
+            str(self.root.joinpath('sub', 'link.txt')),
+        )
+        files = collect_files(self.root, [])
+        self.assertEqual(self.arcnames(files), ['a.txt', 'sub/b.txt'])
+        with self.assertRaises(BundleError):
+            collect_files(self.root, ['sub/link.txt'])
+
+    def test_collect_skips_symlinked_folder_outside(self):
+        os.symlink(str(self.outside), str(self.root.joinpath('linked')))
+        files = collect_files(self.root, [])
+        self.assertEqual(self.arcnames(files), ['a.txt', 'sub/b.txt'])
+        with self.assertRaises(BundleError):
+            collect_files(self.root, ['linked'])
+        with self.assertRaises(BundleError):
+            collect_files(self.root, ['linked/secret.txt'])
+
+    def test_collect_keeps_symlink_inside(self):
+        os.symlink(
+            str(self.root.joinpath('a.txt')),
+            str(self.root.joinpath('sub', 'a_link.txt')),
+        )
+        files = collect_files(self.root, ['sub'])
+        self.assertEqual(
+            self.arcnames(files), ['sub/a_link.txt', 'sub/b.txt'],
+        )
+        self.assertEqual(files[0].path, self.root.joinpath('a.txt'))
+
+    def test_collect_rejects_parent_path(self):
+        with self.assertRaises(BundleError):
+            collect_files(self.root, ['../outside/secret.txt'])
+        with self.assertRaises(BundleError):
+            collect_files(self.root, ['missing.txt'])
+
+    def test_stream_zip(self):
+        files = collect_files(self.root, [])
+        data = b''.join(stream_zip(files))
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), ['a.txt', 'sub/b.txt'])
+            self.assertEqual(archive.read('sub/b.txt'), b'b' * 1000)
+
+    def test_zip64_offsets(self):
+        files = collect_files(self.root, [])
+        data = b''.join(stream_zip(files))
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            infos = archive.infolist()
+            local = data[:archive.start_dir]
+        # Rebuild the central directory as if 4 GB came before the archive,
+        # so all the offsets need Zip64 records
+        central_dir = b''.join(
+            _central_dir_header(
+                info.filename.encode('utf-8'), ZIP_VERSION,
+                *dos_datetime(bundle_file.mtime), crc=info.CRC,
+                size=info.file_size,
+                offset=info.header_offset + ZIP64_LIMIT,
+            )
+            for info, bundle_file in zip(infos, files)
+        )
+        data = local + central_dir + _end_of_central_dir(
+            len(files), len(central_dir), len(local) + ZIP64_LIMIT,
+        )
+        self.assertIn(b'PK\x06\x06', data)
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(
+                [info.header_offset for info in archive.infolist()],
+                [info.header_offset for info in infos],
+            )
+            self.assertEqual(archive.read('sub/b.txt'), b'b' * 1000)
+
+    def test_stream_tar(self):
+        files = collect_files(self.root, [])
+        data = b''.join(stream_tar(files))
+        self.assertEqual(len(data) % tarfile.RECORDSIZE, 0)
+        with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+            self.assertEqual(archive.getnames(), ['a.txt', 'sub/b.txt'])
+            self.assertEqual(
+                archive.extractfile('a.txt').read(), b'a' * 10,
+            )
+
+    def test_mod_zip_locations_use_real_paths(self):
+        os.symlink(
+            str(self.root.joinpath('a.txt')),
+            str(self.root.joinpath('sub', 'a_link.txt')),
+        )
+        file_list = mod_zip_file_list(
+            collect_files(self.root, ['sub/a_link.txt']), self.root,
+            '/protected/result/1/',
+        )
+        self.assertEqual(
+            file_list, '- 10 /protected/result/1/a.txt sub/a_link.txt\n',
+        )
+
+
+class ResourceBudgetTestCase(SimpleTestCase):
+
+    def test_acquire_and_release(self):
+        budget = ResourceBudget(4, 8 * GB)
+        self.assertTrue(budget.try_acquire(2, 4 * GB))
+        self.assertTrue(budget.try_acquire(2, 4 * GB))
+        self.assertFalse(budget.try_acquire(1, 0))
+        budget.release(2, 4 * GB)
+        self.assertTrue(budget.try_acquire(1, 2 * GB))
+        self.assertEqual((budget.used_cores, budget.used_memory), (3, 6 * GB))
+
+    def test_request_larger_than_budget_gets_whole_budget(self):
+        budget = ResourceBudget(4, 8 * GB)
+        self.assertTrue(budget.try_acquire(16, 64 * GB))
+        self.assertEqual((budget.used_cores, budget.used_memory), (4, 8 * GB))
+        budget.release(16, 64 * GB)
+        self.assertEqual((budget.used_cores, budget.used_memory), (0, 0))
+
+    def test_split(self):
+        budget = ResourceBudget(16, 64 * GB)
+        # Memory allows 2 jobs at once, each gets half of the cores
+        self.assertEqual(budget.split(4, 32 * GB), (2, 8))
+        self.assertEqual(budget.split(4, GB), (4, 4))
+        self.assertEqual(budget.split(4, GB, max_threads=2), (4, 2))
+        # A job larger than the budget still runs alone
+        self.assertEqual(budget.split(3, 128 * GB), (1, 16))
+
+    def test_reserved_waits_for_release(self):
+        budget = ResourceBudget(4, 8 * GB)
+        budget.try_acquire(4, 8 * GB)
+        timer = threading.Timer(0.05, budget.release, (4, 8 * GB))
+        timer.start()
+        with budget.reserved(0, 6 * GB):
+            self.assertEqual(budget.used_memory, 6 * GB)
+            self.assertFalse(budget.try_acquire(1, 4 * GB))
+        timer.join()
+        self.assertEqual(budget.used_memory, 0)
+
+
+class StepCheckpointTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, str(self.tmp_dir))
+        self.input = self.tmp_dir.joinpath('reads.fastq')
+        self.input.write_bytes(b'@r1\nACGT\n+\nIIII\n')
+        self.output_dir = self.tmp_dir.joinpath('STAR')
+        self.output_dir.mkdir()
+        self.output = self.output_dir.joinpath('Aligned.bam')
+        self.num_runs = 0
+
+    def checkpoint(self, **parameters):
+        return StepCheckpoint(
+            self.tmp_dir.joinpath('.manifests'), 'star:A',
+            inputs=[self.input], outputs=[self.output_dir],
+            parameters=parameters,
+        )
+
+    def run_step(self, checkpoint):
+        def func():
+            self.num_runs += 1
+            self.output.write_bytes(b'bam')
+            return 0
+        return checkpoint.wrap(func)()
+
+    def test_skip_up_to_date_step(self):
+        self.assertEqual(self.run_step(self.checkpoint(threads=4)), 0)
+        self.assertEqual(self.run_step(self.checkpoint(threads=4)), 0)
+        self.assertEqual(self.num_runs, 1)
+        manifest = self.checkpoint().load()
+        self.assertEqual(manifest['returncode'], 0)
+        self.assertEqual(len(manifest['outputs'][str(self.output)]), 3)
+
+    def test_changed_parameters_run_again(self):
+        self.run_step(self.checkpoint(threads=4))
+        self.run_step(self.checkpoint(threads=8))
+        self.assertEqual(self.num_runs, 2)
+
+    def test_changed_input_runs_again(self):
+        checkpoint = self.checkpoint()
+        self.run_step(checkpoint)
+        self.input.write_bytes(b'@r1\nACGTA\n+\nIIIII\n')
+        self.assertFalse(checkpoint.is_valid())
+
+    def test_missing_output_runs_again(self):
+        checkpoint = self.checkpoint()
+        self.run_step(checkpoint)
+        self.output.unlink()
+        self.assertFalse(checkpoint.is_valid())
+
+    def test_replaced_output_runs_again(self):
+        checkpoint = self.checkpoint()
+        self.run_step(checkpoint)
+        stat = self.output.stat()
+        # Same size and modification time, but another file
+        replacement = self.output_dir.joinpath('replacement')
+        replacement.write_bytes(b'BAM')
+        os.utime(str(replacement), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(str(replacement), str(self.output))
+        self.assertFalse(checkpoint.is_valid())
+
+    def test_failed_step_is_not_recorded(self):
+        checkpoint = self.checkpoint()
+        self.assertEqual(checkpoint.wrap(lambda: 1)(), 1)
+        self.assertIsNone(checkpoint.load())
+
+
+class StageOutputCacheTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, str(self.tmp_dir))
+        self.cache = StageOutputCache(self.tmp_dir.joinpath('cache'), 100)
+        self.num_runs = 0
+
+    def test_key_depends_on_everything_changing_outputs(self):
+        key = StageOutputCache.make_key(
+            'STAR_2.5.2a', {'genome_load': 'LoadAndKeep'}, ['a' * 64],
+        )
+        self.assertEqual(key, StageOutputCache.make_key(
+            'STAR_2.5.2a', {'genome_load': 'LoadAndKeep'}, ['a' * 64],
+        ))
+        self.assertEqual(len(key), 64)
+        for other in [
+            ('STAR_2.5.3a', {'genome_load': 'LoadAndKeep'}, ['a' * 64]),
+            ('STAR_2.5.2a', {'genome_load': 'NoSharedMemory'}, ['a' * 64]),
+            ('STAR_2.5.2a', {'genome_load': 'LoadAndKeep'}, ['b' * 64]),
+        ]:
+            self.assertNotEqual(key, StageOutputCache.make_key(*other))
+
+    def step(self, output_dir, content=b'output'):
+        def func():
+            self.num_runs += 1
+            output_dir.mkdir(parents=True, exist_ok=True)
+            output_dir.joinpath('out.txt').write_bytes(content)
+            return 0
+        return func
+
+    def test_reuse_outputs_by_hardlinks(self):
+        first_dir = self.tmp_dir.joinpath('first')
+        second_dir = self.tmp_dir.joinpath('second')
+        self.cache.wrap(self.step(first_dir), 'ab' * 32, first_dir)()
+        self.assertEqual(
+            self.cache.wrap(self.step(second_dir), 'ab' * 32, second_dir)(),
+            0,
+        )
+        self.assertEqual(self.num_runs, 1)
+        self.assertEqual(
+            second_dir.joinpath('out.txt').stat().st_ino,
+            first_dir.joinpath('out.txt').stat().st_ino,
+        )
+        self.assertFalse(second_dir.joinpath(ENTRY_META_NAME).exists())
+
+    def test_rerun_with_another_key_keeps_the_cached_entry(self):
+        output_dir = self.tmp_dir.joinpath('out')
+        self.cache.wrap(
+            self.step(output_dir, content=b'first'), 'aa' * 32, output_dir,
+        )()
+        self.cache.wrap(
+            self.step(output_dir, content=b'second'), 'bb' * 32, output_dir,
+        )()
+        self.assertEqual(self.num_runs, 2)
+        self.assertEqual(
+            self.cache.entry_dir('aa' * 32).joinpath('out.txt').read_bytes(),
+            b'first',
+        )
+        self.assertEqual(
+            output_dir.joinpath('out.txt').read_bytes(), b'second',
+        )
+
+    def test_no_key_is_not_cached(self):
+        output_dir = self.tmp_dir.joinpath('out')
+        self.cache.wrap(self.step(output_dir), None, output_dir)()
+        self.cache.wrap(self.step(output_dir), None, output_dir)()
+        self.assertEqual(self.num_runs, 2)
+        self.assertEqual(list(self.cache.entries()), [])
+
+    def test_evict_least_recently_used(self):
+        for i, key in enumerate(['aa' * 32, 'bb' * 32, 'cc' * 32]):
+            output_dir = self.tmp_dir.joinpath(key)
+            self.cache.wrap(
+                self.step(output_dir, content=b'x' * 40), key, output_dir,
+            )()
+            meta_path = self.cache.entry_dir(key).joinpath(ENTRY_META_NAME)
+            os.utime(str(meta_path), (i, i))
+        self.cache.evict()
+        self.assertEqual(
+            sorted(entry_dir.name for _, _, entry_dir in self.cache.entries()),
+            ['bb' * 32, 'cc' * 32],
+        )
+
+
+class TreeSizeTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, str(self.root))
+        self.root.joinpath('sub').mkdir()
+        self.root.joinpath('a.bam').write_bytes(b'a' * 100)
+        self.root.joinpath('b.txt').write_bytes(b'b' * 10)
+
+    def test_hardlinks_within_the_tree_count_once(self):
+        os.link(
+            str(self.root.joinpath('a.bam')),
+            str(self.root.joinpath('sub', 'a.bam')),
+        )
+        self.assertEqual(tree_size(self.root), 110)
+
+    def test_hardlinks_outside_the_tree_count_in_full(self):
+        outside = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, str(outside))
+        os.link(
+            str(self.root.joinpath('a.bam')), str(outside.joinpath('a.bam')),
+        )
+        self.assertEqual(tree_size(self.root), 110)
+
+
+class DispatchOrderTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.date = datetime(2016, 7, 1)
+        self.tickets = []
+
+    def ticket(self, name, owner_id, priority=0):
+        ticket = SimpleNamespace(
+            name=name, owner_id=owner_id, priority=priority,
+            date_submitted=self.date + timedelta(minutes=len(self.tickets)),
+        )
+        self.tickets.append(ticket)
+        return ticket
+
+    def order(self, running_per_user=()):
+        return [
+            ticket.name for ticket in
+            _dispatch_order(self.tickets, Counter(dict(running_per_user)))
+        ]
+
+    def test_fair_share_between_users(self):
+        self.ticket('a1', owner_id=1)
+        self.ticket('a2', owner_id=1)
+        self.ticket('a3', owner_id=1)
+        self.ticket('b1', owner_id=2)
+        self.assertEqual(self.order(), ['a1', 'b1', 'a2', 'a3'])
+
+    def test_running_analyses_count_against_their_owner(self):
+        self.ticket('a1', owner_id=1)
+        self.ticket('b1', owner_id=2)
+        self.assertEqual(self.order({1: 2}), ['b1', 'a1'])
+
+    def test_priority_goes_first(self):
+        self.ticket('a1', owner_id=1)
+        self.ticket('b1', owner_id=2)
+        self.ticket('a2', owner_id=1, priority=1)
+        self.assertEqual(self.order(), ['a2', 'a1', 'b1'])
+
+
+class RunCommandTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.log_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, str(self.log_dir))
+
+    def run_echo(self, text):
+        return run_command(
+            ['sh', '-c', 'echo %s; echo %s >&2; exit 3' % (text, text)],
+            cwd=self.log_dir, log_dir=self.log_dir, log_name='step',
+        )
+
+    def read_log(self, name):
+        return self.log_dir.joinpath(name).read_text()
+
+    def test_exit_code_and_logs(self):
+        result = self.run_echo('first')
+        self.assertEqual(result.returncode, 3)
+        self.assertEqual(self.read_log('step.out'), 'first\n')
+        self.assertEqual(self.read_log('step.err'), 'first\n')
+
+    def test_logs_of_the_previous_run_are_moved_aside(self):
+        self.run_echo('first')
+        self.run_echo('second')
+        self.assertEqual(self.read_log('step.out'), 'second\n')
+        self.assertEqual(self.read_log('step.err'), 'second\n')
+        self.assertEqual(self.read_log('step.out.1'), 'first\n')
+        self.assertEqual(self.read_log('step.err.1'), 'first\n')
+
+
+class ProgressEstimateTestCase(SimpleTestCase):
+
+    def test_last_percent(self):
+        self.assertEqual(last_percent('10%\r25.5%\r'), 25.5)
+        self.assertEqual(last_percent('no progress yet'), None)
+        self.assertEqual(last_percent('120%'), 100)
+
+    def test_estimate_remaining_seconds(self):
+        self.assertEqual(estimate_remaining_seconds(60, 25), 180)
+        self.assertEqual(estimate_remaining_seconds(60, 100), 0)
+        self.assertIsNone(estimate_remaining_seconds(60, 0))
+        self.assertIsNone(estimate_remaining_seconds(60, None))
+
+    def test_critical_path_takes_the_longest_branch(self):
+        requires = {'b': ['a'], 'c': ['a'], 'd': ['b', 'c']}
+        remaining = {'d': 5, 'c': 30, 'b': 10, 'a': 20}
+        self.assertEqual(critical_path_seconds(remaining, requires), 55)
+
+    def test_critical_path_skips_ended_steps(self):
+        requires = {'b': ['a'], 'c': ['b']}
+        remaining = {'a': 0, 'b': 0, 'c': 15}
+        self.assertEqual(critical_path_seconds(remaining, requires), 15)
+        self.assertEqual(critical_path_seconds({}, {}), 0)
+
+
+def matches(condition, analysis):
+    """Evaluate a Q of exact and __lt lookups on an object."""
+    if isinstance(condition, tuple):
+        lookup, value = condition
+        field, _, operator = lookup.partition('__')
+        if operator == 'lt':
+            return getattr(analysis, field) < value
+        return getattr(analysis, field) == value
+    results = (matches(child, analysis) for child in condition.children)
+    matched = any(results) if condition.connector == 'OR' else all(results)
+    return matched != condition.negated
+
+
+class AnalysisCursorTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.date = datetime(2016, 7, 1, 12, 30, 5, 123, tzinfo=timezone.utc)
+
+    def analysis(self, model_name, pk, date_created):
+        return SimpleNamespace(
+            _meta=SimpleNamespace(model_name=model_name), pk=pk,
+            date_created=date_created,
+        )
+
+    def test_cursor_round_trip(self):
+        cursor = encode_cursor(self.analysis('rnaseqmodel', 42, self.date))
+        self.assertEqual(
+            decode_cursor(cursor), (self.date, 'rnaseqmodel', 42)
+        )
+
+    def test_decode_malformed_cursor(self):
+        for cursor in ['', '1.rnaseqmodel', 'a.rnaseqmodel.1',
+                       '1.rnaseqmodel.b', '1.rna.seq.1', '9' * 30 + '.m.1']:
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
+
+    def test_after_cursor_follows_the_sort_order(self):
+        cursor_key = (self.date, 'rnaseqmodel', 42)
+        second = timedelta(seconds=1)
+        for model_name in ['chipseqmodel', 'rnaseqmodel', 'wgsmodel']:
+            for date in [self.date - second, self.date, self.date + second]:
+                for pk in [41, 42, 43]:
+                    analysis = self.analysis(model_name, pk, date)
+                    condition = after_cursor(analysis, cursor_key)
+                    self.assertEqual(
+                        matches(condition, analysis),
+                        sort_key(analysis) < cursor_key,
+                        (model_name, date, pk),
+                    )
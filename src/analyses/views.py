@@ -2,14 +2,16 @@ from django.contrib import messages
 from django.contrib.auth import get_user_model
 
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect
 from django.views.decorators.http import require_POST
 from django.views.generic import CreateView, TemplateView
 from django.utils.translation import ugettext_lazy as _
 
 from .forms import AbstractAnalysisCreateForm, ReportUpdateForm
-from .models import Report
-from .pipelines import AVAILABLE_PIPELINES, AVAILABLE_PIPELINE_MODELS
+from .index import InvalidCursor, analysis_page, status_counts
+from .models import ExecutionStatus, Report
+from .pipelines import AVAILABLE_PIPELINES
 
 
 User = get_user_model()
@@ -52,6 +54,8 @@ class AbstractAnalysisFormView(LoginRequiredMixin, CreateView):
             },
             extra_tags='safe',
         )
+        for warning in form.warnings:
+            messages.warning(self.request, warning)
         return response
 
 
@@ -61,16 +65,27 @@ class SubmittedAnalysisListView(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user_analyses = {}
-        for pipe_model in AVAILABLE_PIPELINE_MODELS:
-            # pipe_model._meta.verbose_name.title()
-            user_jobs = (
-                pipe_model.objects
-                    .order_by('execution_status', '-date_finished')
-                    .filter(owner=self.request.user)
+        status_name = self.request.GET.get('status') or None
+        try:
+            status = (
+                None if status_name is None else ExecutionStatus[status_name]
             )
-            user_analyses[pipe_model._meta.model_name] = user_jobs
-        context['all_user_jobs'] = user_analyses
+            page = analysis_page(
+                self.request.user, status,
+                cursor=self.request.GET.get('after') or None,
+            )
+        except (KeyError, InvalidCursor):
+            raise Http404('Invalid status or page')
+        context.update({
+            'analyses': page.analyses,
+            'next_cursor': page.next_cursor,
+            'is_first_page': 'after' not in self.request.GET,
+            'current_status': status,
+            'status_counts': [
+                (status, count)
+                for status, count in status_counts(self.request.user).items()
+            ],
+        })
         return context
 
 
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/1.9/ref/settings/
 """
 
+import os
 from os.path import abspath, dirname, join, exists
 from pathlib import Path
 from django.core.urlresolvers import reverse_lazy
@@ -223,6 +224,105 @@ if not BIOCLOUD_REPORTS_DIR.is_dir():
         % BIOCLOUD_REPORTS_DIR
     )
 
+# Directory of the stage output cache shared by all analyses. Leave it unset
+# to disable the cache. Put it on the same file system as
+# BIOCLOUD_RESULTS_DIR so cached outputs are hardlinked instead of copied.
+BIOCLOUD_STAGE_CACHE_DIR = env('BIOCLOUD_STAGE_CACHE_DIR', default=None)
+if BIOCLOUD_STAGE_CACHE_DIR is not None:
+    BIOCLOUD_STAGE_CACHE_DIR = Path(BIOCLOUD_STAGE_CACHE_DIR)
+
+# Least recently used cache entries are evicted beyond this size (in GB)
+BIOCLOUD_STAGE_CACHE_MAX_GB = env.int(
+    'BIOCLOUD_STAGE_CACHE_MAX_GB', default=500
+)
+
+# Verify the checksums of new data sources by a background task instead of
+# during the form validation
+BIOCLOUD_ASYNC_CHECKSUM_VERIFICATION = env.bool(
+    'BIOCLOUD_ASYNC_CHECKSUM_VERIFICATION', default=True
+)
+# Django-Q queue of the checksum verifications. It is served by its own
+# cluster (manage.py verification_cluster), so hashing files never takes
+# the worker of an analysis.
+BIOCLOUD_VERIFICATION_QUEUE = env(
+    'BIOCLOUD_VERIFICATION_QUEUE', default='BioCloud-verification'
+)
+# Seconds the data source file index of a user is trusted before checking
+# the file system for changes again
+BIOCLOUD_DISCOVERY_REINDEX_SECONDS = env.int(
+    'BIOCLOUD_DISCOVERY_REINDEX_SECONDS', default=60
+)
+# Number of new files listed on each page of the discovery view
+BIOCLOUD_DISCOVERY_PAGE_SIZE = env.int(
+    'BIOCLOUD_DISCOVERY_PAGE_SIZE', default=50
+)
+# Seconds between two polls of the data source watcher. With inotify, it is
+# the longest wait for file system events.
+BIOCLOUD_WATCHER_INTERVAL = env.int('BIOCLOUD_WATCHER_INTERVAL', default=60)
+# New files are registered once unchanged for this many seconds, so files
+# still being copied are not registered
+BIOCLOUD_WATCHER_SETTLE_SECONDS = env.int(
+    'BIOCLOUD_WATCHER_SETTLE_SECONDS', default=120
+)
+# Seconds the inotify events of a folder are collected before the watcher
+# lists it again
+BIOCLOUD_WATCHER_DEBOUNCE_SECONDS = env.int(
+    'BIOCLOUD_WATCHER_DEBOUNCE_SECONDS', default=5
+)
+# Days after an analysis finished before its alignments are compressed from
+# BAM to CRAM, and before its Cufflinks assemblies are deleted. See
+# analyses.retention.
+BIOCLOUD_RETENTION_BAM_DAYS = env.int(
+    'BIOCLOUD_RETENTION_BAM_DAYS', default=30
+)
+BIOCLOUD_RETENTION_ASSEMBLY_DAYS = env.int(
+    'BIOCLOUD_RETENTION_ASSEMBLY_DAYS', default=90
+)
+# Storage in GB each user can take under the data source, result and report
+# folders, unless set for the user. 0 means unlimited.
+BIOCLOUD_STORAGE_QUOTA_GB = env.int('BIOCLOUD_STORAGE_QUOTA_GB', default=0)
+# Number of processes hashing data sources at once
+BIOCLOUD_CHECKSUM_WORKERS = env.int(
+    'BIOCLOUD_CHECKSUM_WORKERS', default=min(4, os.cpu_count() or 1)
+)
+
+# Pipeline execution settings
+
+# Total CPU cores and memory (in GB) pipeline steps can use at once on this
+# node. Concurrent steps, including those of different analyses running in
+# the same worker process, share this budget.
+BIOCLOUD_PIPELINE_CORES = env.int(
+    'BIOCLOUD_PIPELINE_CORES', default=os.cpu_count() or 1
+)
+BIOCLOUD_PIPELINE_MEMORY_GB = env.int(
+    'BIOCLOUD_PIPELINE_MEMORY_GB', default=32
+)
+
+# Keep STAR genome indices in shared memory so concurrent alignments attach
+# to a resident index instead of loading their own copy. Genome indices must
+# be generated with their annotation (sjdbList.out.tab) to be shared.
+BIOCLOUD_STAR_SHARED_GENOME = env.bool(
+    'BIOCLOUD_STAR_SHARED_GENOME', default=False
+)
+# Folder tracking which jobs use each resident index. All worker processes
+# of the node must share it.
+BIOCLOUD_GENOME_INDEX_STATE_DIR = Path(env(
+    'BIOCLOUD_GENOME_INDEX_STATE_DIR', default='/dev/shm/biocloud'
+))
+# Idle indices are unloaded when the available memory drops below this (GB)
+BIOCLOUD_GENOME_INDEX_MIN_FREE_GB = env.int(
+    'BIOCLOUD_GENOME_INDEX_MIN_FREE_GB', default=16
+)
+
+# Seconds between two reads of the progress logged by the running tools
+BIOCLOUD_PROGRESS_INTERVAL = env.int('BIOCLOUD_PROGRESS_INTERVAL', default=30)
+
+# Number of previous analyses the cost estimator learns from
+BIOCLOUD_ESTIMATOR_HISTORY = env.int('BIOCLOUD_ESTIMATOR_HISTORY', default=50)
+
+# Bearer token scrapers send to read the resource usage of the pipeline
+# tools. Staff users can always read it. Leave it unset to allow only them.
+BIOCLOUD_METRICS_TOKEN = env('BIOCLOUD_METRICS_TOKEN', default=None)
 
 
 # Django-Q settings
@@ -230,19 +330,30 @@ if not BIOCLOUD_REPORTS_DIR.is_dir():
 
 Q_CLUSTER = {
     'name': 'BioCloud-queue',
-    'workers': 1,
+    # Number of analyses running at once. The analysis queue
+    # (analyses.job_queue) decides which analyses to send to the workers.
+    'workers': env.int('BIOCLOUD_QUEUE_WORKERS', default=4),
     'recycle': 5,
     'timeout': None,  # what is timed out may never time out
     'retry': 60 * 60 * 24 * 30,  # Retry in a month
     'compress': True,
     'save_limit': 10,
-    'queue_limit': 1,
-    'cpu_affinity': 1,
     'catch_up': False,
     'orm': 'default',
     'label': 'Analysis Queue (Django-Q)',
 }
 
+# Minutes after its dispatch an analysis task found neither in the Django-Q
+# queue nor in its results is considered lost, and its ticket released
+BIOCLOUD_QUEUE_LOST_TASK_MINUTES = env.int(
+    'BIOCLOUD_QUEUE_LOST_TASK_MINUTES', default=10
+)
+
+# Maximal number of analyses of the same user running at once
+BIOCLOUD_QUEUE_MAX_RUNNING_PER_USER = env.int(
+    'BIOCLOUD_QUEUE_MAX_RUNNING_PER_USER', default=2
+)
+
 
 # Third-party app and custom settings
 
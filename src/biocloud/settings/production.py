@@ -47,12 +47,37 @@ DEFAULT_FROM_EMAIL = SERVER_EMAIL = '{name} <{addr}>'.format(
 
 # Caching
 # Ref: https://docs.djangoproject.com/en/1.9/topics/cache/
+#
+# The web workers and the Django-Q cluster share the database cache, with a
+# short-lived copy in the memory of each process, see core.cache. Create the
+# cache table once by
+#
+#    python manage.py createcachetable
 
 CACHES = {
     'default': {
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'LOCAL_CACHE': 'local',
+            # Seconds a process may read an entry changed by another one
+            'LOCAL_TIMEOUT': env.int(
+                'BIOCLOUD_LOCAL_CACHE_SECONDS', default=5,
+            ),
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'biocloud_cache',
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    'local': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'biocloud-localmem',
-    }
+    },
 }
 
 
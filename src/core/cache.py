@@ -0,0 +1,112 @@
+"""A two-tier cache shared by all the processes of the site.
+
+The web server workers and the Django-Q cluster run in separate
+processes, so anything cached in a process-local cache is invisible to the
+others, and invalidating it in one process leaves the others stale.
+:class:`TieredCache` keeps every entry in a shared cache, such as the
+database cache, and a short-lived copy in a local memory cache in front of
+it, so repeated reads within a request burst do not hit the shared cache.
+
+Entries deleted or replaced in another process may be read from the local
+copy for at most ``LOCAL_TIMEOUT`` seconds.
+
+Configure it like::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.TieredCache',
+            'LOCATION': 'shared',   # alias of the shared cache
+            'OPTIONS': {'LOCAL_CACHE': 'local', 'LOCAL_TIMEOUT': 5},
+        },
+        'shared': {...},
+        'local': {...},
+    }
+"""
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.utils.functional import cached_property
+
+_MISSING = object()
+
+
+class TieredCache(BaseCache):
+    """Cache backend reading a local cache before a shared one."""
+
+    def __init__(self, location, params):
+        params = dict(params)
+        options = dict(params.pop('OPTIONS', {}))
+        self._shared_alias = location
+        self._local_alias = options.pop('LOCAL_CACHE', 'local')
+        self.local_timeout = options.pop('LOCAL_TIMEOUT', 5)
+        params['OPTIONS'] = options
+        super().__init__(params)
+
+    @cached_property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    @cached_property
+    def local(self):
+        return caches[self._local_alias]
+
+    def _local_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version)
+        if added:
+            self.local.set(key, value, self._local_timeout(timeout), version)
+        return added
+
+    def get(self, key, default=None, version=None):
+        value = self.local.get(key, _MISSING, version)
+        if value is _MISSING:
+            value = self.shared.get(key, _MISSING, version)
+            if value is _MISSING:
+                return default
+            self.local.set(key, value, self.local_timeout, version)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version)
+        self.local.set(key, value, self._local_timeout(timeout), version)
+
+    def delete(self, key, version=None):
+        self.shared.delete(key, version)
+        self.local.delete(key, version)
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = self.local.get_many(keys, version)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            shared_values = self.shared.get_many(missing, version)
+            self.local.set_many(shared_values, self.local_timeout, version)
+            values.update(shared_values)
+        return values
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version) is not _MISSING
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version)
+        self.local.delete(key, version)
+        return value
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set_many(data, timeout, version)
+        self.local.set_many(data, self._local_timeout(timeout), version)
+
+    def delete_many(self, keys, version=None):
+        self.shared.delete_many(keys, version)
+        self.local.delete_many(keys, version)
+
+    def clear(self):
+        self.shared.clear()
+        self.local.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+        self.local.close(**kwargs)
@@ -3,6 +3,8 @@ import enum
 import importlib
 import yaml
 
+from django.db import connection
+
 def str_to_class(module_name, class_name):
     """
     Mimic ``from module import class``.
@@ -66,6 +68,21 @@ class ValueDescriptionChoiceEnum(ChoiceEnum):
         ]
 
 
+def advisory_xact_lock(namespace, key):
+    """Wait for a PostgreSQL advisory lock held until the transaction ends.
+
+    Must be called inside ``transaction.atomic()``. Processes locking the
+    same (namespace, key) pair run one after another.
+
+    Args:
+        namespace (int): Kind of the locked resource.
+        key (int): Resource to lock, such as the pk of a user.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(%s, %s)', [namespace, key]
+        )
+
 
 # Set up PyYAML
 # Ref: https://stackoverflow.com/a/31609484
@@ -7,13 +7,25 @@ from django.utils.translation import ugettext
 from django.views.generic import TemplateView
 
 from users.forms import UserProfileUpdateForm
+from users.storage import storage_quota, storage_usage
 
 
 @login_required
 def dashboard_home(request):
     logout_next = reverse('login')
+    usage = storage_usage(request.user)
+    total_usage = sum(usage.values())
+    quota = storage_quota(request.user)
     return render(request, 'dashboard/welcome_page.html', {
         'logout_next': logout_next,
+        'storage_usage': [
+            (area.value, num_bytes) for area, num_bytes in usage.items()
+        ],
+        'storage_total': total_usage,
+        'storage_quota': quota,
+        'storage_percent': (
+            min(100, round(100 * total_usage / quota)) if quota else None
+        ),
     })
 
 
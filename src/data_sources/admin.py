@@ -3,6 +3,7 @@ from django.utils.translation import ugettext_lazy as _
 
 from .models import DataSource
 from .forms import DataSourceCreateForm
+from .tasks import request_verification
 
 
 class ChecksumBlankListFilter(admin.SimpleListFilter):
@@ -34,10 +35,22 @@ class DataSourceAdmin(admin.ModelAdmin):
     list_display = [
         'owner', 'file_path',
         'sample_name', 'file_type',
+        'checksum_status', 'date_verified',
         'metadata',
     ]
     ordering = ['sample_name', 'file_path']
     list_display_links = ['file_path']
-    list_filter = (ChecksumBlankListFilter, 'file_type')
+    list_filter = (ChecksumBlankListFilter, 'checksum_status', 'file_type')
+    readonly_fields = ['checksum_status', 'computed_checksum', 'date_verified']
+    actions = ['verify_checksums']
 
     form = DataSourceCreateForm
+
+    def get_fields(self, request, obj=None):
+        return [*self.fields, *self.readonly_fields]
+
+    def verify_checksums(self, request, queryset):
+        request_verification(list(queryset))
+    verify_checksums.short_description = _(
+        'Verify checksums of selected data sources'
+    )
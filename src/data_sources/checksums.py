@@ -0,0 +1,113 @@
+"""Compute file checksums in parallel, reusing those already computed.
+
+Hashing is bound by disk reads and by the hash function itself, so files
+are hashed in separate processes. Every checksum is cached in
+:class:`~data_sources.models.FileChecksum` by the device, inode, size and
+modification time of the file, so a file is never hashed again until it
+changes.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import logging
+from pathlib import Path
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .fields import SHA256ChecksumField
+from .models import FileChecksum
+
+logger = logging.getLogger(__name__)
+
+
+def file_key(path):
+    """Return the (device, inode, size, mtime_ns) identifying a file state."""
+    stat = Path(path).stat()
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _hash_file(path):
+    # Run in the worker processes, so it only takes picklable arguments
+    return SHA256ChecksumField.checksum_for_file(Path(path))
+
+
+def cached_checksums(keys):
+    """Return the cached checksums of the given file keys.
+
+    Returns:
+        dict: file key to its checksum, only for the keys found.
+    """
+    if not keys:
+        return {}
+    found = FileChecksum.objects.filter(
+        inode__in=set(key[1] for key in keys)
+    ).values_list('device', 'inode', 'size', 'mtime_ns', 'checksum')
+    keys = set(keys)
+    return {
+        tuple(row[:4]): row[4] for row in found
+        if tuple(row[:4]) in keys
+    }
+
+
+def store_checksum(key, checksum):
+    device, inode, size, mtime_ns = key
+    try:
+        with transaction.atomic():
+            FileChecksum.objects.get_or_create(
+                device=device, inode=inode, size=size, mtime_ns=mtime_ns,
+                defaults={'checksum': checksum},
+            )
+    except IntegrityError:
+        # Stored by another process in the meantime
+        pass
+
+
+def checksums_for_files(paths, max_workers=None):
+    """Compute the checksums of multiple files at once.
+
+    Args:
+        paths (list of pathlib.Path): Files to hash. They must exist.
+        max_workers (int): Number of processes hashing files. By default
+            ``BIOCLOUD_CHECKSUM_WORKERS``.
+
+    Returns:
+        dict: path to its hexadecimal SHA256 checksum.
+    """
+    paths = [Path(path) for path in paths]
+    keys = {path: file_key(path) for path in paths}
+    cached = cached_checksums(list(keys.values()))
+    checksums = {
+        path: cached[key] for path, key in keys.items() if key in cached
+    }
+    # The same file may be given under different paths
+    missing = {}
+    for path, key in keys.items():
+        if key not in cached:
+            missing.setdefault(key, path)
+    if not missing:
+        return checksums
+
+    if max_workers is None:
+        max_workers = settings.BIOCLOUD_CHECKSUM_WORKERS
+    max_workers = min(max_workers, len(missing))
+    logger.info(
+        'Hash %d files using %d processes' % (len(missing), max_workers)
+    )
+    if max_workers <= 1:
+        computed = [_hash_file(str(path)) for path in missing.values()]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            computed = list(executor.map(
+                _hash_file, [str(path) for path in missing.values()]
+            ))
+    by_key = dict(zip(missing.keys(), computed))
+    for key, checksum in by_key.items():
+        store_checksum(key, checksum)
+    for path, key in keys.items():
+        checksums.setdefault(path, by_key.get(key))
+    return checksums
+
+
+def checksum_for_file(path):
+    """Return the checksum of a single file, computing it if not cached."""
+    path = Path(path)
+    return checksums_for_files([path])[path]
@@ -67,6 +67,9 @@ class SHA256ChecksumField(models.CharField):
     def checksum_for_file(cls, path, chunk_bytes=4 * 2**20):
         """Compute checksum for file
 
+        The file is read into a preallocated buffer, so no new bytes object
+        is created for each chunk.
+
         Args:
             path (pathlib.Path): Compute the checksum at this file path
             chunk_bytes (int): Bytes per chunk for computing the checksum.
@@ -78,11 +81,13 @@ class SHA256ChecksumField(models.CharField):
             'Verifying %s checksum of filename %s' %
             (checksum.name, path.name)
         )
-        with path.open('rb') as f:
+        buf = bytearray(chunk_bytes)
+        view = memoryview(buf)
+        with path.open('rb', buffering=0) as f:
             while True:
-                buf = f.read(chunk_bytes)
-                if not buf:
+                num_read = f.readinto(buf)
+                if not num_read:
                     break  # file ends
-                checksum.update(buf)
+                checksum.update(view[:num_read])
         logger.info('Checksum verification of filename %s done.' % path.name)
         return checksum.hexdigest()
@@ -1,12 +1,20 @@
+from collections import defaultdict
+import os
+
 from django import forms
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
 from django.forms import formset_factory
+from django.utils import timezone
 from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Field, Fieldset, ButtonHolder, Submit
-from .models import DataSource
+from .checksums import checksum_for_file, checksums_for_files
+from .indexing import record_storage_usage
+from .models import ChecksumStatus, DataSource
+from .tasks import check_pairs, request_verification, sniff_data_sources
 
 
 class BaseDataSourceModelForm(forms.ModelForm):
@@ -26,12 +34,19 @@ class BaseDataSourceModelForm(forms.ModelForm):
     def get_file_path(self):
         return self.cleaned_data['file_path']
 
+    def file_exists(self, full_file_path):
+        return full_file_path.exists()
+
     def clean(self):
         """Validate the data source existed and has correct checksum.
 
         The file path has the pattern
 
         DATA_SOURCES_DIR / owner.pk / file_path
+
+        The checksum is only verified here when
+        ``BIOCLOUD_ASYNC_CHECKSUM_VERIFICATION`` is off. Otherwise it is
+        verified by a background task after saving.
         """
         cleaned_data = super().clean()
         if self.errors:
@@ -44,19 +59,18 @@ class BaseDataSourceModelForm(forms.ModelForm):
             str(owner.pk), file_path
         )
         # First assert the file path exists
-        if not full_file_path.exists():
+        if not self.file_exists(full_file_path):
             raise ValidationError(
                 _('Path %(full_file_path)s does not exist'),
                 params={'full_file_path': full_file_path},
                 code='file_path_not_exist',
             )
 
-        if checksum:
+        self._verified_checksum = None
+        if checksum and not settings.BIOCLOUD_ASYNC_CHECKSUM_VERIFICATION:
             # A checksum is provided. Check if it matches with the checksum
             # computed from the file content.
-            checksum_from_file = self.Meta.checksum_field.checksum_for_file(
-                full_file_path
-            )
+            checksum_from_file = checksum_for_file(full_file_path)
             if checksum != checksum_from_file:
                 raise ValidationError(
                     _(
@@ -70,6 +84,34 @@ class BaseDataSourceModelForm(forms.ModelForm):
                     },
                     code='checksum_mismatch',
                 )
+            self._verified_checksum = checksum_from_file
+
+    def needs_verification(self):
+        return (
+            self.instance._state.adding or
+            'checksum' in self.changed_data or
+            'file_path' in self.changed_data
+        )
+
+    def save(self, commit=True):
+        needs_verification = self.needs_verification()
+        verified_checksum = getattr(self, '_verified_checksum', None)
+        verified_inline = needs_verification and verified_checksum
+        if verified_inline:
+            # Already verified during the validation
+            needs_verification = False
+            self.instance.checksum_status = ChecksumStatus.VERIFIED.name
+            self.instance.computed_checksum = verified_checksum
+            self.instance.date_verified = timezone.now()
+            sniff_data_sources([self.instance])
+        data_source = super().save(commit)
+        if commit and needs_verification:
+            request_verification([data_source])
+        elif commit and verified_inline:
+            check_pairs([data_source])
+        if commit:
+            record_storage_usage(data_source.owner)
+        return data_source
 
 
 class DataSourceCreateForm(BaseDataSourceModelForm):
@@ -117,6 +159,8 @@ class DataSourceDiscoveryForm(DataSourceCreateForm):
     def __init__(self, *args, **kwargs):
         self.owner = kwargs.pop('owner')
         super().__init__(*args, **kwargs)
+        # Full paths of the existing files, listed by the formset at once
+        self.existing_files = None
 
     def save(self, *args, **kwargs):
         self.instance.owner = self.owner
@@ -125,6 +169,15 @@ class DataSourceDiscoveryForm(DataSourceCreateForm):
     def get_owner(self):
         return self.owner
 
+    def file_exists(self, full_file_path):
+        if self.existing_files is None:
+            return super().file_exists(full_file_path)
+        return full_file_path in self.existing_files
+
+    def validate_unique(self):
+        # Checked for all the forms at once by DataSourceFormSet
+        pass
+
 
 BaseDataSourceFormSet = formset_factory(
     DataSourceDiscoveryForm, extra=0
@@ -132,6 +185,214 @@ BaseDataSourceFormSet = formset_factory(
 
 
 class DataSourceFormSet(BaseDataSourceFormSet):
+    """Formset to add many data sources of a user at once.
+
+    The file system and the database are checked once for all the forms,
+    not once per form, and :meth:`save_valid_forms` creates the data
+    sources of the valid forms even if other forms have errors.
+    """
+
+    @property
+    def owner(self):
+        return self.form_kwargs['owner']
+
+    @property
+    def owner_dir(self):
+        return settings.BIOCLOUD_DATA_SOURCES_DIR.joinpath(str(self.owner.pk))
+
+    def full_clean(self):
+        if self.is_bound:
+            existing_files = self.list_existing_files()
+            for form in self.forms:
+                form.existing_files = existing_files
+            # Hash all the files with a checksum given at once before the
+            # forms are validated one by one, so each form finds its
+            # checksum cached
+            if not settings.BIOCLOUD_ASYNC_CHECKSUM_VERIFICATION:
+                self.precompute_checksums(existing_files)
+        super().full_clean()
+        if self.is_bound:
+            self.validate_unique_file_paths()
+
+    def submitted_file_paths(self):
+        """Return the full path of the file given in each form."""
+        paths = {}
+        for form in self.forms:
+            file_path = form['file_path'].value()
+            if file_path:
+                paths[form] = self.owner_dir.joinpath(file_path)
+        return paths
+
+    def list_existing_files(self):
+        """Return which of the given files exist, listing each folder once.
+
+        Returns:
+            set of pathlib.Path: full paths of the existing files.
+        """
+        by_dir = defaultdict(set)
+        for full_file_path in self.submitted_file_paths().values():
+            by_dir[full_file_path.parent].add(full_file_path)
+        existing = set()
+        for dir_path, full_file_paths in by_dir.items():
+            try:
+                names = set(os.listdir(str(dir_path)))
+            except OSError:
+                continue
+            existing.update(
+                full_file_path for full_file_path in full_file_paths
+                if full_file_path.name in names
+            )
+        return existing
+
+    def precompute_checksums(self, existing_files):
+        paths = [
+            full_file_path
+            for form, full_file_path in self.submitted_file_paths().items()
+            if form['checksum'].value() and full_file_path in existing_files
+        ]
+        if paths:
+            checksums_for_files(paths)
+
+    def validate_unique_file_paths(self):
+        """Reject the files already added or given twice, in one query."""
+        valid_forms = [form for form in self.forms if form.is_valid()]
+        file_paths = [form.cleaned_data['file_path'] for form in valid_forms]
+        added = set(
+            DataSource.objects
+            .filter(owner=self.owner, file_path__in=file_paths)
+            .values_list('file_path', flat=True)
+        )
+        seen = set()
+        for form in valid_forms:
+            file_path = form.cleaned_data['file_path']
+            if file_path in added:
+                self.add_already_added_error(form)
+            elif file_path in seen:
+                form.add_error('file_path', ValidationError(
+                    _('Data source %(file_path)s is given twice.'),
+                    params={'file_path': file_path},
+                    code='duplicate',
+                ))
+            seen.add(file_path)
+
+    def add_already_added_error(self, form):
+        file_path = form.cleaned_data['file_path']
+        form.add_error('file_path', ValidationError(
+            _('Data source %(file_path)s has already been added.'),
+            params={'file_path': file_path},
+            code='unique_together',
+        ))
+
+    def save_valid_forms(self):
+        """Create the data sources of all the valid forms at once.
+
+        They are inserted in one transaction. The checksums not verified
+        during the validation are verified by one background task.
+
+        The same files may be added meanwhile by another request or by the
+        data source watcher. The forms of those files then get an error
+        and the data sources of the other forms are inserted again.
+
+        Returns:
+            list of DataSource: data sources created.
+        """
+        forms = []
+        instances = []
+        verified = []
+        verified_date = timezone.now()
+        for form in self.forms:
+            if not form.is_valid():
+                continue
+            instance = form.instance
+            instance.owner = self.owner
+            verified_checksum = getattr(form, '_verified_checksum', None)
+            if verified_checksum:
+                instance.checksum_status = ChecksumStatus.VERIFIED.name
+                instance.computed_checksum = verified_checksum
+                instance.date_verified = verified_date
+                verified.append(instance)
+            forms.append(form)
+            instances.append(instance)
+        if not instances:
+            return []
+        sniff_data_sources(verified)
+        while True:
+            try:
+                created = self._insert(instances)
+                break
+            except IntegrityError:
+                added = set(
+                    DataSource.objects
+                    .filter(
+                        owner=self.owner,
+                        file_path__in=[
+                            instance.file_path for instance in instances
+                        ],
+                    )
+                    .values_list('file_path', flat=True)
+                )
+                if not added:
+                    raise
+            remaining = []
+            for form, instance in zip(forms, instances):
+                if instance.file_path in added:
+                    self.add_already_added_error(form)
+                else:
+                    remaining.append((form, instance))
+            if not remaining:
+                return []
+            forms, instances = map(list, zip(*remaining))
+        check_pairs([
+            data_source for data_source in created
+            if data_source.checksum_status == ChecksumStatus.VERIFIED.name
+        ])
+        record_storage_usage(self.owner)
+        return created
+
+    def _insert(self, instances):
+        """Insert the data sources in one transaction.
+
+        Returns:
+            list of DataSource: data sources inserted, with their pk.
+        """
+        with transaction.atomic():
+            DataSource.objects.bulk_create(instances)
+            # bulk_create does not set the primary keys
+            created = list(
+                DataSource.objects
+                .select_related('owner')
+                .filter(
+                    owner=self.owner,
+                    file_path__in=[
+                        instance.file_path for instance in instances
+                    ],
+                )
+            )
+            request_verification([
+                data_source for data_source in created
+                if data_source.checksum_status ==
+                ChecksumStatus.PENDING.name
+            ])
+        return created
+
+    def invalid_forms_data(self):
+        """Return the submitted data of the invalid forms only.
+
+        It binds a new formset showing the forms left to fix.
+        """
+        invalid_forms = [form for form in self.forms if not form.is_valid()]
+        data = {
+            '%s-TOTAL_FORMS' % self.prefix: str(len(invalid_forms)),
+            '%s-INITIAL_FORMS' % self.prefix: '0',
+            '%s-MIN_NUM_FORMS' % self.prefix: '0',
+            '%s-MAX_NUM_FORMS' % self.prefix: str(self.max_num),
+        }
+        for i, form in enumerate(invalid_forms):
+            for name in form.fields:
+                value = form.data.get(form.add_prefix(name))
+                if value is not None:
+                    data['%s-%d-%s' % (self.prefix, i, name)] = value
+        return data
 
     @cached_property
     def helper(self):
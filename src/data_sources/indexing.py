@@ -0,0 +1,215 @@
+"""Persistent index of the files under the data source folder of each user.
+
+Listing a folder with thousands of FASTQs in nested run folders on every
+page load is slow, so the files are kept in
+:class:`~data_sources.models.IndexedFile`. Updating the index only stats
+each folder; the entries of a folder are listed again only when its
+modification time changed, that is, when an entry was added, removed or
+renamed in it.
+"""
+from collections import defaultdict
+import logging
+import os
+import stat
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+
+from core.utils import advisory_xact_lock
+from users.models import StorageArea
+from users.storage import record_usage
+from .models import IndexedDirectory, IndexedFile
+
+logger = logging.getLogger(__name__)
+
+IGNORED_NAMES = ['.DS_Store']
+
+# Advisory lock namespace serializing the index updates of a user
+INDEX_LOCK_NAMESPACE = 1
+
+
+def is_ignored(name):
+    return name in IGNORED_NAMES or name.startswith('.')
+
+
+def join_path(dir_path, name):
+    """Join relative POSIX paths, where the root folder is ''."""
+    return '%s/%s' % (dir_path, name) if dir_path else name
+
+
+def parent_path(path):
+    return path.rsplit('/', 1)[0] if '/' in path else ''
+
+
+def owner_root(owner):
+    return settings.BIOCLOUD_DATA_SOURCES_DIR.joinpath(str(owner.pk))
+
+
+def _rescan_directory(owner, root, dir_path, mtime_ns, directory):
+    """List the entries of a folder and sync its indexed files.
+
+    Returns:
+        tuple: relative paths of its sub-folders, and those of the indexed
+        files whose size or modification time changed.
+    """
+    with transaction.atomic():
+        if directory is None:
+            directory = IndexedDirectory.objects.create(
+                owner=owner, path=dir_path, mtime_ns=mtime_ns,
+            )
+        else:
+            directory.mtime_ns = mtime_ns
+            directory.save(update_fields=['mtime_ns'])
+        indexed_files = {
+            indexed.file_path: indexed for indexed in directory.files.all()
+        }
+        sub_dirs = []
+        changed_files = []
+        new_files = []
+        found = set()
+        for entry in os.scandir(os.path.join(str(root), dir_path)):
+            if is_ignored(entry.name):
+                continue
+            path = join_path(dir_path, entry.name)
+            # Do not follow symlinks of folders, they may form a loop
+            if entry.is_dir(follow_symlinks=False):
+                sub_dirs.append(path)
+                continue
+            if not entry.is_file():
+                continue
+            try:
+                entry_stat = entry.stat()
+            except OSError:
+                continue  # A broken symlink
+            found.add(path)
+            indexed = indexed_files.get(path)
+            if indexed is None:
+                new_files.append(IndexedFile(
+                    owner=owner, directory=directory, file_path=path,
+                    size=entry_stat.st_size, mtime_ns=entry_stat.st_mtime_ns,
+                ))
+            elif (indexed.size, indexed.mtime_ns) != (
+                entry_stat.st_size, entry_stat.st_mtime_ns
+            ):
+                indexed.size = entry_stat.st_size
+                indexed.mtime_ns = entry_stat.st_mtime_ns
+                indexed.save(update_fields=['size', 'mtime_ns'])
+                changed_files.append(path)
+        IndexedFile.objects.bulk_create(new_files)
+        IndexedFile.objects.filter(pk__in=[
+            indexed.pk for path, indexed in indexed_files.items()
+            if path not in found
+        ]).delete()
+    return sub_dirs, changed_files
+
+
+def update_index(owner):
+    """Bring the file index of a user up to date with the file system.
+
+    Only the folders whose modification time changed are listed again, so
+    files changed in place without being renamed keep their indexed size
+    until their folder changes or is invalidated by
+    :func:`invalidate_directories`.
+
+    Concurrent updates of the same user, by the watcher and the discovery
+    page, run one after another.
+
+    Returns:
+        list of str: Relative paths of the files already indexed whose size
+        or modification time changed.
+    """
+    with transaction.atomic():
+        advisory_xact_lock(INDEX_LOCK_NAMESPACE, owner.pk)
+        return _update_index(owner)
+
+
+def _update_index(owner):
+    root = owner_root(owner)
+    indexed_dirs = {
+        directory.path: directory
+        for directory in IndexedDirectory.objects.filter(owner=owner)
+    }
+    children = defaultdict(list)
+    for path in indexed_dirs:
+        if path:
+            children[parent_path(path)].append(path)
+
+    seen = set()
+    changed_files = []
+    num_rescanned = 0
+    pending = ['']
+    while pending:
+        dir_path = pending.pop()
+        try:
+            dir_stat = os.stat(os.path.join(str(root), dir_path))
+        except OSError:
+            continue  # Removed in the meantime
+        if not stat.S_ISDIR(dir_stat.st_mode):
+            continue
+        seen.add(dir_path)
+        directory = indexed_dirs.get(dir_path)
+        if directory is not None and \
+                directory.mtime_ns == dir_stat.st_mtime_ns:
+            # Same entries as indexed, but sub-folders may have changed
+            pending.extend(children[dir_path])
+            continue
+        num_rescanned += 1
+        sub_dirs, changed_in_dir = _rescan_directory(
+            owner, root, dir_path, dir_stat.st_mtime_ns, directory,
+        )
+        pending.extend(sub_dirs)
+        changed_files.extend(changed_in_dir)
+
+    IndexedDirectory.objects.filter(pk__in=[
+        directory.pk for path, directory in indexed_dirs.items()
+        if path not in seen
+    ]).delete()
+    logger.debug(
+        'Index of user %s updated, %d of %d folders listed again'
+        % (owner.pk, num_rescanned, len(seen))
+    )
+    record_storage_usage(owner)
+    return changed_files
+
+
+def record_storage_usage(owner):
+    """Record the bytes the indexed files of a user take.
+
+    See :mod:`users.storage`.
+    """
+    total = IndexedFile.objects.filter(owner=owner).aggregate(
+        total=Sum('size')
+    )['total']
+    record_usage(owner, StorageArea.DATA_SOURCES, '', total or 0)
+
+
+def invalidate_directories(owner, dir_paths):
+    """Make the next update list the given folders again."""
+    IndexedDirectory.objects.filter(
+        owner=owner, path__in=list(dir_paths),
+    ).update(mtime_ns=-1)
+
+
+def refresh_index(owner):
+    """Update the file index of a user unless it was updated recently.
+
+    See ``BIOCLOUD_DISCOVERY_REINDEX_SECONDS``.
+    """
+    cache_key = 'data_sources:index_refreshed:%d' % owner.pk
+    if cache.get(cache_key):
+        return
+    update_index(owner)
+    cache.set(
+        cache_key, True, settings.BIOCLOUD_DISCOVERY_REINDEX_SECONDS,
+    )
+
+
+def undiscovered_files(owner):
+    """Indexed files of a user not yet added as data sources."""
+    return (
+        IndexedFile.objects
+        .filter(owner=owner)
+        .exclude(file_path__in=owner.data_sources.values('file_path'))
+    )
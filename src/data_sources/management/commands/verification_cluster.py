@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django_q.brokers import get_broker
+from django_q.cluster import Cluster
+
+
+class Command(BaseCommand):
+    help = (
+        'Start a Django-Q cluster verifying the checksums of data sources, '
+        'apart from the cluster running the analyses.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--run-once', action='store_true',
+            help='Run once and then stop.',
+        )
+
+    def handle(self, *args, **options):
+        cluster = Cluster(get_broker(settings.BIOCLOUD_VERIFICATION_QUEUE))
+        cluster.start()
+        if options['run_once']:
+            cluster.stop()
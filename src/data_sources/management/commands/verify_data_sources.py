@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from data_sources.models import ChecksumStatus, DataSource
+from data_sources.tasks import request_verification
+
+
+class Command(BaseCommand):
+    help = (
+        'Queue the verification of the data sources pending verification, '
+        'such as those added without a checksum before checksums were '
+        'verified.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Number of data sources verified by a task.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        pending = list(
+            DataSource.objects
+            .filter(checksum_status=ChecksumStatus.PENDING.name)
+            .order_by('pk')
+        )
+        for start in range(0, len(pending), batch_size):
+            request_verification(pending[start:start + batch_size])
+        self.stdout.write(
+            'Queued the verification of %d data sources' % len(pending)
+        )
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from data_sources.watcher import watch
+
+
+class Command(BaseCommand):
+    help = (
+        'Watch the data source folders of all users, register new files as '
+        'data sources and verify their checksums.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float,
+            default=settings.BIOCLOUD_WATCHER_INTERVAL,
+            help='Seconds between two polls of the folders.',
+        )
+        parser.add_argument(
+            '--settle', type=float,
+            default=settings.BIOCLOUD_WATCHER_SETTLE_SECONDS,
+            help='Seconds a new file must stay unchanged to be registered.',
+        )
+        parser.add_argument(
+            '--debounce', type=float,
+            default=settings.BIOCLOUD_WATCHER_DEBOUNCE_SECONDS,
+            help='Seconds the changes of a folder are collected.',
+        )
+        parser.add_argument(
+            '--polling', action='store_true',
+            help='Poll the folders even if inotify is available.',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Watching %s' % settings.BIOCLOUD_DATA_SOURCES_DIR)
+        try:
+            watch(
+                options['interval'], options['settle'],
+                use_inotify=not options['polling'],
+                debounce_seconds=options['debounce'],
+            )
+        except KeyboardInterrupt:
+            pass
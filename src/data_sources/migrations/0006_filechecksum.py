@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 12:20
+from __future__ import unicode_literals
+
+import data_sources.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_sources', '0005_auto_20160612_1644'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileChecksum',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device', models.BigIntegerField()),
+                ('inode', models.BigIntegerField()),
+                ('size', models.BigIntegerField()),
+                ('mtime_ns', models.BigIntegerField()),
+                ('checksum', data_sources.fields.SHA256ChecksumField(verbose_name='SHA256 checksum')),
+                ('date_computed', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'file checksum',
+                'verbose_name_plural': 'file checksums',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='filechecksum',
+            unique_together=set([('device', 'inode', 'size', 'mtime_ns')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='filechecksum',
+            index_together=set([('device', 'inode')]),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 12:58
+from __future__ import unicode_literals
+
+import data_sources.fields
+from django.db import migrations, models
+from django.db.models import F
+
+
+def grandfather_checksums(apps, schema_editor):
+    """Trust the checksums given before the checksums were verified.
+
+    Data sources with a checksum were accepted by the previous validation,
+    which compared it with the file content. Those without one were never
+    hashed, so they stay pending until queued by the verify_data_sources
+    command.
+    """
+    DataSource = apps.get_model('data_sources', 'DataSource')
+    DataSource.objects.exclude(checksum='').update(
+        checksum_status='VERIFIED',
+        computed_checksum=F('checksum'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_sources', '0006_filechecksum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasource',
+            name='checksum_status',
+            field=models.CharField(choices=[('PENDING', 'Pending verification'), ('VERIFIED', 'Verified'), ('MISMATCHED', 'Checksum mismatched'), ('MISSING', 'File not found')], db_index=True, default='PENDING', editable=False, max_length=32, verbose_name='checksum status'),
+        ),
+        migrations.AddField(
+            model_name='datasource',
+            name='computed_checksum',
+            field=data_sources.fields.SHA256ChecksumField(blank=True, editable=False, help_text='Checksum computed from the file content.', verbose_name='computed SHA256 checksum'),
+        ),
+        migrations.AddField(
+            model_name='datasource',
+            name='date_verified',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='date verified'),
+        ),
+        migrations.RunPython(
+            grandfather_checksums, migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 13:35
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('data_sources', '0007_checksum_verification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexedDirectory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(blank=True, help_text="Relative path under user's data source directory.", max_length=1023)),
+                ('mtime_ns', models.BigIntegerField()),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='indexed_directories', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'indexed directory',
+                'verbose_name_plural': 'indexed directories',
+            },
+        ),
+        migrations.CreateModel(
+            name='IndexedFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_path', models.CharField(help_text="Relative path under user's data source directory.", max_length=1023)),
+                ('size', models.BigIntegerField()),
+                ('mtime_ns', models.BigIntegerField()),
+                ('directory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='data_sources.IndexedDirectory')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='indexed_files', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'indexed file',
+                'verbose_name_plural': 'indexed files',
+                'ordering': ('file_path',),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='indexeddirectory',
+            unique_together=set([('owner', 'path')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='indexedfile',
+            unique_together=set([('owner', 'file_path')]),
+        ),
+    ]
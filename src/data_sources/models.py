@@ -6,7 +6,7 @@ from django.core.urlresolvers import reverse
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
-from core.utils import ValueDescriptionChoiceEnum
+from core.utils import ChoiceEnum, ValueDescriptionChoiceEnum
 from .fields import SHA256ChecksumField
 
 
@@ -17,6 +17,13 @@ class FileType(ValueDescriptionChoiceEnum):
     BINARY = (_('Binary'), _('Binary file that cannot be readable by human'))
 
 
+class ChecksumStatus(ChoiceEnum):
+    PENDING = _("Pending verification")
+    VERIFIED = _("Verified")
+    MISMATCHED = _("Checksum mismatched")
+    MISSING = _("File not found")
+
+
 class DataSource(models.Model):
     """A model to store user's data sources.
 
@@ -41,6 +48,25 @@ class DataSource(models.Model):
             "Hexadecimal checksum generated by SHA256 hash algorithm."
         ),
     )
+    checksum_status = models.CharField(
+        choices=ChecksumStatus.choices(),
+        max_length=32,
+        default=ChecksumStatus.PENDING.name,
+        editable=False,
+        db_index=True,
+        verbose_name=_("checksum status"),
+    )
+    computed_checksum = SHA256ChecksumField(
+        blank=True,
+        editable=False,
+        verbose_name=_("computed SHA256 checksum"),
+        help_text=_("Checksum computed from the file content."),
+    )
+    date_verified = models.DateTimeField(
+        blank=True, null=True,
+        editable=False,
+        verbose_name=_("date verified"),
+    )
     sample_name = models.CharField(
         max_length=512,
         blank=True,
@@ -89,3 +115,83 @@ class DataSource(models.Model):
     @property
     def full_file_path(self):
         return self.get_full_file_path()
+
+
+class FileChecksum(models.Model):
+    """Cached checksum of a file on disk.
+
+    A file is identified by its device and inode, and considered unchanged
+    as long as its size and modification time stay the same.
+    """
+    device = models.BigIntegerField()
+    inode = models.BigIntegerField()
+    size = models.BigIntegerField()
+    mtime_ns = models.BigIntegerField()
+    checksum = SHA256ChecksumField(verbose_name=_("SHA256 checksum"))
+    date_computed = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('file checksum')
+        verbose_name_plural = _('file checksums')
+        unique_together = ('device', 'inode', 'size', 'mtime_ns')
+        index_together = [('device', 'inode')]
+
+    def __str__(self):
+        return '%s (inode %d)' % (self.checksum, self.inode)
+
+
+class IndexedDirectory(models.Model):
+    """A folder under the data source folder of a user.
+
+    The modification time of a folder changes whenever an entry is added,
+    removed or renamed in it, so the files of a folder with the same
+    modification time are not listed again.
+    """
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='indexed_directories',
+    )
+    path = models.CharField(
+        max_length=1023,
+        blank=True,
+        help_text=_("Relative path under user's data source directory."),
+    )
+    mtime_ns = models.BigIntegerField()
+
+    class Meta:
+        verbose_name = _('indexed directory')
+        verbose_name_plural = _('indexed directories')
+        unique_together = ('owner', 'path')
+
+    def __str__(self):
+        return '%s/%s' % (self.owner_id, self.path)
+
+
+class IndexedFile(models.Model):
+    """A file found under the data source folder of a user."""
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='indexed_files',
+    )
+    directory = models.ForeignKey(
+        IndexedDirectory,
+        on_delete=models.CASCADE,
+        related_name='files',
+    )
+    file_path = models.CharField(
+        max_length=1023,
+        help_text=_("Relative path under user's data source directory."),
+    )
+    size = models.BigIntegerField()
+    mtime_ns = models.BigIntegerField()
+
+    class Meta:
+        verbose_name = _('indexed file')
+        verbose_name_plural = _('indexed files')
+        unique_together = ('owner', 'file_path')
+        ordering = ('file_path', )
+
+    def __str__(self):
+        return '%s/%s' % (self.owner_id, self.file_path)
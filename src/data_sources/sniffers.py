@@ -0,0 +1,350 @@
+"""Sniff the content of FASTA/FASTQ data sources.
+
+Only the first records of a file are read, so sniffing a file takes about
+the same time whatever its size. The number of records of the whole file
+is estimated from the bytes the sampled records took. Files compressed by
+gzip or bgzip are read transparently.
+"""
+import os
+import re
+import zlib
+
+# Number of records read from the beginning of a file
+SAMPLE_RECORDS = 1000
+
+GZIP_MAGIC = b'\x1f\x8b'
+GZIP_FLAG_EXTRA = 0x04
+
+# Casava 1.8+ header, such as
+# @EAS139:136:FC706VJ:2:2104:15343:197393 1:Y:18:ATCACG
+CASAVA_HEADER_PATTERN = re.compile(
+    r'^(?P<instrument>[^:\s]+):(?P<run>\d+):(?P<flowcell>[^:\s]+):'
+    r'(?P<lane>\d+):\d+:\d+:\d+ (?P<mate>[12]):[YN]:'
+)
+# Older Illumina header, such as @HWUSI-EAS100R:6:73:941:1973#0/1
+ILLUMINA_HEADER_PATTERN = re.compile(
+    r'^(?P<instrument>[^:\s]+):(?P<lane>\d+):\d+:\d+:\d+'
+    r'(?:#[\w]+)?(?:/(?P<mate>[12]))?$'
+)
+
+
+class SniffError(ValueError):
+    """The file content is not a valid FASTA/FASTQ."""
+
+
+def compression_of(path):
+    """Return 'bgzip', 'gzip' or '' by the magic bytes of a file.
+
+    bgzip files are gzip files whose first member carries a ``BC`` extra
+    subfield, so any gzip reader can read them.
+    """
+    with open(str(path), 'rb') as f:
+        header = f.read(14)
+    if header[:2] != GZIP_MAGIC:
+        return ''
+    if len(header) == 14 and header[3] & GZIP_FLAG_EXTRA and \
+            header[12:14] == b'BC':
+        return 'bgzip'
+    return 'gzip'
+
+
+class SequenceReader:
+    """Read the lines of a plain or compressed sequence file.
+
+    Compressed files are inflated chunk by chunk, counting the bytes going
+    in and out, so the uncompressed size of the whole file can be
+    estimated by the compression ratio of the part read.
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, path):
+        self.compression = compression_of(path)
+        self._f = open(str(path), 'rb')
+        self.file_size = os.fstat(self._f.fileno()).st_size
+        self._decompressor = self._new_decompressor()
+        self._buffer = b''
+        self._pos = 0
+        self._bytes_in = 0
+        self._bytes_out = 0
+        # Uncompressed bytes of the lines returned so far
+        self.bytes_consumed = 0
+
+    def _new_decompressor(self):
+        if not self.compression:
+            return None
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def _fill(self):
+        data = self._f.read(self.CHUNK_SIZE)
+        if not data:
+            return False
+        self._bytes_in += len(data)
+        if self._decompressor is not None:
+            inflated = []
+            while data:
+                if self._decompressor.eof:
+                    # bgzip files are made of many gzip members
+                    self._decompressor = self._new_decompressor()
+                inflated.append(self._decompressor.decompress(data))
+                data = self._decompressor.unused_data
+            data = b''.join(inflated)
+        self._bytes_out += len(data)
+        self._buffer = self._buffer[self._pos:] + data
+        self._pos = 0
+        return True
+
+    def readline(self):
+        end = self._buffer.find(b'\n', self._pos)
+        while end < 0:
+            searched = len(self._buffer) - self._pos
+            if not self._fill():
+                end = len(self._buffer) - 1
+                break
+            end = self._buffer.find(b'\n', searched)
+        line = self._buffer[self._pos:end + 1]
+        self._pos = end + 1
+        self.bytes_consumed += len(line)
+        return line.decode('ascii', errors='replace')
+
+    def at_eof(self):
+        while self._pos >= len(self._buffer):
+            if not self._fill():
+                return True
+        return False
+
+    def uncompressed_size(self):
+        """Return the uncompressed size of the file, estimated if needed."""
+        if not self.compression or not self._bytes_in:
+            return self.file_size
+        return self.file_size * self._bytes_out / self._bytes_in
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def fastq_records(reader, max_records=SAMPLE_RECORDS):
+    """Yield (header, sequence, quality) of the first FASTQ records.
+
+    Raises:
+        SniffError: A record is malformed.
+    """
+    for num_records in range(max_records):
+        header = reader.readline()
+        if not header:
+            return
+        sequence, separator, quality = (
+            reader.readline().rstrip() for _ in range(3)
+        )
+        header = header.rstrip()
+        if not header.startswith('@') or not separator.startswith('+'):
+            raise SniffError(
+                'Record %d is not a FASTQ record' % (num_records + 1)
+            )
+        if len(sequence) != len(quality):
+            raise SniffError(
+                'Record %d has %d bases but %d quality scores'
+                % (num_records + 1, len(sequence), len(quality))
+            )
+        yield header[1:], sequence, quality
+
+
+def fasta_records(reader, max_records=SAMPLE_RECORDS):
+    """Yield (header, sequence) of the first FASTA records.
+
+    Raises:
+        SniffError: The file does not start with a FASTA header.
+    """
+    line = reader.readline()
+    if line and not line.startswith('>'):
+        raise SniffError('Record 1 is not a FASTA record')
+    num_records = 0
+    while line and num_records < max_records:
+        header = line.rstrip()[1:]
+        sequence = []
+        line = reader.readline()
+        while line and not line.startswith('>'):
+            sequence.append(line.strip())
+            line = reader.readline()
+        num_records += 1
+        yield header, ''.join(sequence)
+
+
+def read_name(header):
+    """Return the read name of a header, without the mate number."""
+    name = header.split(None, 1)[0] if header else ''
+    if name.endswith(('/1', '/2')):
+        name = name[:-2]
+    return name
+
+
+def parse_header(header):
+    """Parse the instrument and mate number of an Illumina read header.
+
+    Returns:
+        dict: instrument, flowcell, lane and mate when found.
+    """
+    match = CASAVA_HEADER_PATTERN.match(header)
+    if match is None:
+        match = ILLUMINA_HEADER_PATTERN.match(header.split(None, 1)[0])
+    if match is None:
+        return {}
+    return {
+        key: value for key, value in match.groupdict().items()
+        if value is not None and key != 'run'
+    }
+
+
+def quality_encoding(min_quality, max_quality):
+    """Guess the quality encoding by the range of quality characters."""
+    if min_quality < ord(';'):
+        return 'phred33'
+    if min_quality < ord('@'):
+        return 'solexa64'
+    if max_quality > ord('J'):
+        return 'phred64'
+    # Both fit, but high quality reads in Phred+33 are far more common
+    return 'phred33'
+
+
+def estimate_records(reader, num_records):
+    """Estimate the number of records of the whole file."""
+    if not num_records:
+        return 0
+    if reader.at_eof():
+        return num_records
+    return int(
+        reader.uncompressed_size() * num_records /
+        max(reader.bytes_consumed, 1)
+    )
+
+
+def sniff_fastq(path, max_records=SAMPLE_RECORDS):
+    """Sniff the first records of a FASTQ.
+
+    Returns:
+        dict: Metadata of the FASTQ, with the keys compression,
+        sampled_reads, estimated_reads, uncompressed_bytes,
+        min_read_length, max_read_length,
+        mean_read_length, quality_encoding, and instrument, flowcell, lane
+        and mate when the read headers are from Illumina.
+
+    Raises:
+        SniffError: The file is not a valid FASTQ.
+    """
+    with SequenceReader(path) as reader:
+        lengths = []
+        min_quality, max_quality = 255, 0
+        first_header = None
+        for header, sequence, quality in fastq_records(reader, max_records):
+            if first_header is None:
+                first_header = header
+            lengths.append(len(sequence))
+            if quality:
+                qualities = quality.encode('ascii', errors='replace')
+                min_quality = min(min_quality, min(qualities))
+                max_quality = max(max_quality, max(qualities))
+        if not lengths:
+            raise SniffError('No FASTQ record found')
+        metadata = {
+            'compression': reader.compression,
+            'sampled_reads': len(lengths),
+            'estimated_reads': estimate_records(reader, len(lengths)),
+            'uncompressed_bytes': int(reader.uncompressed_size()),
+        }
+    metadata.update(_length_summary(lengths))
+    if max_quality:
+        metadata['quality_encoding'] = quality_encoding(
+            min_quality, max_quality
+        )
+    metadata.update(parse_header(first_header))
+    return metadata
+
+
+def sniff_fasta(path, max_records=SAMPLE_RECORDS):
+    """Sniff the first records of a FASTA.
+
+    Returns:
+        dict: Metadata of the FASTA, with the keys compression,
+        sampled_reads, estimated_reads, uncompressed_bytes,
+        min_read_length, max_read_length and mean_read_length.
+
+    Raises:
+        SniffError: The file is not a valid FASTA.
+    """
+    with SequenceReader(path) as reader:
+        lengths = [
+            len(sequence)
+            for header, sequence in fasta_records(reader, max_records)
+        ]
+        if not lengths:
+            raise SniffError('No FASTA record found')
+        metadata = {
+            'compression': reader.compression,
+            'sampled_reads': len(lengths),
+            'estimated_reads': estimate_records(reader, len(lengths)),
+            'uncompressed_bytes': int(reader.uncompressed_size()),
+        }
+    metadata.update(_length_summary(lengths))
+    return metadata
+
+
+def sniff_data_source(path, file_type):
+    """Sniff a data source by its file type.
+
+    Returns:
+        dict: Metadata found, empty for file types that cannot be sniffed.
+
+    Raises:
+        SniffError: The file content does not match its file type.
+        OSError: The file cannot be read.
+    """
+    if file_type == 'FASTQ':
+        return sniff_fastq(path)
+    if file_type == 'FASTA':
+        return sniff_fasta(path)
+    return {}
+
+
+def check_pair(r1_path, r2_path, max_records=SAMPLE_RECORDS):
+    """Check the first reads of two FASTQs are mates of each other.
+
+    Returns:
+        str: Why the files are not a pair, or '' if they are.
+
+    Raises:
+        SniffError: One of the files is not a valid FASTQ.
+    """
+    with SequenceReader(r1_path) as r1, SequenceReader(r2_path) as r2:
+        r1_records = fastq_records(r1, max_records)
+        r2_records = fastq_records(r2, max_records)
+        for num_records in range(1, max_records + 1):
+            r1_record = next(r1_records, None)
+            r2_record = next(r2_records, None)
+            if r1_record is None and r2_record is None:
+                break
+            if r1_record is None or r2_record is None:
+                return 'Different number of reads (%d and %d)' % (
+                    num_records - 1 + (r1_record is not None),
+                    num_records - 1 + (r2_record is not None),
+                )
+            r1_name = read_name(r1_record[0])
+            r2_name = read_name(r2_record[0])
+            if r1_name != r2_name:
+                return 'Read %d differs (%s and %s)' % (
+                    num_records, r1_name, r2_name
+                )
+    return ''
+
+
+def _length_summary(lengths):
+    return {
+        'min_read_length': min(lengths),
+        'max_read_length': max(lengths),
+        'mean_read_length': round(sum(lengths) / len(lengths), 1),
+    }
@@ -0,0 +1,153 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django_q.brokers import get_broker
+from django_q.tasks import async
+
+from .checksums import checksums_for_files
+from .models import ChecksumStatus, DataSource
+from .sniffers import SniffError, check_pair, sniff_data_source
+
+logger = logging.getLogger(__name__)
+
+
+def request_verification(data_sources):
+    """Mark data sources as pending and verify their checksums later.
+
+    The verification runs in a Django-Q worker once the current transaction
+    commits, so the web request never waits for the files to be hashed.
+    It is sent to the verification queue, not to the queue of the analyses.
+
+    Args:
+        data_sources (list of DataSource): Data sources to verify.
+    """
+    pks = [data_source.pk for data_source in data_sources]
+    if not pks:
+        return
+    DataSource.objects.filter(pk__in=pks).update(
+        checksum_status=ChecksumStatus.PENDING.name,
+        computed_checksum='',
+        date_verified=None,
+    )
+    transaction.on_commit(lambda: async(
+        'data_sources.tasks.verify_checksums', pks,
+        broker=get_broker(settings.BIOCLOUD_VERIFICATION_QUEUE),
+    ))
+
+
+def verify_checksums(data_source_pks):
+    """Hash the files of data sources and compare with their checksums.
+
+    Data sources without a checksum take the computed one. The metadata
+    of FASTA/FASTQ data sources is filled by sniffing their content.
+    """
+    data_sources = list(
+        DataSource.objects
+        .select_related('owner')
+        .filter(pk__in=data_source_pks)
+    )
+    existing = []
+    for data_source in data_sources:
+        if data_source.full_file_path.is_file():
+            existing.append(data_source)
+        else:
+            data_source.checksum_status = ChecksumStatus.MISSING.name
+            data_source.computed_checksum = ''
+    checksums = checksums_for_files(
+        [data_source.full_file_path for data_source in existing]
+    )
+    for data_source in existing:
+        computed = checksums[data_source.full_file_path]
+        data_source.computed_checksum = computed
+        if not data_source.checksum:
+            data_source.checksum = computed
+        if data_source.checksum == computed:
+            data_source.checksum_status = ChecksumStatus.VERIFIED.name
+        else:
+            logger.warning(
+                'Checksum of data source %s mismatches, got %s'
+                % (data_source.full_file_path, computed)
+            )
+            data_source.checksum_status = ChecksumStatus.MISMATCHED.name
+    sniff_data_sources(existing)
+
+    date_verified = timezone.now()
+    for data_source in data_sources:
+        data_source.date_verified = date_verified
+        data_source.save(update_fields=[
+            'checksum', 'checksum_status', 'computed_checksum',
+            'date_verified', 'metadata',
+        ])
+    check_pairs(existing)
+
+
+def sniff_data_sources(data_sources):
+    """Update the metadata of data sources by sniffing their first records.
+
+    Metadata set by the user, such as the strand, is kept. Files whose
+    content does not match their file type get a ``sniff_error``.
+    """
+    for data_source in data_sources:
+        metadata = dict(data_source.metadata or {})
+        metadata.pop('sniff_error', None)
+        try:
+            metadata.update(sniff_data_source(
+                data_source.full_file_path, data_source.file_type
+            ))
+        except (OSError, SniffError) as e:
+            logger.warning(
+                'Cannot sniff data source %s: %s'
+                % (data_source.full_file_path, e)
+            )
+            metadata['sniff_error'] = str(e)
+        data_source.metadata = metadata
+
+
+def check_pairs(data_sources):
+    """Check the reads of paired-end FASTQs match those of their mates.
+
+    The result is stored as ``pair_error`` in the metadata of both mates,
+    empty when the first reads of both files match.
+    """
+    checked = set()
+    for data_source in data_sources:
+        metadata = data_source.metadata or {}
+        if data_source.file_type != 'FASTQ' or \
+                not metadata.get('paired') or data_source.pk in checked:
+            continue
+        mates = [
+            mate for mate in (
+                DataSource.objects
+                .select_related('owner')
+                .filter(
+                    owner=data_source.owner_id,
+                    sample_name=data_source.sample_name,
+                    file_type='FASTQ',
+                )
+                .exclude(pk=data_source.pk)
+            )
+            if (mate.metadata or {}).get('paired') and
+            mate.metadata.get('strand') != metadata.get('strand')
+        ]
+        if len(mates) != 1:
+            continue  # Mate not added yet, or ambiguous
+        mate = mates[0]
+        r1, r2 = sorted(
+            [data_source, mate],
+            key=lambda ds: ds.metadata.get('strand', ''),
+        )
+        try:
+            pair_error = check_pair(r1.full_file_path, r2.full_file_path)
+        except (OSError, SniffError) as e:
+            pair_error = str(e)
+        if pair_error:
+            logger.warning(
+                'Data sources %s and %s are not a pair: %s'
+                % (r1.full_file_path, r2.full_file_path, pair_error)
+            )
+        for ds in (r1, r2):
+            ds.metadata['pair_error'] = pair_error
+            ds.save(update_fields=['metadata'])
+            checked.add(ds.pk)
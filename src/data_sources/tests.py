@@ -1,3 +1,207 @@
-from django.test import TestCase
+import gzip
+import hashlib
+from io import StringIO
+from pathlib import Path
+import struct
+import tempfile
+from unittest import mock
+import zlib
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .models import ChecksumStatus, DataSource
+from .sniffers import (
+    SniffError, check_pair, compression_of, parse_header, quality_encoding,
+    sniff_data_source, sniff_fasta, sniff_fastq,
+)
+from .tasks import verify_checksums
+
+
+def fastq(headers, sequence='ACGTACGTAC', quality='IIIIIIIII#'):
+    return ''.join(
+        '@%s\n%s\n+\n%s\n' % (header, sequence, quality)
+        for header in headers
+    ).encode('ascii')
+
+
+def bgzip_block(data):
+    """Compress data as one bgzip block, a gzip member with a BC subfield."""
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(data) + compressor.flush()
+    header = b'\x1f\x8b\x08\x04' + b'\x00' * 4 + b'\x00\xff'
+    extra = b'BC' + struct.pack('<HH', 2, len(deflated) + 25)
+    return (
+        header + struct.pack('<H', len(extra)) + extra + deflated +
+        struct.pack('<II', zlib.crc32(data), len(data))
+    )
+
+
+class SniffersTestCase(SimpleTestCase):
+
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.root = Path(tempdir.name)
+
+    def write(self, name, content):
+        path = self.root / name
+        path.write_bytes(content)
+        return path
+
+    def test_compression_of(self):
+        content = fastq(['read1'])
+        self.assertEqual(compression_of(self.write('a.fq', content)), '')
+        self.assertEqual(
+            compression_of(self.write('a.fq.gz', gzip.compress(content))),
+            'gzip',
+        )
+        self.assertEqual(
+            compression_of(self.write('b.fq.gz', bgzip_block(content))),
+            'bgzip',
+        )
+
+    def test_sniff_fastq(self):
+        headers = [
+            'EAS139:136:FC706VJ:2:2104:15343:%d 1:Y:18:ATCACG' % i
+            for i in range(10)
+        ]
+        path = self.write('reads.fq', fastq(headers))
+        metadata = sniff_fastq(path, max_records=4)
+        self.assertEqual(metadata['compression'], '')
+        self.assertEqual(metadata['sampled_reads'], 4)
+        self.assertEqual(metadata['estimated_reads'], 10)
+        self.assertEqual(metadata['mean_read_length'], 10)
+        self.assertEqual(metadata['quality_encoding'], 'phred33')
+        self.assertEqual(metadata['instrument'], 'EAS139')
+        self.assertEqual(metadata['flowcell'], 'FC706VJ')
+        self.assertEqual(metadata['lane'], '2')
+        self.assertEqual(metadata['mate'], '1')
+
+    def test_sniff_bgzip_fastq_of_many_blocks(self):
+        content = fastq(['read%d/1' % i for i in range(6)])
+        path = self.write(
+            'reads.fq.gz',
+            bgzip_block(content[:100]) + bgzip_block(content[100:]),
+        )
+        metadata = sniff_fastq(path)
+        self.assertEqual(metadata['compression'], 'bgzip')
+        self.assertEqual(metadata['sampled_reads'], 6)
+        self.assertEqual(metadata['estimated_reads'], 6)
+        self.assertEqual(metadata['uncompressed_bytes'], len(content))
+
+    def test_sniff_fastq_rejects_malformed_records(self):
+        with self.assertRaisesRegex(SniffError, 'Record 1'):
+            sniff_fastq(self.write('a.fq', b'>read1\nACGT\n'))
+        with self.assertRaisesRegex(SniffError, '4 bases but 3 quality'):
+            sniff_fastq(self.write('b.fq', b'@read1\nACGT\n+\nIII\n'))
+        with self.assertRaises(SniffError):
+            sniff_fastq(self.write('c.fq', b''))
+
+    def test_sniff_fasta(self):
+        path = self.write('genome.fa', b'>chr1\nACGT\nAC\n>chr2\nACGTACGT\n')
+        metadata = sniff_fasta(path)
+        self.assertEqual(metadata['sampled_reads'], 2)
+        self.assertEqual(metadata['min_read_length'], 6)
+        self.assertEqual(metadata['max_read_length'], 8)
+        with self.assertRaises(SniffError):
+            sniff_fasta(self.write('reads.fq', fastq(['read1'])))
+
+    def test_sniff_data_source_by_file_type(self):
+        path = self.write('reads.fq', fastq(['read1']))
+        self.assertEqual(sniff_data_source(path, 'FASTQ')['sampled_reads'], 1)
+        self.assertEqual(sniff_data_source(path, 'BAM'), {})
+
+    def test_parse_header(self):
+        self.assertEqual(
+            parse_header('HWUSI-EAS100R:6:73:941:1973#0/2'),
+            {'instrument': 'HWUSI-EAS100R', 'lane': '6', 'mate': '2'},
+        )
+        self.assertEqual(parse_header('SRR001666.1 length=36'), {})
+
+    def test_quality_encoding(self):
+        self.assertEqual(quality_encoding(ord('#'), ord('J')), 'phred33')
+        self.assertEqual(quality_encoding(ord(';'), ord('h')), 'solexa64')
+        self.assertEqual(quality_encoding(ord('B'), ord('h')), 'phred64')
+
+    def test_check_pair(self):
+        r1 = self.write('r1.fq', fastq(['read1/1', 'read2/1']))
+        r2 = self.write('r2.fq', fastq(['read1/2', 'read2/2']))
+        self.assertEqual(check_pair(r1, r2), '')
+        other = self.write('other.fq', fastq(['read1/2', 'read3/2']))
+        self.assertEqual(
+            check_pair(r1, other), 'Read 2 differs (read2 and read3)'
+        )
+        short = self.write('short.fq', fastq(['read1/2']))
+        self.assertEqual(
+            check_pair(r1, short), 'Different number of reads (2 and 1)'
+        )
+
+
+class VerifyChecksumsTestCase(TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(
+            BIOCLOUD_DATA_SOURCES_DIR=Path(tmp_dir.name),
+            BIOCLOUD_CHECKSUM_WORKERS=1,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.owner = get_user_model().objects.create_user(
+            'user@example.com', 'password',
+        )
+        self.user_dir = Path(tmp_dir.name, str(self.owner.pk))
+        self.user_dir.mkdir()
+        self.content = fastq(['read1'])
+        self.checksum = hashlib.sha256(self.content).hexdigest()
+
+    def data_source(self, file_path, checksum='', exists=True, **kwargs):
+        if exists:
+            self.user_dir.joinpath(file_path).write_bytes(self.content)
+        return DataSource.objects.create(
+            owner=self.owner, file_path=file_path, checksum=checksum,
+            **kwargs
+        )
+
+    def test_verify_checksums(self):
+        data_sources = [
+            self.data_source('given.fq', checksum=self.checksum),
+            self.data_source('blank.fq', file_type='FASTQ'),
+            self.data_source('wrong.fq', checksum='0' * 64),
+            self.data_source('missing.fq', exists=False),
+        ]
+        verify_checksums([ds.pk for ds in data_sources])
+        given, blank, wrong, missing = [
+            DataSource.objects.get(pk=ds.pk) for ds in data_sources
+        ]
+        self.assertEqual(given.checksum_status, ChecksumStatus.VERIFIED.name)
+        self.assertEqual(given.computed_checksum, self.checksum)
+        self.assertEqual(blank.checksum_status, ChecksumStatus.VERIFIED.name)
+        self.assertEqual(blank.checksum, self.checksum)
+        self.assertEqual(blank.metadata['sampled_reads'], 1)
+        self.assertEqual(
+            wrong.checksum_status, ChecksumStatus.MISMATCHED.name,
+        )
+        self.assertEqual(wrong.computed_checksum, self.checksum)
+        self.assertEqual(missing.checksum_status, ChecksumStatus.MISSING.name)
+        self.assertIsNotNone(missing.date_verified)
+
+    @mock.patch('data_sources.tasks.get_broker')
+    @mock.patch('data_sources.tasks.async')
+    @mock.patch(
+        'django.db.transaction.on_commit', side_effect=lambda func: func(),
+    )
+    def test_command_queues_pending_data_sources(
+        self, on_commit, async_task, get_broker,
+    ):
+        pending = [self.data_source('a.fq'), self.data_source('b.fq')]
+        verified = self.data_source('c.fq', checksum=self.checksum)
+        DataSource.objects.filter(pk=verified.pk).update(
+            checksum_status=ChecksumStatus.VERIFIED.name,
+        )
+        call_command('verify_data_sources', batch_size=1, stdout=StringIO())
+        queued = [call[0][1] for call in async_task.call_args_list]
+        self.assertEqual(queued, [[ds.pk] for ds in pending])
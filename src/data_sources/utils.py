@@ -1,12 +1,39 @@
 from pathlib import Path
 import re
 
+# Suffixes of compressed files, bgzip files are gzip files too
+COMPRESSION_SUFFIXES = ['.gz', '.bgz']
+
+
+def strip_compression_suffix(file_path):
+    """Return the path without its compression suffix, if any.
+
+    Args:
+        file_path (str or pathlib.Path): path to a data source
+
+    Returns:
+        pathlib.Path: path of the uncompressed file
+    """
+    pth = Path(file_path)
+    if pth.suffix in COMPRESSION_SUFFIXES:
+        return pth.with_suffix('')
+    return pth
+
+
+def sequence_stem(file_path):
+    """Return the file name without its type and compression suffixes.
+
+    For example, both ``S1_R1.fastq`` and ``S1_R1.fastq.gz`` give ``S1_R1``.
+    """
+    return strip_compression_suffix(file_path).stem
+
 
 def guess_data_source(file_path):
     """Guess data source info based on file path.
 
     It first detects the file suffix and delegates to the proper
-    data source info extractor.
+    data source info extractor. Files compressed by gzip or bgzip
+    (``.gz`` or ``.bgz``) are detected by the suffix before.
 
     Args:
         file_path (str): file path to the data source
@@ -14,7 +41,7 @@ def guess_data_source(file_path):
     Returns:
         dict: initial data to create the DataSource object
     """
-    pth = Path(file_path)
+    pth = strip_compression_suffix(file_path)
     initial = {
         'file_path': file_path,
         'sample_name': '',
@@ -39,14 +66,13 @@ def complete_fastaq_info(file_path, initial):
     Returns:
         dict: initial data to create the DataSource object
     """
-    pth = Path(file_path)
     initial = initial.copy()
     sample_regex = (
         r'^(?P<sample>\w+)_'       # sample name
         r'[rR]?(?P<strand>[12])$'  # read 1 or read 2 (pair-end)
                                    # can be R1 / R2
     )
-    match = re.match(sample_regex, pth.stem)
+    match = re.match(sample_regex, sequence_stem(file_path))
     if match:
         initial['sample_name'] = match.group('sample')
         initial['metadata'] = {}
@@ -1,9 +1,8 @@
-from pathlib import Path
-
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.core.urlresolvers import reverse_lazy
 from django.shortcuts import render, redirect
 from django.utils.translation import ugettext_lazy as _
@@ -12,6 +11,7 @@ from django.views.decorators.http import require_http_methods
 
 from .models import DataSource
 from .forms import DataSourceFormSet, DataSourceUpdateForm
+from .indexing import refresh_index, undiscovered_files
 from .utils import complete_fastaq_info, guess_data_source
 
 
@@ -55,48 +55,57 @@ class UserDataSourceUpdateView(LoginRequiredMixin, UpdateView):
 @require_http_methods(["GET", "POST"])
 @login_required
 def discover_data_source(request):
+    page = None
     if request.method == 'POST':
         formset = DataSourceFormSet(
             request.POST, request.FILES,
             form_kwargs={'owner': request.user},
         )
-        if formset.is_valid():
-            # save the new data sources
-            new_data_sources = []
-            for form in formset:
-                data_source = form.save()
-                new_data_sources.append(data_source.file_path)
+        # Save the valid forms even if some others have errors
+        formset.is_valid()
+        new_data_sources = formset.save_valid_forms()
+        if new_data_sources:
             messages.add_message(
                 request,
                 messages.SUCCESS,
                 _('Successfully added data sources: %(data_sources)s') % {
-                    'data_sources': ', '.join(new_data_sources)
+                    'data_sources': ', '.join(
+                        data_source.file_path
+                        for data_source in new_data_sources
+                    )
                 },
             )
+        if formset.is_valid():
             return redirect('list_data_sources')
+        if new_data_sources:
+            # Only show the forms left to fix
+            formset = DataSourceFormSet(
+                formset.invalid_forms_data(),
+                form_kwargs={'owner': request.user},
+            )
     else:
-        # Discover new data sources
+        # Discover new data sources from the file index, one page at a time
         owner = request.user
-        owner_data_source_pth = settings.BIOCLOUD_DATA_SOURCES_DIR.joinpath(
-            str(owner.pk)
-        )
-        all_file_paths = set(
-            p.relative_to(owner_data_source_pth).as_posix()
-            for p in owner_data_source_pth.iterdir()
-            if p.name not in ['.DS_Store'] and not p.name.startswith('.')
-        )
-        existed_file_paths = set(
-            owner.data_sources.values_list('file_path', flat=True)
+        refresh_index(owner)
+        paginator = Paginator(
+            undiscovered_files(owner).values_list('file_path', flat=True),
+            settings.BIOCLOUD_DISCOVERY_PAGE_SIZE,
         )
-        initial_data = []
-        for file_path in sorted(all_file_paths - existed_file_paths):
-            initial = guess_data_source(file_path)
-            initial_data.append(initial)
+        try:
+            page = paginator.page(request.GET.get('page', 1))
+        except PageNotAnInteger:
+            page = paginator.page(1)
+        except EmptyPage:
+            page = paginator.page(paginator.num_pages)
+        initial_data = [
+            guess_data_source(file_path) for file_path in page
+        ]
         formset = DataSourceFormSet(
             initial=initial_data,
             form_kwargs={'owner': owner},
         )
     return render(request, 'data_sources/discovery.html', {
-        'formset': formset
+        'formset': formset,
+        'page': page,
     })
 
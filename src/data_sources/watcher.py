@@ -0,0 +1,318 @@
+"""Register the files users copy into their data source folders.
+
+The watcher keeps the file index of every user up to date, creates a data
+source for each new file once it stopped changing, and queues the
+verification of its checksum. On Linux it sleeps on inotify events and
+only looks at the users whose folders changed. Elsewhere, or when inotify
+cannot watch all the folders, it polls every user at a fixed interval.
+
+The watcher runs as a long-lived service, so errors while syncing a user
+are logged and the user is synced again later, and the database
+connection is renewed when it was lost.
+"""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, close_old_connections, transaction
+
+from .indexing import (
+    invalidate_directories, is_ignored, owner_root, record_storage_usage,
+    undiscovered_files, update_index,
+)
+from .models import ChecksumStatus, DataSource
+from .tasks import request_verification
+from .utils import guess_data_source
+
+logger = logging.getLogger(__name__)
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF
+)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    def __init__(self, root):
+        """Watch a folder tree for changes by Linux inotify.
+
+        Raises:
+            OSError: inotify is not available, or the tree has more folders
+                than the user is allowed to watch
+                (``fs.inotify.max_user_watches``).
+        """
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError(errno.ENOSYS, 'Cannot find the C library')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not supported')
+        self.fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.root = str(root)
+        self._watches = {}
+        self.add_tree(self.root)
+
+    def add_watch(self, path):
+        wd = self._libc.inotify_add_watch(
+            self.fd, os.fsencode(path), WATCH_MASK,
+        )
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOENT:
+                return  # Removed in the meantime
+            raise OSError(err, 'Cannot watch %s' % path)
+        self._watches[wd] = path
+
+    def add_tree(self, path):
+        for dir_path, dir_names, file_names in os.walk(path):
+            dir_names[:] = [
+                name for name in dir_names if not is_ignored(name)
+            ]
+            self.add_watch(dir_path)
+
+    def read_events(self, timeout):
+        """Wait for changes up to timeout seconds.
+
+        Returns:
+            list of str: Folders where something changed, or None if events
+            were lost and everything should be checked.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        changed_dirs = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, name_len = EVENT_HEADER.unpack_from(
+                data, offset
+            )
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(
+                data[offset:offset + name_len].rstrip(b'\0')
+            )
+            offset += name_len
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            dir_path = self._watches.get(wd)
+            if dir_path is None:
+                continue
+            changed_dirs.add(dir_path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and \
+                    not is_ignored(name):
+                self.add_tree(os.path.join(dir_path, name))
+        return sorted(changed_dirs)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def register_data_sources(owner, indexed_files):
+    """Create the data sources of new files and queue their verification.
+
+    Returns:
+        list of DataSource: data sources created.
+    """
+    created = []
+    for indexed in indexed_files:
+        initial = guess_data_source(indexed.file_path)
+        try:
+            with transaction.atomic():
+                created.append(DataSource.objects.create(
+                    owner=owner, **initial
+                ))
+        except IntegrityError:
+            # The user added it at the same time
+            continue
+    if created:
+        logger.info(
+            'Register %d new data sources of user %s'
+            % (len(created), owner.pk)
+        )
+        request_verification(created)
+        record_storage_usage(owner)
+    return created
+
+
+def sync_owner(owner, settle_seconds):
+    """Update the index of a user and register the files that settled.
+
+    Files modified within the last settle_seconds may still be being copied,
+    so they are left for a later sync.
+
+    Returns:
+        bool: Whether some new files have not settled yet.
+    """
+    settled_before = (time.time() - settle_seconds) * 1e9
+    # Files still being written do not change the modification time of
+    # their folder, so list those folders again explicitly
+    unsettled = undiscovered_files(owner).filter(
+        mtime_ns__gte=settled_before
+    )
+    invalidate_directories(
+        owner, unsettled.values_list('directory__path', flat=True),
+    )
+    changed_paths = update_index(owner)
+
+    if changed_paths:
+        # The content of existing data sources changed, verify them again
+        request_verification(list(
+            DataSource.objects
+            .filter(owner=owner, file_path__in=changed_paths)
+            .exclude(checksum_status=ChecksumStatus.PENDING.name)
+        ))
+
+    new_files = undiscovered_files(owner)
+    register_data_sources(
+        owner, new_files.filter(mtime_ns__lt=settled_before),
+    )
+    return new_files.filter(mtime_ns__gte=settled_before).exists()
+
+
+def data_source_owners():
+    """Return the users having a folder under the data source folder."""
+    owner_pks = [
+        int(entry.name)
+        for entry in os.scandir(str(settings.BIOCLOUD_DATA_SOURCES_DIR))
+        if entry.is_dir() and entry.name.isdigit()
+    ]
+    return get_user_model().objects.filter(pk__in=owner_pks)
+
+
+def owner_pk_of(dir_path):
+    """Return the user pk owning a watched folder, or None."""
+    rel_path = os.path.relpath(
+        dir_path, str(settings.BIOCLOUD_DATA_SOURCES_DIR)
+    )
+    first_part = rel_path.split(os.sep, 1)[0]
+    return int(first_part) if first_part.isdigit() else None
+
+
+def relative_dir_path(owner, dir_path):
+    """Return the path of a folder as stored in the index."""
+    rel_path = os.path.relpath(dir_path, str(owner_root(owner)))
+    return '' if rel_path == '.' else rel_path.replace(os.sep, '/')
+
+
+def watch(interval, settle_seconds, use_inotify=True, debounce_seconds=5):
+    """Watch the data source folders forever.
+
+    Args:
+        interval (float): Seconds between two polls, or the longest wait
+            for inotify events.
+        settle_seconds (float): Seconds a new file must stay unchanged
+            before it is registered.
+        use_inotify (bool): Use inotify if available, otherwise poll.
+        debounce_seconds (float): Seconds the inotify events of a folder
+            are collected before it is listed again, so a file being
+            uploaded does not make its folder listed on every write.
+    """
+    data_sources_dir = str(settings.BIOCLOUD_DATA_SOURCES_DIR)
+    inotify = None
+    if use_inotify:
+        try:
+            inotify = InotifyWatcher(data_sources_dir)
+        except OSError as e:
+            logger.warning('Cannot use inotify (%s), poll instead' % e)
+    owners = {}
+    dirty_pks = set()
+    owners_changed = True
+    # Changed folder to the time of its first event not handled yet
+    pending_dirs = {}
+    while True:
+        # The database may have restarted since the last round
+        close_old_connections()
+        try:
+            if owners_changed:
+                new_owners = {
+                    owner.pk: owner for owner in data_source_owners()
+                }
+                dirty_pks.update(set(new_owners) - set(owners))
+                owners = new_owners
+                owners_changed = False
+            now = time.monotonic()
+            for dir_path, first_event in list(pending_dirs.items()):
+                if now - first_event < debounce_seconds:
+                    continue
+                owner = owners.get(owner_pk_of(dir_path))
+                if owner is not None:
+                    dirty_pks.add(owner.pk)
+                    # A file changed in place does not change the
+                    # modification time of its folder
+                    invalidate_directories(
+                        owner, [relative_dir_path(owner, dir_path)]
+                    )
+                del pending_dirs[dir_path]
+        except Exception:
+            logger.exception('Cannot read the users to watch')
+
+        for owner_pk in sorted(dirty_pks):
+            owner = owners.get(owner_pk)
+            if owner is None:
+                dirty_pks.discard(owner_pk)
+                continue
+            try:
+                has_unsettled = sync_owner(owner, settle_seconds)
+            except Exception:
+                # Such as a lost connection, try again in the next round
+                logger.exception(
+                    'Cannot sync the data sources of user %s' % owner_pk
+                )
+                close_old_connections()
+                continue
+            if not has_unsettled:
+                dirty_pks.discard(owner_pk)
+
+        if inotify is None:
+            time.sleep(interval)
+            changed_dirs = None
+        else:
+            timeout = interval
+            if pending_dirs:
+                timeout = min(timeout, max(
+                    0, min(pending_dirs.values()) + debounce_seconds -
+                    time.monotonic()
+                ))
+            try:
+                changed_dirs = inotify.read_events(timeout)
+            except OSError as e:
+                # Usually too many folders to watch
+                logger.warning('Stop using inotify (%s), poll instead' % e)
+                inotify.close()
+                inotify = None
+                changed_dirs = None
+        if changed_dirs is None or data_sources_dir in changed_dirs:
+            # New users may have appeared
+            owners_changed = True
+        if changed_dirs is None:
+            dirty_pks.update(owners)
+            continue
+        now = time.monotonic()
+        for dir_path in changed_dirs:
+            if dir_path != data_sources_dir:
+                pending_dirs.setdefault(dir_path, now)
@@ -38,6 +38,8 @@ class ExperimentAdmin(admin.ModelAdmin):
         'name',
         'owner',
         'date_created',
+        'num_samples',
+        'num_conditions',
         'summarize_experiment',
     ]
     list_display_links = [
@@ -50,8 +52,23 @@ class ExperimentAdmin(admin.ModelAdmin):
         'data_sources',
     ]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_summary()
+
     def summarize_experiment(self, experiment):
         return experiment.summary
 
     summarize_experiment.short_description = 'Summary'
 
+    def num_samples(self, experiment):
+        return experiment.num_samples
+
+    num_samples.short_description = 'Samples'
+    num_samples.admin_order_field = 'num_samples'
+
+    def num_conditions(self, experiment):
+        return experiment.num_conditions
+
+    num_conditions.short_description = 'Conditions'
+    num_conditions.admin_order_field = 'num_conditions'
+
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ExperimentsConfig(AppConfig):
     name = 'experiments'
+
+    def ready(self):
+        # Connect the signal receivers
+        from . import signals  # noqa
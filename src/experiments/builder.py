@@ -0,0 +1,144 @@
+"""Create an experiment and its conditions from the new experiment page.
+
+The page posts the selected data sources with their condition and sample
+as JSON. The whole layout is validated in memory against the data sources
+of the user, fetched by one query, before anything is written. The
+experiment and all its conditions are then written in one transaction, so
+the number of queries does not depend on the number of data sources.
+"""
+from django.db import transaction
+
+from data_sources.models import DataSource
+from .layouts import store_layout
+from .models import Condition
+
+
+class LayoutError(ValueError):
+    """The conditions and samples of a new experiment are invalid."""
+
+
+def parse_conditions(conditions):
+    """Return the condition labels by their order.
+
+    Args:
+        conditions (list of dict): Conditions with the keys ``_uid``, their
+            order, and ``label``.
+
+    Raises:
+        LayoutError: A condition is malformed or has a duplicate label.
+    """
+    labels = {}
+    label_field = Condition._meta.get_field('condition')
+    for cond in conditions:
+        try:
+            order = int(cond['_uid'])
+            label = str(cond['label']).strip()
+        except (KeyError, TypeError, ValueError):
+            raise LayoutError('Malformed condition %r' % (cond, ))
+        if not label:
+            raise LayoutError('Condition %d has no name' % order)
+        if len(label) > label_field.max_length:
+            raise LayoutError('Condition name %s is too long' % label)
+        if label in labels.values():
+            raise LayoutError('Condition %s is given twice' % label)
+        labels[order] = label
+    return labels
+
+
+def parse_data_sources(labelled_data_sources, condition_labels):
+    """Return the (condition order, data source pk, sample, strand) selected.
+
+    Raises:
+        LayoutError: A data source is malformed, refers to an unknown
+            condition, or is selected twice in the same condition.
+    """
+    sample_field = Condition._meta.get_field('sample_name')
+    strands = {strand for strand, _ in Condition.STRAND_CHOICES} | {''}
+    layout = []
+    seen = set()
+    for ds in labelled_data_sources:
+        if not ds.get('selected'):
+            continue
+        try:
+            order = int(ds['condition'])
+            pk = int(ds['data_source_pk'])
+            sample = str(ds['sample']).strip()
+            strand = (ds.get('metadata') or {}).get('strand', '')
+        except (AttributeError, KeyError, TypeError, ValueError):
+            raise LayoutError('Malformed data source %r' % (ds, ))
+        if order not in condition_labels:
+            raise LayoutError('Unknown condition %d' % order)
+        if len(sample) > sample_field.max_length:
+            raise LayoutError('Sample name %s is too long' % sample)
+        if strand not in strands:
+            raise LayoutError('Unknown strand %r' % (strand, ))
+        if (order, pk) in seen:
+            raise LayoutError(
+                'Data source %d is selected twice in condition %s'
+                % (pk, condition_labels[order])
+            )
+        seen.add((order, pk))
+        layout.append((order, pk, sample, strand))
+    if not layout:
+        raise LayoutError('No data source is selected')
+    return layout
+
+
+def build_conditions(owner, conditions, labelled_data_sources):
+    """Validate the layout of a new experiment and build its conditions.
+
+    All the data sources are fetched by a single query, limited to those of
+    the owner.
+
+    Args:
+        owner: User creating the experiment.
+        conditions (list of dict): Conditions posted by the page.
+        labelled_data_sources (list of dict): Data sources posted by the
+            page, with their condition order and sample.
+
+    Returns:
+        list of Condition: Unsaved conditions, without experiment.
+
+    Raises:
+        LayoutError: The layout is invalid or refers to data sources not
+            owned by the user.
+    """
+    condition_labels = parse_conditions(conditions)
+    layout = parse_data_sources(labelled_data_sources, condition_labels)
+    pks = {pk for _, pk, _, _ in layout}
+    data_sources = DataSource.objects.filter(owner=owner).in_bulk(pks)
+    missing = pks - set(data_sources)
+    if missing:
+        raise LayoutError(
+            'Data sources %s do not exist'
+            % ', '.join(str(pk) for pk in sorted(missing))
+        )
+    return [
+        Condition(
+            condition=condition_labels[order],
+            condition_order=order,
+            data_source=data_sources[pk],
+            sample_name=sample,
+            strand=strand,
+        )
+        for order, pk, sample, strand in layout
+    ]
+
+
+def create_experiment(experiment, conditions):
+    """Save a new experiment and its conditions in one transaction.
+
+    The layout of the experiment is stored as well.
+
+    Args:
+        experiment (Experiment): Unsaved experiment with its owner set.
+        conditions (list of Condition): Conditions by
+            :func:`build_conditions`.
+    """
+    with transaction.atomic():
+        experiment.save()
+        for condition in conditions:
+            condition.experiment = experiment
+        Condition.objects.bulk_create(conditions)
+        store_layout(experiment)
+    return experiment
@@ -0,0 +1,150 @@
+"""Precomputed layouts of experiments for the analysis creation page.
+
+The page asks for the conditions and samples of an experiment whenever
+one is selected. Grouping the data sources of an experiment takes a join
+query and some Python, while experiments rarely change after creation, so
+the grouped layout is stored in :attr:`Experiment.layout` and kept in the
+cache together with its owner and version.
+
+Changing the conditions of an experiment empties its stored layout and
+increases its version, see :mod:`experiments.signals`. The layout is then
+built again the next time it is requested. The version makes the ETag of
+the layout, so browsers can revalidate it without downloading it again.
+
+Layouts are cached by their version, and the cache points to the current
+version of each experiment. A request still building the layout of an old
+version when the experiment changes caches it under the old version,
+which is never read again.
+"""
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import Experiment
+
+LAYOUT_CACHE_KEY = 'experiments:layout:{pk}:{version}'
+LAYOUT_VERSION_CACHE_KEY = 'experiments:layout-version:{pk}'
+# Seconds a layout stays in the cache
+LAYOUT_CACHE_TIMEOUT = 24 * 60 * 60
+
+CachedLayout = namedtuple('CachedLayout', ['owner_id', 'version', 'data'])
+CachedLayout.__doc__ = """Layout of an experiment as kept in the cache.
+
+data is the JSON-serializable layout by :func:`build_layout`.
+"""
+
+
+def build_layout(experiment):
+    """Group the data sources of an experiment by condition and sample.
+
+    Returns:
+        dict: Name, URL and condition names of the experiment, and its data
+        sources grouped by condition then sample.
+    """
+    return {
+        'name': experiment.name,
+        'url': experiment.get_absolute_url(),
+        'conditions': list(experiment.condition_names),
+        'conditionSampleGroups': [
+            {
+                'condition': cond_label._asdict(),
+                'samples': [
+                    {
+                        'name': name,
+                        'conditions': [
+                            {'file_path': cond.data_source.file_path}
+                            for cond in conditions
+                        ],
+                    }
+                    for name, conditions in samples.items()
+                ],
+            }
+            for cond_label, samples in
+            experiment.group_data_sources.items()
+        ],
+    }
+
+
+def store_layout(experiment):
+    """Build the layout of an experiment and store it in the database.
+
+    The layout is not stored if the experiment changed in the meantime.
+
+    Returns:
+        bool: Whether the layout was stored.
+    """
+    experiment.layout = build_layout(experiment)
+    return bool(
+        Experiment.objects
+        .filter(pk=experiment.pk, layout_version=experiment.layout_version)
+        .update(layout=experiment.layout)
+    )
+
+
+def get_layout(owner, pk):
+    """Return the layout of an experiment of a user.
+
+    Only the cache is read if it has the layout, the database otherwise,
+    and the layout is built only if it has not been stored yet.
+
+    Returns:
+        CachedLayout: the layout, or None if the user has no such
+        experiment.
+    """
+    version_key = LAYOUT_VERSION_CACHE_KEY.format(pk=pk)
+    version = cache.get(version_key)
+    layout = None
+    if version is not None:
+        layout = cache.get(LAYOUT_CACHE_KEY.format(pk=pk, version=version))
+    if layout is None:
+        try:
+            experiment = Experiment.objects.only(
+                'owner', 'name', 'layout', 'layout_version',
+            ).get(pk=pk)
+        except Experiment.DoesNotExist:
+            return None
+        # An outdated layout is returned but not cached
+        up_to_date = bool(experiment.layout) or store_layout(experiment)
+        layout = CachedLayout(
+            experiment.owner_id, experiment.layout_version, experiment.layout,
+        )
+        if up_to_date:
+            cache.set(
+                LAYOUT_CACHE_KEY.format(pk=pk, version=layout.version),
+                layout, LAYOUT_CACHE_TIMEOUT,
+            )
+            # Never replaces the version set by a concurrent invalidation
+            cache.add(version_key, layout.version, LAYOUT_CACHE_TIMEOUT)
+    if layout.owner_id != owner.pk:
+        return None
+    return layout
+
+
+def invalidate_layout(pk):
+    """Forget the layout of an experiment after its conditions changed."""
+    with transaction.atomic():
+        # The row stays locked until the end of the transaction, so
+        # concurrent invalidations point the cache to their version in
+        # order
+        Experiment.objects.filter(pk=pk).update(
+            layout={}, layout_version=F('layout_version') + 1,
+        )
+        version = (
+            Experiment.objects.filter(pk=pk)
+            .values_list('layout_version', flat=True)
+            .first()
+        )
+        if version is None:
+            forget_layout(pk)
+        else:
+            cache.set(
+                LAYOUT_VERSION_CACHE_KEY.format(pk=pk), version,
+                LAYOUT_CACHE_TIMEOUT,
+            )
+
+
+def forget_layout(pk):
+    """Remove the cached layout of a deleted experiment."""
+    cache.delete(LAYOUT_VERSION_CACHE_KEY.format(pk=pk))
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 10:12
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0003_auto_20160614_0826'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='experiment',
+            name='layout',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, default=dict, editable=False, help_text='Conditions and samples of the experiment as sent to the analysis creation page. Empty until first requested.'),
+        ),
+        migrations.AddField(
+            model_name='experiment',
+            name='layout_version',
+            field=models.PositiveIntegerField(default=1, editable=False, help_text='Increased whenever the conditions change.'),
+        ),
+    ]
@@ -1,8 +1,11 @@
 from collections import namedtuple, OrderedDict, defaultdict
 
 from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.fields import ArrayField, JSONField
 from django.core.urlresolvers import reverse
 from django.db import models
+from django.db.models import Case, Count, F, When
 from django.utils import timezone
 from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
@@ -10,9 +13,70 @@ from django.utils.translation import ugettext_lazy as _
 from data_sources.models import DataSource
 
 
+class OrderedArrayAgg(ArrayAgg):
+    """``ARRAY_AGG`` whose elements are sorted by another expression."""
+
+    def __init__(self, expression, ordering, **extra):
+        # Elements and ordering may be of different types
+        extra.setdefault('output_field', ArrayField(models.TextField()))
+        super().__init__(expression, ordering, **extra)
+
+    def as_sql(self, compiler, connection):
+        expression, ordering = self.get_source_expressions()
+        expression_sql, expression_params = compiler.compile(expression)
+        ordering_sql, ordering_params = compiler.compile(ordering)
+        return (
+            '%s(%s ORDER BY %s)' % (
+                self.function, expression_sql, ordering_sql,
+            ),
+            expression_params + ordering_params,
+        )
+
+
+def unique_values(values):
+    """Remove the duplicates and None of a list, keeping its order."""
+    seen = set()
+    unique = []
+    for value in values:
+        if value is not None and value not in seen:
+            seen.add(value)
+            unique.append(value)
+    return unique
+
+
+class ExperimentQuerySet(models.QuerySet):
+
+    def with_summary(self):
+        """Annotate the counts and names used to summarize experiments.
+
+        The numbers of data sources (``num_sources``), samples
+        (``num_samples``) and conditions (``num_conditions``), and the
+        sample and condition names are all fetched with the experiments
+        in a single query, so listing many experiments takes a constant
+        number of queries.
+        """
+        named_condition = Case(When(
+            conditions__condition_order__gt=0,
+            then=F('conditions__condition'),
+        ))
+        return self.select_related('owner').annotate(
+            num_sources=Count('conditions', distinct=True),
+            num_samples=Count('conditions__sample_name', distinct=True),
+            num_conditions=Count(named_condition, distinct=True),
+            sample_name_list=OrderedArrayAgg(
+                'conditions__sample_name', F('conditions__sample_name'),
+            ),
+            condition_name_list=OrderedArrayAgg(
+                named_condition, F('conditions__condition_order'),
+            ),
+        )
+
+
 class Experiment(models.Model):
     """A model to store relations between data sources.
 
+    Use ``Experiment.objects.with_summary()`` to list experiments with
+    their summary.
     """
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -44,10 +108,30 @@ class Experiment(models.Model):
         editable=False,
     )
 
+    layout = JSONField(
+        blank=True,
+        default=dict,
+        editable=False,
+        help_text=_(
+            "Conditions and samples of the experiment as sent to the "
+            "analysis creation page. Empty until first requested."
+        ),
+    )
+
+    layout_version = models.PositiveIntegerField(
+        default=1,
+        editable=False,
+        help_text=_("Increased whenever the conditions change."),
+    )
+
+    objects = ExperimentQuerySet.as_manager()
+
     @cached_property
     def sample_names(self):
         """Return all distinct sample names"""
-        return (
+        if hasattr(self, 'sample_name_list'):
+            return unique_values(self.sample_name_list)
+        return list(
             self.conditions
                 .values_list('sample_name', flat=True)
                 .distinct()
@@ -60,14 +144,22 @@ class Experiment(models.Model):
 
         Note that condition (ALL) is ignored.
         """
-        return (
+        if hasattr(self, 'condition_name_list'):
+            return unique_values(self.condition_name_list)
+        return unique_values(
             self.conditions
                 .filter(condition_order__gt=0)
-                .values_list('condition', flat=True)
-                .distinct()
                 .order_by('condition_order')
+                .values_list('condition', flat=True)
         )
 
+    @cached_property
+    def num_data_sources(self):
+        """Return the number of data sources, including their replicates"""
+        if hasattr(self, 'num_sources'):
+            return self.num_sources
+        return self.conditions.count()
+
     @cached_property
     def group_data_sources(self):
         """
@@ -107,10 +199,10 @@ class Experiment(models.Model):
                 owner=self.owner.name,
                 name=self.name,
                 samples=', '.join(self.sample_names),
-                num_sample=self.sample_names.count(),
+                num_sample=len(self.sample_names),
                 conditions=', '.join(self.condition_names),
-                num_condition=self.condition_names.count(),
-                num_sources=self.conditions.count(),
+                num_condition=len(self.condition_names),
+                num_sources=self.num_data_sources,
             )
         )
 
@@ -123,12 +215,28 @@ class Experiment(models.Model):
             .format(
                 owner=self.owner.name,
                 name=self.name,
-                num_sample=self.sample_names.count(),
-                num_sources=self.conditions.count(),
-                num_condition=self.condition_names.count(),
+                num_sample=len(self.sample_names),
+                num_sources=self.num_data_sources,
+                num_condition=len(self.condition_names),
             )
         )
 
+    def save(self, *args, **kwargs):
+        """Save the experiment, except for its layout once created.
+
+        The layout is only changed by :mod:`experiments.layouts`. An
+        experiment loaded before its conditions changed would otherwise
+        write back an outdated layout and version.
+        """
+        if self.pk is not None and not kwargs.get('force_insert') and \
+                kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and
+                field.name not in ('layout', 'layout_version')
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
         get_latest_by = "date_created"
         ordering = ['-date_created']
@@ -0,0 +1,28 @@
+"""Keep the stored layouts of experiments up to date.
+
+Note that ``bulk_create`` and queryset ``update`` send no signal, so code
+changing conditions this way must call
+:func:`~experiments.layouts.invalidate_layout` itself.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .layouts import forget_layout, invalidate_layout
+from .models import Condition, Experiment
+
+
+@receiver([post_save, post_delete], sender=Condition)
+def condition_changed(sender, instance, **kwargs):
+    invalidate_layout(instance.experiment_id)
+
+
+@receiver(post_save, sender=Experiment)
+def experiment_saved(sender, instance, created, raw=False, **kwargs):
+    # The layout of a new experiment is stored once its conditions are
+    if not created and not raw:
+        invalidate_layout(instance.pk)
+
+
+@receiver(post_delete, sender=Experiment)
+def experiment_deleted(sender, instance, **kwargs):
+    forget_layout(instance.pk)
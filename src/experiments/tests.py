@@ -1,3 +1,161 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import SimpleTestCase, TestCase
 
-# Create your tests here.
+from data_sources.models import DataSource
+from .builder import (
+    LayoutError, create_experiment, parse_conditions, parse_data_sources,
+)
+from .layouts import get_layout
+from .models import Condition, Experiment
+
+
+class LayoutBuilderTestCase(SimpleTestCase):
+
+    def data_source(self, pk, condition=0, sample='', strand='', **kwargs):
+        ds = {
+            'selected': True, 'condition': condition, 'data_source_pk': pk,
+            'sample': sample, 'metadata': {'strand': strand},
+        }
+        ds.update(kwargs)
+        return ds
+
+    def test_parse_conditions(self):
+        conditions = [
+            {'_uid': '0', 'label': ' control '},
+            {'_uid': 1, 'label': 'treated'},
+        ]
+        self.assertEqual(
+            parse_conditions(conditions), {0: 'control', 1: 'treated'}
+        )
+
+    def test_parse_conditions_rejects_invalid_labels(self):
+        invalid_conditions = [
+            [{'_uid': 0, 'label': 'a'}, {'_uid': 1, 'label': 'a'}],
+            [{'_uid': 0, 'label': '  '}],
+            [{'_uid': 0, 'label': 'a' * 513}],
+            [{'label': 'a'}],
+            [{'_uid': 'first', 'label': 'a'}],
+        ]
+        for conditions in invalid_conditions:
+            with self.assertRaises(LayoutError):
+                parse_conditions(conditions)
+
+    def test_parse_data_sources(self):
+        labels = {0: 'control', 1: 'treated'}
+        layout = parse_data_sources([
+            self.data_source(1, sample=' s1 ', strand='1'),
+            self.data_source(2, condition='1', sample='s2', strand='2'),
+            self.data_source(3, selected=False),
+            self.data_source(1, condition=1, metadata=None),
+        ], labels)
+        self.assertEqual(layout, [
+            (0, 1, 's1', '1'), (1, 2, 's2', '2'), (1, 1, '', ''),
+        ])
+
+    def test_parse_data_sources_rejects_invalid_layouts(self):
+        labels = {0: 'control'}
+        invalid_layouts = [
+            [self.data_source(1, condition=1)],
+            [self.data_source(1), self.data_source(1)],
+            [self.data_source(1, strand='3')],
+            [self.data_source(1, sample='s' * 513)],
+            [self.data_source('one')],
+            [self.data_source(1, selected=False)],
+            [],
+        ]
+        for data_sources in invalid_layouts:
+            with self.assertRaises(LayoutError):
+                parse_data_sources(data_sources, labels)
+
+    def test_selected_twice_names_the_condition(self):
+        with self.assertRaisesRegex(LayoutError, 'twice in condition ctrl'):
+            parse_data_sources(
+                [self.data_source(7), self.data_source(7)], {0: 'ctrl'},
+            )
+
+
+class ExperimentLayoutTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = get_user_model().objects.create_user(
+            'user@example.com', 'password',
+        )
+        self.data_sources = [
+            DataSource.objects.create(
+                owner=self.owner, file_path='s%d.fq' % i, file_type='FASTQ',
+            )
+            for i in range(2)
+        ]
+        self.experiment = create_experiment(
+            Experiment(owner=self.owner, name='exp'),
+            [self.condition('control', 1, self.data_sources[0], 's0')],
+        )
+        self.client.force_login(self.owner)
+
+    def condition(self, label, order, data_source, sample):
+        return Condition(
+            condition=label, condition_order=order,
+            data_source=data_source, sample_name=sample,
+        )
+
+    def fetch(self, pk=None, etag=None):
+        headers = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        if etag is not None:
+            headers['HTTP_IF_NONE_MATCH'] = etag
+        return self.client.get(
+            reverse('ajax_experiment_info'),
+            {'experiment_pk': pk or self.experiment.pk}, **headers
+        )
+
+    def test_layout_is_stored_on_creation(self):
+        experiment = Experiment.objects.get(pk=self.experiment.pk)
+        self.assertEqual(experiment.layout_version, 1)
+        self.assertEqual(experiment.layout['conditions'], ['control'])
+
+    def test_etag_revalidation(self):
+        response = self.fetch()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"%d-1"' % self.experiment.pk)
+        self.assertEqual(response.json()['conditions'], ['control'])
+        response = self.fetch(etag=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_layout_is_read_from_the_cache(self):
+        self.assertIsNotNone(get_layout(self.owner, self.experiment.pk))
+        with self.assertNumQueries(0):
+            layout = get_layout(self.owner, self.experiment.pk)
+        self.assertEqual(layout.data['conditions'], ['control'])
+
+    def test_changed_conditions_invalidate_the_layout(self):
+        etag = self.fetch()['ETag']
+        condition = self.condition('treated', 2, self.data_sources[1], 's1')
+        condition.experiment = self.experiment
+        condition.save()
+        response = self.fetch(etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"%d-2"' % self.experiment.pk)
+        self.assertEqual(
+            response.json()['conditions'], ['control', 'treated'],
+        )
+        # Renaming the experiment changes its layout too, even saved from
+        # an instance loaded before the conditions changed
+        self.experiment.name = 'renamed'
+        self.experiment.save()
+        response = self.fetch(etag=response['ETag'])
+        self.assertEqual(response['ETag'], '"%d-3"' % self.experiment.pk)
+        self.assertEqual(response.json()['name'], 'renamed')
+
+    def test_layout_of_others_and_deleted_experiments(self):
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'password',
+        )
+        self.assertEqual(self.fetch().status_code, 200)
+        self.client.force_login(other)
+        self.assertEqual(self.fetch().status_code, 404)
+        self.client.force_login(self.owner)
+        self.experiment.delete()
+        self.assertEqual(self.fetch().status_code, 404)
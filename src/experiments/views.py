@@ -3,60 +3,52 @@ import json
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse, HttpResponseBadRequest
-from django.shortcuts import render, redirect, get_object_or_404
+from django.http import (
+    Http404, HttpResponseBadRequest, HttpResponseNotModified, JsonResponse,
+)
+from django.shortcuts import render, redirect
+from django.utils.cache import patch_cache_control
 from django.utils.html import mark_safe
+from django.utils.http import parse_etags, quote_etag
 from django.utils.translation import ugettext
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_http_methods
 from django.views.generic import ListView, DetailView
 
 from core.decorators import ajax_required
-from data_sources.models import DataSource
+from .builder import LayoutError, build_conditions, create_experiment
+from .layouts import get_layout
 from .forms import ExperimentCreateForm
-from .models import Experiment, Condition
+from .models import Experiment
 
 
-@require_POST
+@require_http_methods(['GET', 'POST'])
 @ajax_required
 @login_required
 def get_experiment_info_json(request):
-    def condition_as_dict(condition):
-        """Condition JSON formatter"""
-        return {
-            'file_path': condition.data_source.file_path,
-            # 'strand': condition.strand,
-            # 'file_type': condition.data_source.file_type,
-        }
+    """Return the layout of an experiment of the user.
 
+    The layout comes from the cache when possible. Its ETag changes with
+    the conditions of the experiment, so a GET request with a matching
+    If-None-Match header gets a 304 response.
+    """
+    params = request.GET if request.method == 'GET' else request.POST
     try:
-        pk = request.POST['experiment_pk']
-    except KeyError:
-        return HttpResponseBadRequest
-    experiment = get_object_or_404(
-        Experiment,
-        owner=request.user,
-        pk=pk
-    )
-    return JsonResponse({
-        'name': experiment.name,
-        'url': experiment.get_absolute_url(),
-        'conditions': list(experiment.condition_names),
-        'conditionSampleGroups': [
-            {
-                "condition": cond_label._asdict(),
-                "samples": [
-                    {
-                        "name": name,
-                        "conditions": [
-                            condition_as_dict(cond) for cond in conditions
-                        ]
-                    }
-                    for name, conditions in samples.items()
-                ]
-            }
-            for cond_label, samples in experiment.group_data_sources.items()
-        ],
-    })
+        pk = int(params['experiment_pk'])
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest()
+    layout = get_layout(request.user, pk)
+    if layout is None:
+        raise Http404('No experiment %d' % pk)
+    etag = '%d-%d' % (pk, layout.version)
+    if request.method == 'GET' and \
+            etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse(layout.data)
+    response['ETag'] = quote_etag(etag)
+    # Browsers should revalidate the layout every time
+    patch_cache_control(response, private=True, max_age=0)
+    return response
 
 
 @login_required
@@ -67,35 +59,24 @@ def create_new_experiment(request):
         )
         extra_data = json.loads(request.POST.get('extraData', {}))
         conditions = extra_data.get('conditions', [])
-        condition_labels = {
-            cond['_uid']: cond['label']
-            for cond in conditions
-        }
         num_condition_created = max(
             extra_data.get('numConditionCreated', 0),
             len(conditions)
         )
         labelled_data_sources = extra_data.get('dataSources', [])
+        condition_objects = None
         if form.is_valid():
-            # Create the experiment first
+            try:
+                condition_objects = build_conditions(
+                    request.user, conditions, labelled_data_sources,
+                )
+            except LayoutError as e:
+                form.add_error(None, str(e))
+        if condition_objects is not None:
+            # Create the experiment with all its conditions
             experiment = form.save(commit=False)
             experiment.owner = request.user
-            experiment.save()
-            # Create all conditions of the experiment
-            condition_objects = [
-                Condition(
-                    experiment=experiment,
-                    condition=condition_labels[ds['condition']],
-                    condition_order=ds['condition'],
-                    data_source=DataSource.objects.get(
-                        pk=ds['data_source_pk']
-                    ),
-                    sample_name=ds['sample'],
-                    strand=ds['metadata'].get('strand', ''),
-                )
-                for ds in labelled_data_sources if ds['selected']
-            ]
-            Condition.objects.bulk_create(condition_objects)
+            create_experiment(experiment, condition_objects)
             messages.success(request, ugettext(
                 'You have created a new experiment {name}'.format(
                     name=experiment.name
@@ -136,7 +117,7 @@ class ExperimentListView(LoginRequiredMixin, ListView):
     template_name = "experiments/list.html"
 
     def get_queryset(self):
-        return self.request.user.experiments.all()
+        return self.request.user.experiments.with_summary()
         # return super().get_queryset().filter(
         #     owner__exact=self.request.user,
         # )
@@ -1,10 +1,13 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.utils.translation import ugettext_lazy as _, ungettext
 
 from analyses.admin import (
     AbstractAnalysisAdmin,
     AbstractAnalysisAdminUpdateForm,
 )
-from .models import RNASeqModel, RNASeqExeDetail
+from analyses.models import ExecutionStatus
+from .forms import submit_analysis
+from .models import RNASeqModel, RNASeqExeDetail, RNASeqStepMetric
 
 
 class RNASeqAdminUpdateForm(AbstractAnalysisAdminUpdateForm):
@@ -27,3 +30,48 @@ class RNASeqModelAdmin(AbstractAnalysisAdmin):
     inlines = [
         RNASeqExeDetailInline,
     ]
+    actions = ['resume_analyses']
+
+    def resume_analyses(self, request, queryset):
+        """Re-submit failed analyses, skipping their completed steps."""
+        failed_jobs = queryset.filter(
+            execution_status=ExecutionStatus.FAILED.name
+        )
+        for job in failed_jobs:
+            submit_analysis(
+                job, request.build_absolute_uri(job.get_absolute_url())
+            )
+        num_resumed = len(failed_jobs)
+        self.message_user(
+            request,
+            ungettext(
+                '%(count)d failed analysis has been resumed.',
+                '%(count)d failed analyses have been resumed.',
+                num_resumed,
+            ) % {'count': num_resumed},
+            messages.SUCCESS,
+        )
+    resume_analyses.short_description = _('Resume selected failed analyses')
+
+
+@admin.register(RNASeqStepMetric)
+class RNASeqStepMetricAdmin(admin.ModelAdmin):
+
+    list_display = (
+        'step', 'analysis', 'returncode', 'wall_time',
+        'user_time', 'sys_time', 'max_rss_mb', 'date_finished',
+    )
+    list_filter = ('tool', 'returncode', 'date_finished')
+    search_fields = ('step', 'analysis__name')
+    readonly_fields = [
+        field.name for field in RNASeqStepMetric._meta.get_fields()
+    ]
+
+    def max_rss_mb(self, metric):
+        return '%.0f' % (metric.max_rss / 2**20)
+    max_rss_mb.short_description = _('Max RSS (MB)')
+    max_rss_mb.admin_order_field = 'max_rss'
+
+    def has_add_permission(self, request):
+        # Metrics are only recorded by the pipeline
+        return False
@@ -0,0 +1,226 @@
+"""Estimate the cost of an RNA-Seq analysis before running it.
+
+The wall time and the disk footprint are fitted by least squares over the
+previous successful analyses of the same genome reference and aligner,
+using the total FASTQ bytes and the number of samples as features. The peak
+memory is the largest peak RSS of a single step in those analyses. The
+STAR genome index attached in shared memory is counted in the peak RSS of
+every alignment, but is loaded only once for all of them, so it is left out
+of the peak memory of STAR.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import Avg, Count, Max
+
+from analyses.models import ExecutionStatus
+from .models import RNASeqModel, RNASeqStepMetric
+
+Estimate = namedtuple('Estimate', ['wall_time', 'memory', 'disk'])
+Estimate.__doc__ = """Predicted cost of an analysis.
+
+wall_time is in seconds, or None if there is no history to learn from.
+memory is the peak memory of a step and disk the size of the results, both
+in bytes.
+"""
+
+# Fewer analyses of the same genome reference than this and the history of
+# all genome references of the same aligner is used
+MIN_HISTORY = 5
+# Results are usually about twice the size of the FASTQs
+DEFAULT_DISK_RATIO = 2
+# Head room over the largest peak memory observed
+MEMORY_MARGIN = 1.1
+
+
+def fastq_bytes(experiment):
+    """Total uncompressed size of the data sources of an experiment.
+
+    The tools read compressed FASTQs decompressed, so their cost follows
+    the uncompressed size, estimated when the data sources were sniffed.
+    """
+    total = 0
+    for data_source in (
+        experiment.data_sources.select_related('owner').distinct()
+    ):
+        metadata = data_source.metadata or {}
+        if metadata.get('compression') and \
+                metadata.get('uncompressed_bytes'):
+            total += metadata['uncompressed_bytes']
+            continue
+        try:
+            total += data_source.full_file_path.stat().st_size
+        except OSError:
+            pass
+    return total
+
+
+def solve(matrix, vector):
+    """Solve a small linear system by Gaussian elimination.
+
+    Returns:
+        list of float: the solution, or None if the system is singular.
+    """
+    size = len(vector)
+    rows = [list(row) + [value] for row, value in zip(matrix, vector)]
+    for col in range(size):
+        pivot = max(range(col, size), key=lambda r: abs(rows[r][col]))
+        if abs(rows[pivot][col]) < 1e-12:
+            return None
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        for r in range(size):
+            if r == col:
+                continue
+            factor = rows[r][col] / rows[col][col]
+            rows[r] = [a - factor * b for a, b in zip(rows[r], rows[col])]
+    return [rows[r][size] / rows[r][r] for r in range(size)]
+
+
+def fit_linear(features, targets):
+    """Least squares fit of ``target = c0 + c1 * x1 + c2 * x2 + ...``.
+
+    Falls back to a ratio over the first feature when there are too few
+    or too similar observations for the full fit.
+
+    Args:
+        features (list of tuple): Feature values of each observation.
+        targets (list of float): Observed values.
+
+    Returns:
+        callable: Predict the target of new features, or None if there is
+        no observation at all.
+    """
+    if not targets:
+        return None
+    design = [(1.0, *map(float, x)) for x in features]
+    num_coefs = len(design[0])
+    coefs = None
+    if len(targets) >= num_coefs * 2:
+        normal_matrix = [
+            [sum(row[i] * row[j] for row in design) for j in range(num_coefs)]
+            for i in range(num_coefs)
+        ]
+        normal_vector = [
+            sum(row[i] * y for row, y in zip(design, targets))
+            for i in range(num_coefs)
+        ]
+        coefs = solve(normal_matrix, normal_vector)
+    if coefs is None:
+        total_x = sum(x[0] for x in features)
+        ratio = sum(targets) / total_x if total_x else 0
+        mean = sum(targets) / len(targets)
+        return lambda x: ratio * x[0] if ratio else mean
+
+    def predict(x):
+        return max(0.0, coefs[0] + sum(
+            c * float(v) for c, v in zip(coefs[1:], x)
+        ))
+    return predict
+
+
+def history(genome_reference, genome_aligner):
+    """Return previous successful analyses to learn the cost from."""
+    finished = RNASeqModel.objects.filter(
+        execution_status=ExecutionStatus.SUCCESSFUL.name,
+        genome_aligner=genome_aligner,
+        input_bytes__isnull=False,
+        result_bytes__isnull=False,
+        date_started__isnull=False,
+        date_finished__isnull=False,
+    ).annotate(
+        num_samples=Count(
+            'experiment__conditions__sample_name', distinct=True
+        )
+    ).order_by('-date_finished')
+    max_history = settings.BIOCLOUD_ESTIMATOR_HISTORY
+    same_genome = list(
+        finished.filter(genome_reference=genome_reference)[:max_history]
+    )
+    if len(same_genome) >= MIN_HISTORY:
+        return same_genome
+    return list(finished[:max_history])
+
+
+def peak_memory(analyses, default_memory, shared_index_bytes=0):
+    """Return the largest peak memory of a step of the analyses.
+
+    Args:
+        analyses (list of RNASeqModel): Analyses to learn from.
+        default_memory (int): Peak memory when there is no history.
+        shared_index_bytes (int): Size of the genome index shared by the
+            alignments, not counted in their peak memory.
+    """
+    peaks = (
+        RNASeqStepMetric.objects
+        .filter(analysis__in=analyses, returncode=0)
+        .order_by()
+        .values('tool')
+        .annotate(peak_rss=Max('max_rss'))
+    )
+    step_peaks = [
+        max(0, peak['peak_rss'] - shared_index_bytes)
+        if peak['tool'] == 'star' else peak['peak_rss']
+        for peak in peaks
+    ]
+    if not step_peaks:
+        return default_memory
+    return int(max(step_peaks) * MEMORY_MARGIN)
+
+
+def step_wall_times(genome_reference, genome_aligner):
+    """Return the mean wall time of each tool in previous analyses.
+
+    Returns:
+        dict: tool, such as ``star``, to its mean wall time in seconds.
+    """
+    analyses = history(genome_reference, genome_aligner)
+    return dict(
+        RNASeqStepMetric.objects
+        .filter(analysis__in=analyses, returncode=0)
+        .order_by()
+        .values_list('tool')
+        .annotate(Avg('wall_time'))
+    )
+
+
+def estimate(
+    genome_reference, genome_aligner, input_bytes, num_samples,
+    default_memory, shared_index_bytes=0,
+):
+    """Predict the cost of an analysis from the analyses run before.
+
+    Args:
+        genome_reference (GenomeReference): Genome of the analysis.
+        genome_aligner (str): Aligner of the analysis.
+        input_bytes (int): Total size of its FASTQs.
+        num_samples (int): Number of samples.
+        default_memory (int): Peak memory when there is no history.
+        shared_index_bytes (int): Size of the genome index the alignments
+            share in memory, 0 if each alignment loads its own.
+
+    Returns:
+        Estimate: predicted wall time, peak memory and disk footprint.
+    """
+    analyses = history(genome_reference, genome_aligner)
+    features = [
+        (analysis.input_bytes, analysis.num_samples)
+        for analysis in analyses
+    ]
+    x = (input_bytes, num_samples)
+
+    predict_wall_time = fit_linear(features, [
+        (analysis.date_finished - analysis.date_started).total_seconds()
+        for analysis in analyses
+    ])
+    wall_time = predict_wall_time(x) if predict_wall_time else None
+
+    predict_disk = fit_linear(
+        features, [analysis.result_bytes for analysis in analyses]
+    )
+    if predict_disk is None:
+        disk = input_bytes * DEFAULT_DISK_RATIO
+    else:
+        disk = int(predict_disk(x))
+
+    memory = peak_memory(analyses, default_memory, shared_index_bytes)
+    return Estimate(wall_time=wall_time, memory=memory, disk=disk)
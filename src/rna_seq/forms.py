@@ -1,9 +1,13 @@
+import shutil
+
 from crispy_forms.layout import Div, Field, Fieldset, HTML, Layout
 from django import forms
+from django.conf import settings
+from django.template.defaultfilters import filesizeformat
 from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
-from django_q.tasks import async
 
+from analyses import job_queue
 from analyses.forms import (
     AbstractAnalysisCreateForm,
     AnalysisCommonLayout,
@@ -11,7 +15,40 @@ from analyses.forms import (
     Include,
 )
 from analyses.models import ExecutionStatus, Report
+from analyses.resources import GB
+from users.storage import storage_left
+from .estimators import estimate, fastq_bytes
 from .models import RNASeqModel, RNASeqExeDetail
+from .tasks import (
+    default_step_memory, requested_resources, shared_index_bytes,
+    unverified_data_sources,
+)
+
+
+def submit_analysis(job, job_url, priority=0):
+    """Submit the pipeline of the analysis to the analysis queue.
+
+    Steps completed by a previous run of the same analysis are skipped,
+    so this also resumes a failed analysis.
+
+    Args:
+        job (RNASeqModel): The analysis to run.
+        job_url (str): Full URL of the analysis to notify the user.
+        priority (int): Priority of the analysis in the queue.
+    """
+    # Mark the analysis is now in queue
+    job.execution_status = ExecutionStatus.QUEUEING.name
+    job.save(update_fields=['execution_status'])
+    cores, memory = requested_resources(job)
+    job_queue.submit(
+        job,
+        'rna_seq.tasks.run_pipeline',
+        {'job_pk': job.pk, 'job_url': job_url},
+        cores=cores,
+        memory=memory,
+        disk=job.estimated_disk or 0,
+        priority=priority,
+    )
 
 
 class RNASeqCreateForm(AbstractAnalysisCreateForm):
@@ -30,6 +67,90 @@ class RNASeqCreateForm(AbstractAnalysisCreateForm):
             ))
         return aligner_choice
 
+    def clean(self):
+        """Reject analyses of unverified data sources, those whose results
+        cannot fit on the disk, or those exceeding the storage quota of the
+        user.
+
+        An analysis estimated to need more memory than the worker node has
+        is still accepted, as its steps are given the whole node instead,
+        but the user is warned once it is created.
+        """
+        cleaned_data = super().clean()
+        experiment = cleaned_data.get('experiment')
+        genome_reference = cleaned_data.get('genome_reference')
+        genome_aligner = cleaned_data.get('genome_aligner')
+        if not (experiment and genome_reference and genome_aligner):
+            return cleaned_data
+
+        unverified = unverified_data_sources(experiment)
+        if unverified.exists():
+            raise forms.ValidationError(
+                _(
+                    'Checksums of the data sources %(data_sources)s are '
+                    'not verified yet, or mismatch with the file content.'
+                ),
+                params={'data_sources': ', '.join(
+                    unverified.values_list('file_path', flat=True)
+                )},
+                code='data_sources_unverified',
+            )
+
+        input_bytes = fastq_bytes(experiment)
+        cost = estimate(
+            genome_reference, genome_aligner, input_bytes,
+            num_samples=max(1, len(experiment.sample_names)),
+            default_memory=default_step_memory(),
+            shared_index_bytes=shared_index_bytes(genome_reference),
+        )
+        node_memory = settings.BIOCLOUD_PIPELINE_MEMORY_GB * GB
+        memory = cost.memory
+        if memory > node_memory:
+            self.warnings.append(_(
+                'This analysis is estimated to need %(memory)s of memory, '
+                'more than the %(node_memory)s available. It may run '
+                'slowly or fail.'
+            ) % {
+                'memory': filesizeformat(cost.memory),
+                'node_memory': filesizeformat(node_memory),
+            })
+            memory = node_memory
+        free_disk = shutil.disk_usage(
+            str(settings.BIOCLOUD_RESULTS_DIR)
+        ).free
+        if cost.disk > free_disk:
+            raise forms.ValidationError(
+                _(
+                    'The results of this analysis are estimated to take '
+                    '%(disk)s, more than the %(free_disk)s of disk space left.'
+                ),
+                params={
+                    'disk': filesizeformat(cost.disk),
+                    'free_disk': filesizeformat(free_disk),
+                },
+            )
+        storage_left_bytes = storage_left(self._request.user)
+        if storage_left_bytes is not None and cost.disk > storage_left_bytes:
+            raise forms.ValidationError(
+                _(
+                    'The results of this analysis are estimated to take '
+                    '%(disk)s, more than the %(storage_left)s left in your '
+                    'storage quota.'
+                ),
+                params={
+                    'disk': filesizeformat(cost.disk),
+                    'storage_left': filesizeformat(
+                        max(0, storage_left_bytes)
+                    ),
+                },
+                code='storage_quota_exceeded',
+            )
+        self.instance.input_bytes = input_bytes
+        self.instance.estimated_wall_time = cost.wall_time
+        self.instance.estimated_memory = memory
+        self.instance.estimated_disk = cost.disk
+        return cleaned_data
+
     def save(self, commit=True):
         job = super().save(commit)
         if commit:
@@ -45,14 +166,7 @@ class RNASeqCreateForm(AbstractAnalysisCreateForm):
                 job.get_absolute_url()
             )
             # Submit new task
-            async(
-                'rna_seq.tasks.run_pipeline',
-                job_pk=job.pk,
-                job_url=job_url,
-            )
-            # Mark the analysis is now in queue
-            job.execution_status = ExecutionStatus.QUEUEING.name
-            job.save(update_fields=['execution_status'])
+            submit_analysis(job, job_url)
         return job
 
     @cached_property
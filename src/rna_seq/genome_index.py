@@ -0,0 +1,246 @@
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+from analyses.execution import run_command
+from analyses.resources import GB
+
+logger = logging.getLogger(__name__)
+
+# Files of a STAR index that are loaded into memory
+STAR_INDEX_FILES = ['Genome', 'SA', 'SAindex']
+
+
+def available_memory():
+    """Return the memory in bytes available to new processes."""
+    with open('/proc/meminfo') as f:
+        for line in f:
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) * 1024
+    raise OSError('Cannot read MemAvailable from /proc/meminfo')
+
+
+def pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class GenomeIndexManager:
+    def __init__(self, star_bin, state_dir, min_free_memory):
+        """Keep STAR genome indices resident in shared memory.
+
+        STAR can load a genome index into shared memory once and let every
+        later alignment attach to it (``--genomeLoad LoadAndKeep``)
+        instead of reading tens of GB from disk for each sample. The
+        manager tracks which jobs are using each resident index, across
+        all the worker processes of the node, in a state file guarded by
+        a file lock. Indices nobody uses stay resident for the next job,
+        and are unloaded from the least recently used when the node runs
+        short of memory.
+
+        Loading an index takes minutes, so it only holds a lock of that
+        index. Jobs using other indices are not blocked meanwhile.
+
+        Args:
+            star_bin (str): Path to the STAR executable.
+            state_dir (pathlib.Path): Folder of the state and lock files.
+                It must be shared by all worker processes of the node.
+            min_free_memory (int): Bytes of memory to keep available when
+                loading an index.
+        """
+        self.star_bin = star_bin
+        self.state_dir = Path(state_dir)
+        self.min_free_memory = min_free_memory
+        self.state_path = self.state_dir.joinpath('genome_index.json')
+        self.lock_path = self.state_dir.joinpath('genome_index.lock')
+        self._thread_lock = threading.Lock()
+        self._genome_thread_locks = {}
+
+    @contextmanager
+    def _locked_state(self):
+        """Yield the state dict, saving it back on exit."""
+        if not self.state_dir.exists():
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+        # flock is per open file, so threads of the same process need
+        # their own lock as well
+        with self._thread_lock, self.lock_path.open('a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    with self.state_path.open() as f:
+                        state = json.load(f)
+                except (OSError, ValueError):
+                    state = {}
+                self._prune_dead_holders(state)
+                yield state
+                tmp_path = self.state_path.with_suffix('.json.tmp')
+                with tmp_path.open('w') as f:
+                    json.dump(state, f)
+                tmp_path.rename(self.state_path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _genome_lock(self, genome_key):
+        """Hold the lock of a single genome index."""
+        with self._thread_lock:
+            thread_lock = self._genome_thread_locks.setdefault(
+                genome_key, threading.Lock()
+            )
+        if not self.state_dir.exists():
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+        lock_path = self.state_dir.joinpath('genome_index.%s.lock' % (
+            hashlib.sha1(genome_key.encode()).hexdigest()
+        ))
+        with thread_lock, lock_path.open('a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _prune_dead_holders(state):
+        # Holders of a crashed worker would keep the index forever
+        for entry in state.values():
+            entry['holders'] = [
+                holder for holder in entry['holders']
+                if pid_exists(holder[0])
+            ]
+
+    @staticmethod
+    def index_size(genome_dir):
+        return sum(
+            genome_dir.joinpath(name).stat().st_size
+            for name in STAR_INDEX_FILES
+            if genome_dir.joinpath(name).exists()
+        )
+
+    def _run_star(self, genome_dir, genome_load):
+        p = run_command(
+            [
+                self.star_bin,
+                '--genomeDir', str(genome_dir),
+                '--genomeLoad', genome_load,
+                '--outFileNamePrefix', str(self.state_dir) + '/',
+            ],
+            cwd=self.state_dir,
+            log_dir=self.state_dir,
+            log_name='star_genome_load',
+        )
+        return p.returncode
+
+    def _unload(self, state, genome_key):
+        """Remove an index from shared memory.
+
+        Returns:
+            bool: Whether the index has been removed. A failed removal is
+            kept in the state, as the index may still take memory.
+        """
+        logger.info('Unload genome index %s from shared memory' % genome_key)
+        returncode = self._run_star(Path(genome_key), 'Remove')
+        if returncode:
+            logger.error(
+                'Cannot unload genome index %s, STAR exited with %d'
+                % (genome_key, returncode)
+            )
+            return False
+        del state[genome_key]
+        return True
+
+    def _make_room(self, state, required_memory):
+        """Unload idle indices until the required memory is available."""
+        idle_indices = sorted(
+            (entry['last_used'], genome_key)
+            for genome_key, entry in state.items()
+            if not entry['holders']
+        )
+        for _, genome_key in idle_indices:
+            if available_memory() - required_memory >= self.min_free_memory:
+                break
+            self._unload(state, genome_key)
+
+    def unload_idle(self):
+        """Unload idle indices while the node is short of memory."""
+        with self._locked_state() as state:
+            self._make_room(state, 0)
+
+    def resident_indices(self):
+        with self._locked_state() as state:
+            return {
+                genome_key: len(entry['holders'])
+                for genome_key, entry in state.items()
+            }
+
+    @contextmanager
+    def attach(self, genome_dir):
+        """Make sure the index is resident while the block runs.
+
+        Yields:
+            bool: Whether the index is resident in shared memory. When it
+            is False, STAR should load the index privately instead.
+        """
+        genome_dir = Path(genome_dir)
+        genome_key = str(genome_dir.resolve())
+        holder = [os.getpid(), uuid.uuid4().hex]
+        # Jobs of the same genome wait for the one loading it
+        with self._genome_lock(genome_key):
+            with self._locked_state() as state:
+                resident = genome_key in state
+                if not resident:
+                    self._make_room(state, self.index_size(genome_dir))
+                else:
+                    state[genome_key]['holders'].append(holder)
+                    state[genome_key]['last_used'] = time.time()
+            if not resident:
+                logger.info(
+                    'Load genome index %s into shared memory' % genome_key
+                )
+                returncode = self._run_star(genome_dir, 'LoadAndExit')
+                if not returncode:
+                    with self._locked_state() as state:
+                        state[genome_key] = {
+                            'holders': [holder], 'last_used': time.time(),
+                        }
+                    resident = True
+        try:
+            yield resident
+        finally:
+            if resident:
+                with self._locked_state() as state:
+                    entry = state.get(genome_key)
+                    if entry is not None and holder in entry['holders']:
+                        entry['holders'].remove(holder)
+                        entry['last_used'] = time.time()
+                    self._make_room(state, 0)
+
+
+_genome_index_manager = None
+
+
+def get_genome_index_manager(star_bin):
+    """Return the genome index manager, or None if it is disabled."""
+    global _genome_index_manager
+    if not settings.BIOCLOUD_STAR_SHARED_GENOME:
+        return None
+    if _genome_index_manager is None:
+        _genome_index_manager = GenomeIndexManager(
+            star_bin,
+            settings.BIOCLOUD_GENOME_INDEX_STATE_DIR,
+            settings.BIOCLOUD_GENOME_INDEX_MIN_FREE_GB * GB,
+        )
+    return _genome_index_manager
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rna_seq', '0004_auto_20160713_0809'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RNASeqStepProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('step', models.CharField(max_length=256)),
+                ('stage', models.CharField(blank=True, max_length=32)),
+                ('percent_done', models.FloatField(blank=True, null=True)),
+                ('throughput', models.FloatField(blank=True, help_text='Reads processed per second', null=True)),
+                ('date_started', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('analysis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='step_progress', to='rna_seq.RNASeqModel')),
+            ],
+            options={
+                'verbose_name': 'RNA-Seq step progress',
+                'verbose_name_plural': 'RNA-Seq step progress',
+                'ordering': ('date_started',),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='rnaseqstepprogress',
+            unique_together=set([('analysis', 'step')]),
+        ),
+    ]
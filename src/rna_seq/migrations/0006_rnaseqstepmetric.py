@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 11:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rna_seq', '0005_rnaseqstepprogress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RNASeqStepMetric',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('step', models.CharField(help_text='Ex. star.sample_A', max_length=256)),
+                ('tool', models.CharField(db_index=True, max_length=64)),
+                ('command', models.TextField(blank=True)),
+                ('returncode', models.IntegerField()),
+                ('wall_time', models.FloatField(help_text='Seconds')),
+                ('user_time', models.FloatField(help_text='Seconds')),
+                ('sys_time', models.FloatField(help_text='Seconds')),
+                ('max_rss', models.BigIntegerField(help_text='Bytes')),
+                ('bytes_read', models.BigIntegerField()),
+                ('bytes_written', models.BigIntegerField()),
+                ('date_finished', models.DateTimeField(auto_now_add=True)),
+                ('analysis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='step_metrics', to='rna_seq.RNASeqModel')),
+            ],
+            options={
+                'verbose_name': 'RNA-Seq step metric',
+                'verbose_name_plural': 'RNA-Seq step metrics',
+                'ordering': ('-date_finished',),
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 11:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rna_seq', '0006_rnaseqstepmetric'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rnaseqmodel',
+            name='date_started',
+            field=models.DateTimeField(blank=True, default=None, editable=False, null=True, verbose_name='date started'),
+        ),
+        migrations.AddField(
+            model_name='rnaseqmodel',
+            name='input_bytes',
+            field=models.BigIntegerField(blank=True, editable=False, help_text='Total size of the FASTQs when submitted', null=True),
+        ),
+        migrations.AddField(
+            model_name='rnaseqmodel',
+            name='result_bytes',
+            field=models.BigIntegerField(blank=True, editable=False, help_text='Size of the results when finished', null=True),
+        ),
+        migrations.AddField(
+            model_name='rnaseqmodel',
+            name='estimated_wall_time',
+            field=models.FloatField(blank=True, editable=False, help_text='Seconds', null=True),
+        ),
+        migrations.AddField(
+            model_name='rnaseqmodel',
+            name='estimated_memory',
+            field=models.BigIntegerField(blank=True, editable=False, help_text='Bytes', null=True),
+        ),
+        migrations.AddField(
+            model_name='rnaseqmodel',
+            name='estimated_disk',
+            field=models.BigIntegerField(blank=True, editable=False, help_text='Bytes', null=True),
+        ),
+    ]
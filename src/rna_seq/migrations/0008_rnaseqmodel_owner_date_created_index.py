@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 12:05
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rna_seq', '0007_analysis_cost'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='rnaseqmodel',
+            index_together=set([('owner', 'date_created')]),
+        ),
+    ]
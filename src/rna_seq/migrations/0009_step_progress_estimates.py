@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 15:40
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rna_seq', '0008_rnaseqmodel_owner_date_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rnaseqstepprogress',
+            name='estimated_seconds',
+            field=models.FloatField(blank=True, help_text='Wall time of the step in previous analyses', null=True),
+        ),
+        migrations.AddField(
+            model_name='rnaseqstepprogress',
+            name='requires',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=256), blank=True, default=list, help_text='Steps that must end before this one starts', size=None),
+        ),
+        migrations.AlterField(
+            model_name='rnaseqstepprogress',
+            name='date_started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,9 +1,14 @@
+from datetime import timedelta
+
+from django.contrib.postgres.fields import ArrayField
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from analyses.models import AbstractAnalysisModel
 from analyses.fields import StageStatusField
 from analyses import pipelines
+from analyses.progress import estimate_remaining_seconds
 from analyses.tool_specs import ToolSpec, ToolSet
 from data_sources.models import DataSource
 
@@ -125,13 +130,48 @@ class RNASeqModel(AbstractAnalysisModel):
         ),
     )
 
+    # Cost of the analysis, see rna_seq.estimators
+    input_bytes = models.BigIntegerField(
+        blank=True, null=True, editable=False,
+        help_text=_('Total size of the FASTQs when submitted'),
+    )
+    result_bytes = models.BigIntegerField(
+        blank=True, null=True, editable=False,
+        help_text=_('Size of the results when finished'),
+    )
+    estimated_wall_time = models.FloatField(
+        blank=True, null=True, editable=False,
+        help_text=_('Seconds'),
+    )
+    estimated_memory = models.BigIntegerField(
+        blank=True, null=True, editable=False,
+        help_text=_('Bytes'),
+    )
+    estimated_disk = models.BigIntegerField(
+        blank=True, null=True, editable=False,
+        help_text=_('Bytes'),
+    )
+
     def get_absolute_url(self):
         from django.core.urlresolvers import reverse
         return reverse('rna_seq_detail', kwargs={'pk': str(self.id)})
 
+    @property
+    def estimated_duration(self):
+        if self.estimated_wall_time is None:
+            return None
+        return timedelta(seconds=round(self.estimated_wall_time))
+
+    def retention_policies(self):
+        """How long each kind of result is kept, see analyses.retention."""
+        from .retention import retention_policies
+        return retention_policies(self)
+
     class Meta:
         verbose_name = "RNA-Seq analysis"
         verbose_name_plural = "RNA-Seq analyses"
+        # For listing the analyses of a user page by page
+        index_together = [('owner', 'date_created')]
 
     def generate_analysis_info(self):
         # Get the analysis_info from base class
@@ -178,3 +218,87 @@ class RNASeqExeDetail(models.Model):
     class Meta:
         verbose_name = "RNA-Seq detail"
         verbose_name_plural = "RNA-Seq detail"
+
+
+class RNASeqStepProgress(models.Model):
+    """Latest progress of a pipeline step of a running analysis.
+
+    There is only one row per step of the pipeline, created when the
+    pipeline starts and updated in place while the step runs.
+    """
+    analysis = models.ForeignKey(RNASeqModel, related_name='step_progress')
+    step = models.CharField(max_length=256)
+    stage = models.CharField(max_length=32, blank=True)
+    requires = ArrayField(
+        models.CharField(max_length=256), default=list, blank=True,
+        help_text=_('Steps that must end before this one starts'),
+    )
+    percent_done = models.FloatField(null=True, blank=True)
+    throughput = models.FloatField(
+        null=True, blank=True,
+        help_text=_('Reads processed per second'),
+    )
+    estimated_seconds = models.FloatField(
+        null=True, blank=True,
+        help_text=_('Wall time of the step in previous analyses'),
+    )
+    date_started = models.DateTimeField(null=True, blank=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '%s of %s' % (self.step, self.analysis_id)
+
+    def remaining_seconds(self, now=None):
+        """Estimate the seconds left before the step ends, or None.
+
+        A running step is extrapolated from its progress, or from its wall
+        time in previous analyses if its progress is unknown. A step not
+        started yet takes its wall time in previous analyses.
+        """
+        if self.percent_done is not None and self.percent_done >= 100:
+            return 0
+        now = now or timezone.now()
+        if self.date_started is None:
+            return self.estimated_seconds
+        elapsed = (self.date_updated - self.date_started).total_seconds()
+        remaining = estimate_remaining_seconds(elapsed, self.percent_done)
+        if remaining is not None:
+            since_update = (now - self.date_updated).total_seconds()
+            return max(0, remaining - since_update)
+        if self.estimated_seconds is None:
+            return None
+        running = (now - self.date_started).total_seconds()
+        return max(0, self.estimated_seconds - running)
+
+    class Meta:
+        verbose_name = "RNA-Seq step progress"
+        verbose_name_plural = "RNA-Seq step progress"
+        unique_together = ('analysis', 'step')
+        ordering = ('date_started', )
+
+
+class RNASeqStepMetric(models.Model):
+    """Resource usage of a command run by the RNA-Seq pipeline."""
+    analysis = models.ForeignKey(RNASeqModel, related_name='step_metrics')
+    step = models.CharField(
+        max_length=256,
+        help_text=_('Ex. star.sample_A'),
+    )
+    tool = models.CharField(max_length=64, db_index=True)
+    command = models.TextField(blank=True)
+    returncode = models.IntegerField()
+    wall_time = models.FloatField(help_text=_('Seconds'))
+    user_time = models.FloatField(help_text=_('Seconds'))
+    sys_time = models.FloatField(help_text=_('Seconds'))
+    max_rss = models.BigIntegerField(help_text=_('Bytes'))
+    bytes_read = models.BigIntegerField()
+    bytes_written = models.BigIntegerField()
+    date_finished = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '%s of %s' % (self.step, self.analysis_id)
+
+    class Meta:
+        verbose_name = "RNA-Seq step metric"
+        verbose_name_plural = "RNA-Seq step metrics"
+        ordering = ('-date_finished', )
@@ -0,0 +1,74 @@
+"""Parse the progress the RNA-Seq tools log while they run."""
+import re
+
+from analyses.progress import StepProgress, last_percent, read_tail
+from data_sources.sniffers import SniffError, sniff_fastq
+
+# FastQC prints "Approx 45% complete for sample.fq" to stdout
+FASTQC_PERCENT_PATTERN = re.compile(r'Approx (\d+)% complete')
+# Cufflinks tools redraw a progress bar "[*****     ]  45%" on stderr
+CUFFLINKS_PERCENT_PATTERN = re.compile(r'\]\s+(\d+)%')
+
+
+def estimate_read_count(fastq_path):
+    """Estimate the number of reads of a FASTQ by the size of its records.
+
+    Returns:
+        int: Estimated number of reads, or None if the FASTQ cannot be read.
+    """
+    try:
+        return sniff_fastq(fastq_path)['estimated_reads']
+    except (OSError, SniffError):
+        return None
+
+
+def fastqc_progress(out_log_path):
+    percent_done = last_percent(
+        read_tail(out_log_path), pattern=FASTQC_PERCENT_PATTERN
+    )
+    if percent_done is None:
+        return None
+    return StepProgress(percent_done, None)
+
+
+def star_progress(progress_log_path, total_reads=None):
+    """Parse the ``Log.progress.out`` STAR updates every minute.
+
+    Each line after the header reads like::
+
+        Jul 13 09:10:43      7.2     1234567      202    93.1% ...
+
+    where the fourth and fifth columns are the speed (million reads per
+    hour) and the number of reads mapped so far.
+
+    Args:
+        progress_log_path (pathlib.Path): Path to ``Log.progress.out``.
+        total_reads (int): Estimated number of reads to map, if known.
+    """
+    lines = read_tail(progress_log_path).splitlines()
+    if any(line.startswith('ALL DONE') for line in lines):
+        return StepProgress(100.0, None)
+    for line in reversed(lines):
+        columns = line.split()
+        try:
+            speed = float(columns[3])
+            num_reads = int(columns[4])
+        except (IndexError, ValueError):
+            continue
+        throughput = speed * 1e6 / 3600
+        if total_reads:
+            # The estimate may be off, never claim the step is done
+            percent_done = min(99.0, 100.0 * num_reads / total_reads)
+        else:
+            percent_done = None
+        return StepProgress(percent_done, throughput)
+    return None
+
+
+def cufflinks_progress(err_log_path):
+    percent_done = last_percent(
+        read_tail(err_log_path), pattern=CUFFLINKS_PERCENT_PATTERN
+    )
+    if percent_done is None:
+        return None
+    return StepProgress(percent_done, None)
@@ -0,0 +1,62 @@
+"""Retention policies of the RNA-Seq results, see :mod:`analyses.retention`.
+"""
+from django.conf import settings
+
+from analyses.retention import (
+    RetentionDeferred, RetentionError, RetentionPolicy, delete_artifact,
+)
+from .tasks import SAMTOOLS_BIN, run_step_command
+
+
+def bam_to_cram(job, bam_path):
+    """Retention action compressing a sorted BAM to CRAM.
+
+    CRAM stores the reads by their difference to the genome, which takes
+    about half the space of BAM. The BAM and its index are removed once
+    the CRAM is indexed.
+
+    A BAM hardlinked from the stage cache is kept until the cache evicts
+    it, since removing it here frees nothing and the CRAM takes more space.
+    """
+    if bam_path.stat().st_nlink > 1:
+        raise RetentionDeferred('the BAM is shared with the stage cache')
+    genome_fa = job.genome_reference.full_dir_path.joinpath('genome.fa')
+    cram_path = bam_path.with_suffix('.cram')
+    sample_name = bam_path.parent.name
+    p = run_step_command(job, 'samtools_cram.%s' % sample_name, [
+        SAMTOOLS_BIN, 'view', '-C',
+        '-T', str(genome_fa),
+        '-o', str(cram_path),
+        str(bam_path),
+    ])
+    if not p.returncode:
+        p = run_step_command(
+            job, 'samtools_index.%s' % sample_name,
+            [SAMTOOLS_BIN, 'index', str(cram_path)],
+        )
+    if p.returncode:
+        raise RetentionError(
+            'samtools exited with %d, see its logs' % p.returncode
+        )
+    bam_index_path = bam_path.with_name(bam_path.name + '.bai')
+    if bam_index_path.exists():
+        bam_index_path.unlink()
+    bam_path.unlink()
+    return cram_path
+
+
+def retention_policies(job):
+    return [
+        # Differential expression is the final result
+        RetentionPolicy('kept', 'cuffdiff', None, 0, False),
+        RetentionPolicy(
+            'compressed to CRAM', 'STAR/*/Aligned.sortedByCoord.out.bam',
+            bam_to_cram, settings.BIOCLOUD_RETENTION_BAM_DAYS, False,
+        ),
+        # Only used to run Cuffdiff
+        RetentionPolicy('deleted', 'cuffquant/*', delete_artifact, 0, True),
+        RetentionPolicy(
+            'deleted', 'cufflinks/*', delete_artifact,
+            settings.BIOCLOUD_RETENTION_ASSEMBLY_DAYS, True,
+        ),
+    ]
@@ -1,15 +1,40 @@
 from collections import OrderedDict
-import subprocess as sp
+from contextlib import contextmanager
+from functools import partial
+import logging
 import os
 from pathlib import Path
+import tempfile
+from django.conf import settings
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.translation import ugettext, ugettext_lazy as _
 
-from .models import RNASeqModel
-from analyses.tasks import cd
+from .estimators import step_wall_times
+from .genome_index import get_genome_index_manager
+from .models import (
+    ALL_TOOLS_IN_USE, RNASeqModel, RNASeqStepMetric, RNASeqStepProgress,
+)
+from .progress import (
+    cufflinks_progress, estimate_read_count, fastqc_progress, star_progress,
+)
+from analyses.checkpoints import StepCheckpoint
+from analyses.dag import StepGraph
+from analyses.execution import run_command
+from analyses.progress import ProgressMonitor
+from analyses.resources import GB, ResourceBudget, get_pipeline_budget
+from analyses.stage_cache import (
+    StageOutputCache, get_stage_cache, tree_size,
+)
 from analyses.models import ExecutionStatus, StageStatus
+from data_sources.models import ChecksumStatus
+from data_sources.sniffers import compression_of
+from data_sources.utils import sequence_stem
+from users.models import StorageArea
+from users.storage import record_path_usage, record_usage
+
+logger = logging.getLogger(__name__)
 
 FASTQC_BIN = str(Path('~/miniconda3/envs/rnaseq/bin/fastqc').expanduser())
 STAR_BIN = str(Path('~/miniconda3/envs/rnaseq/bin/STAR').expanduser())
@@ -18,6 +43,23 @@ CUFFLINKS_BIN = str(Path('~/miniconda3/envs/rnaseq/bin/cufflinks').expanduser())
 CUFFMERGE_BIN = str(Path('~/miniconda3/envs/rnaseq/bin/cuffmerge').expanduser())
 CUFFQUANT_BIN = str(Path('~/miniconda3/envs/rnaseq/bin/cuffquant').expanduser())
 CUFFDIFF_BIN = str(Path('~/miniconda3/envs/rnaseq/bin/cuffdiff').expanduser())
+PIGZ_BIN = str(Path('~/miniconda3/envs/rnaseq/bin/pigz').expanduser())
+
+# Peak memory of each tool, used to size the concurrent steps
+FASTQC_MEMORY = 1 * GB
+STAR_MEMORY = 32 * GB
+# STAR attached to a genome index in shared memory only needs the memory
+# to sort its alignments
+STAR_BAM_SORT_MEMORY = 8 * GB
+STAR_SHARED_GENOME_MEMORY = STAR_BAM_SORT_MEMORY + 2 * GB
+CUFFLINKS_MEMORY = 4 * GB
+CUFFQUANT_MEMORY = 4 * GB
+CUFFDIFF_MEMORY = 8 * GB
+
+
+@contextmanager
+def nullcontext(value):
+    yield value
 
 
 def update_stage(job_detail, stage_name, new_status):
@@ -25,137 +67,321 @@ def update_stage(job_detail, stage_name, new_status):
     job_detail.save(update_fields=[stage_name])
 
 
-def run_fastqc(job: RNASeqModel, analysis_info):
-    # Ensure java is available, update the PATH environment variable here
+def stage_updated(job: RNASeqModel, job_detail, stage_name, new_status):
+    update_stage(job_detail, stage_name, new_status)
+    if new_status in (StageStatus.SUCCESSFUL, StageStatus.FAILED):
+        # Stage outputs are complete, account for the storage they take
+        record_path_usage(
+            job.owner, StorageArea.RESULTS, job.pk, job.result_dir,
+        )
+
+
+def create_step_progress(job: RNASeqModel, graph):
+    """Record all the steps of the pipeline before it runs.
+
+    Each step gets its wall time in previous analyses, so the time left of
+    the steps not started yet can be estimated.
+    """
+    wall_times = step_wall_times(job.genome_reference, job.genome_aligner)
+    RNASeqStepProgress.objects.bulk_create([
+        RNASeqStepProgress(
+            analysis=job, step=step.name, stage=step.stage or '',
+            requires=list(step.requires),
+            # Step names start with their tool, as the logs of the step
+            estimated_seconds=wall_times.get(step.name.split(':', 1)[0]),
+        )
+        for step in graph.steps.values()
+    ])
+
+
+def save_progress(job: RNASeqModel, step, progress):
+    RNASeqStepProgress.objects.update_or_create(
+        analysis=job, step=step.name,
+        defaults={
+            'stage': step.stage or '',
+            'percent_done': progress.percent_done,
+            'throughput': progress.throughput,
+            'date_started': step.date_started,
+        },
+    )
+
+
+def step_log_path(job: RNASeqModel, log_name, stream='out'):
+    """Path to the stdout (``out``) or stderr (``err``) log of a step."""
+    return job.result_dir.joinpath('logs', '%s.%s' % (log_name, stream))
+
+
+def run_step_command(job: RNASeqModel, log_name, args, env=None):
+    """Run a command of a pipeline step inside the analysis result folder.
+
+    The command output is logged under the ``logs`` folder of the results
+    and its resource usage is recorded as a :class:`RNASeqStepMetric`.
+    The log name should be ``<tool>`` or ``<tool>.<sample>``.
+    """
+    result = run_command(
+        args,
+        cwd=job.result_dir,
+        log_dir=job.result_dir.joinpath('logs'),
+        log_name=log_name,
+        env=env,
+    )
+    RNASeqStepMetric.objects.create(
+        analysis=job,
+        step=log_name,
+        tool=log_name.split('.', 1)[0],
+        command=' '.join(result.args),
+        returncode=result.returncode,
+        wall_time=result.wall_time,
+        user_time=result.user_time,
+        sys_time=result.sys_time,
+        max_rss=result.max_rss,
+        bytes_read=result.bytes_read,
+        bytes_written=result.bytes_written,
+    )
+    return result
+
+
+def get_rnaseq_env(*extra_paths):
+    """Environment with the RNA-Seq tools put in front of the PATH."""
     env = os.environ.copy()
-    env['PATH'] = str(Path('~/miniconda3/envs/rnaseq/bin').expanduser()) + ':' + env['PATH']
-
-    data_sources = analysis_info['data_sources']
-    with cd(str(job.result_dir)):
-        for ds in data_sources:
-            ds_pth, ds_info = next(iter(ds.items()))
-            ds_pth = Path(ds_pth)
-            ds_dir = Path('fastqc/{}'.format(ds_pth.stem))
-            if not ds_dir.exists():
-                ds_dir.mkdir()
-            # Run FastQC
-            p = sp.run([
-                FASTQC_BIN,
-                '-o', str(ds_dir),
-                str(ds_pth)
-            ], env=env)
-            if p.returncode:
-                return p.returncode
-    return 0
-
-
-def run_star(job: RNASeqModel, analysis_info, data_source_mapping):
-    # Get genome annotation
-    genome_root = job.genome_reference.full_dir_path
-    genes_gtf = genome_root.joinpath('genes.gtf')
-    sjdb_out = genome_root.joinpath('sjdbList.out.tab')
-    # Iterate each sample under all conditions
+    env['PATH'] = ':'.join([
+        str(Path('~/miniconda3/envs/rnaseq/bin').expanduser()),
+        *extra_paths,
+        env['PATH'],
+    ])
+    return env
+
+
+def get_samples(analysis_info):
+    """Return the samples of each condition.
+
+    Returns:
+        OrderedDict: condition name to a list of (sample name, FASTQ names)
+    """
+    conditions = OrderedDict()
     for condition in analysis_info['conditions']:
         cond, samples = next(iter(condition.items()))
-        for sample in samples:
-            sample_name, fastqs = next(iter(sample.items()))
-            fastq_full_pths = [
-                data_source_mapping[fastq]['path']
-                for fastq in fastqs
-            ]
-            sample_dir = job.result_dir.joinpath('STAR', sample_name)
-            if not sample_dir.exists():
-                sample_dir.mkdir()
-            with cd(str(job.result_dir)):
-                # Run STAR
-                p = sp.run([
-                    STAR_BIN,
-                    '--genomeDir', str(genome_root),
-                    '--sjdbOverhang', '100',
-                    '--sjdbGTFfile', str(genes_gtf),
-                    '--sjdbFileChrStartEnd', str(sjdb_out),
-                    '--readFilesIn', *fastq_full_pths,
-                    '--runThreadN', '4',
-                    '--outSAMstrandField', 'intronMotif',
-                    '--outFilterIntronMotifs', 'RemoveNoncanonical',
-                    '--outSAMtype', 'BAM', 'SortedByCoordinate',
-                    '--outFileNamePrefix', str(sample_dir) + '/',
-                ])
-                if p.returncode:
-                    return p.returncode
-
-                # Run samtools index
-                for fastq_pth in fastq_full_pths:
-                    sp.run([SAMTOOLS_BIN, 'index', fastq_pth])
-    return 0
-
-
-def run_cufflinks(job: RNASeqModel, analysis_info):
-    # Get genome annotation
-    genome_root = job.genome_reference.full_dir_path
+        conditions[cond] = [
+            next(iter(sample.items())) for sample in samples
+        ]
+    return conditions
+
+
+def sample_bam_path(job: RNASeqModel, sample_name):
+    return job.result_dir.joinpath(
+        'STAR', sample_name, 'Aligned.sortedByCoord.out.bam'
+    )
+
+
+def fastqc_dir_path(job: RNASeqModel, ds_pth):
+    return job.result_dir.joinpath('fastqc', sequence_stem(ds_pth))
+
+
+def run_fastqc(job: RNASeqModel, ds_pth, env):
+    ds_pth = Path(ds_pth)
+    ds_dir = fastqc_dir_path(job, ds_pth)
+    if not ds_dir.exists():
+        ds_dir.mkdir()
+    if ds_pth.suffix != '.bgz':
+        # Run FastQC
+        p = run_step_command(job, 'fastqc.%s' % ds_pth.name, [
+            FASTQC_BIN,
+            '-o', str(ds_dir),
+            str(ds_pth)
+        ], env=env)
+        return p.returncode
+
+    # FastQC reads gzip files by their suffix only, and bgzip files are gzip
+    # files. The .gz link is kept out of the result folder, or it would be
+    # served, cached and checksummed as an output.
+    gz_name = ds_pth.with_suffix('.gz').name
+    stale_link = ds_dir.joinpath(gz_name)
+    if stale_link.is_symlink():
+        stale_link.unlink()  # Left by an earlier version
+    with tempfile.TemporaryDirectory(prefix='fastqc-') as link_dir:
+        input_pth = Path(link_dir, gz_name)
+        input_pth.symlink_to(ds_pth)
+        p = run_step_command(job, 'fastqc.%s' % ds_pth.name, [
+            FASTQC_BIN,
+            '-o', str(ds_dir),
+            str(input_pth)
+        ], env=env)
+    return p.returncode
+
+
+# STAR options of the alignments, besides the genome and the reads
+STAR_ALIGN_ARGS = [
+    '--outSAMstrandField', 'intronMotif',
+    '--outFilterIntronMotifs', 'RemoveNoncanonical',
+    '--outSAMtype', 'BAM', 'SortedByCoordinate',
+]
+
+
+def star_junction_args(genome_root):
+    """Return STAR arguments inserting the annotated junctions on the fly."""
     genes_gtf = genome_root.joinpath('genes.gtf')
+    sjdb_out = genome_root.joinpath('sjdbList.out.tab')
+    return [
+        '--sjdbOverhang', '100',
+        '--sjdbGTFfile', str(genes_gtf),
+        '--sjdbFileChrStartEnd', str(sjdb_out),
+    ]
 
-    # Get all samples
-    sample_names = []
-    for condition in analysis_info['conditions']:
-        cond, samples = next(iter(condition.items()))
-        for sample in samples:
-            sample_name, _ = next(iter(sample.items()))
-            sample_names.append(sample_name)
 
-    for sample_name in sample_names:
-        sample_dir = job.result_dir.joinpath('cufflinks', sample_name)
-        sample_bam = job.result_dir.joinpath('STAR', sample_name, 'Aligned.sortedByCoord.out.bam')
-        if not sample_dir.exists():
-            sample_dir.mkdir()
-        with cd(str(job.result_dir)):
-            # Run Cufflinks
-            p = sp.run([
-                CUFFLINKS_BIN,
-                '-p', '4',
-                '-o', str(sample_dir),
-                '--library-type', 'fr-firststrand',
-                '--GTF', str(genes_gtf),
-                '--no-update-check',
-                str(sample_bam)
+def star_genome_args(genome_root, shared_genome, insert_junctions=None):
+    """Return STAR arguments of the genome index and its annotation.
+
+    Args:
+        genome_root (pathlib.Path): Folder of the genome index.
+        shared_genome (bool): Attach to the index in shared memory.
+        insert_junctions (bool): Insert the annotated junctions on the fly,
+            by default unless the index is shared. Otherwise only the
+            junctions already in the index (sjdbList.out.tab) are used.
+    """
+    if insert_junctions is None:
+        insert_junctions = not shared_genome
+    args = ['--genomeDir', str(genome_root)]
+    if shared_genome:
+        # Junctions cannot be inserted on the fly into a genome in shared
+        # memory
+        args += [
+            '--genomeLoad', 'LoadAndKeep',
+            '--limitBAMsortRAM', str(STAR_BAM_SORT_MEMORY),
+        ]
+    if insert_junctions:
+        args += star_junction_args(genome_root)
+    return args
+
+
+def star_cache_parameters(job: RNASeqModel):
+    """Return the parameters of an alignment changing its outputs.
+
+    They make the stage cache key of the alignment, so alignments with
+    another genome load mode or annotation do not share their outputs.
+    """
+    genome_root = job.genome_reference.full_dir_path
+    shared_genome = get_genome_index_manager(STAR_BIN) is not None
+    return {
+        'genome_reference': job.genome_reference.identifier,
+        'genome_load': 'LoadAndKeep' if shared_genome else 'NoSharedMemory',
+        'junction_args': (
+            [] if shared_genome else star_junction_args(genome_root)
+        ),
+        'align_args': STAR_ALIGN_ARGS,
+    }
+
+
+def read_files_command(fastq_full_pths):
+    """Return the STAR arguments to decompress the FASTQs of a sample.
+
+    Compressed FASTQs are streamed into STAR by pigz, which decompresses
+    in separate threads, or by gzip if pigz is not installed.
+
+    Raises:
+        ValueError: Compressed and uncompressed FASTQs are mixed.
+    """
+    compressions = {compression_of(pth) for pth in fastq_full_pths}
+    if compressions == {''}:
+        return []
+    if '' in compressions:
+        raise ValueError(
+            'Cannot align compressed and uncompressed FASTQs together: %s'
+            % ', '.join(str(pth) for pth in fastq_full_pths)
+        )
+    decompressor = PIGZ_BIN if Path(PIGZ_BIN).exists() else 'gzip'
+    return ['--readFilesCommand', decompressor, '-dc']
+
+
+def run_star(
+    job: RNASeqModel, sample_name, fastq_full_pths, threads=4, budget=None,
+):
+    """Align the reads of a sample by STAR.
+
+    When the genome index should be shared but cannot be loaded into shared
+    memory, STAR loads it privately. The step only reserved the memory to
+    sort its reads, so the memory of the whole index is reserved from the
+    budget too, or the step fails if it is not available.
+    """
+    genome_root = job.genome_reference.full_dir_path
+    sample_dir = job.result_dir.joinpath('STAR', sample_name)
+    if not sample_dir.exists():
+        sample_dir.mkdir()
+    genome_index_manager = get_genome_index_manager(STAR_BIN)
+    if genome_index_manager is None:
+        attached_genome = nullcontext(False)
+    else:
+        attached_genome = genome_index_manager.attach(genome_root)
+    with attached_genome as shared_genome:
+        private_memory = 0
+        if genome_index_manager is not None and not shared_genome:
+            private_memory = STAR_MEMORY - STAR_SHARED_GENOME_MEMORY
+            # Waiting here could deadlock, as every waiting alignment
+            # holds the memory of its own step
+            if budget is not None and \
+                    not budget.try_acquire(0, private_memory):
+                logger.error(
+                    'No memory left to load genome index %s privately for '
+                    'sample %s' % (genome_root, sample_name)
+                )
+                return 1
+        # Run STAR. When the index cannot be shared, it is loaded privately
+        # but keeps the junctions of the index, so the alignments match
+        # the stage cache key (see star_cache_parameters)
+        try:
+            p = run_step_command(job, 'star.%s' % sample_name, [
+                STAR_BIN,
+                *star_genome_args(
+                    genome_root, shared_genome,
+                    insert_junctions=genome_index_manager is None,
+                ),
+                '--readFilesIn', *fastq_full_pths,
+                *read_files_command(fastq_full_pths),
+                '--runThreadN', str(threads),
+                *STAR_ALIGN_ARGS,
+                '--outFileNamePrefix', str(sample_dir) + '/',
             ])
-            if p.returncode:
-                return p.returncode
-    return 0
+        finally:
+            if private_memory and budget is not None:
+                budget.release(0, private_memory)
+    if p.returncode:
+        return p.returncode
+
+    # Run samtools index on the sorted alignment
+    p = run_step_command(
+        job, 'samtools_index.%s' % sample_name,
+        [SAMTOOLS_BIN, 'index', str(sample_bam_path(job, sample_name))],
+    )
+    return p.returncode
 
 
-def run_cuffdiff(job: RNASeqModel, analysis_info):
+def run_cufflinks(job: RNASeqModel, sample_name, threads=4):
     # Get genome annotation
     genome_root = job.genome_reference.full_dir_path
     genes_gtf = genome_root.joinpath('genes.gtf')
-    genome_fa = genome_root.joinpath('genome.fa')
 
-    # Get all samples and conditions
-    sample_names = []
-    conditions = OrderedDict()
-    for condition in analysis_info['conditions']:
-        cond, samples = next(iter(condition.items()))
-        conditions[cond] = []
-        for sample in samples:
-            sample_name, _ = next(iter(sample.items()))
-            sample_names.append(sample_name)
-            conditions[cond].append(sample_name)
+    sample_dir = job.result_dir.joinpath('cufflinks', sample_name)
+    if not sample_dir.exists():
+        sample_dir.mkdir()
+    # Run Cufflinks
+    p = run_step_command(job, 'cufflinks.%s' % sample_name, [
+        CUFFLINKS_BIN,
+        '-p', str(threads),
+        '-o', str(sample_dir),
+        '--library-type', 'fr-firststrand',
+        '--GTF', str(genes_gtf),
+        '--no-update-check',
+        str(sample_bam_path(job, sample_name))
+    ])
+    return p.returncode
 
-    # Result folders
-    cuffmerge_dir = job.result_dir.joinpath('cuffmerge')
-    cuffquant_dir = job.result_dir.joinpath('cuffquant')
-    cuffdiff_dir = job.result_dir.joinpath('cuffdiff')
 
-    # Since Cufflinks-related tools call external command,
-    # update the PATH environment variable here
-    env = os.environ.copy()
-    env['PATH'] = (
-        str(Path('~/miniconda3/envs/rnaseq/bin').expanduser()) +
-        ':/usr/bin:' +  # Fix cuffmerge require /usr/bin/sort command
-        env['PATH']
-    )
+def run_cuffmerge(job: RNASeqModel, sample_names, env, threads=4):
+    # Get genome annotation
+    genome_root = job.genome_reference.full_dir_path
+    genes_gtf = genome_root.joinpath('genes.gtf')
+    genome_fa = genome_root.joinpath('genome.fa')
+    cuffmerge_dir = job.result_dir.joinpath('cuffmerge')
 
-    # Cuffmerge
     # generate the gtf list
     merged_gtf = cuffmerge_dir.joinpath('assembly_GTF_list.txt')
     with merged_gtf.open('w') as out:
@@ -165,35 +391,45 @@ def run_cuffdiff(job: RNASeqModel, analysis_info):
                 file=out
             )
     # Run Cuffmerge
-    with cd(str(job.result_dir)):
-        sp.run([
-            CUFFMERGE_BIN,
-            '-p', '4',
-            '-o', str(cuffmerge_dir),
-            '-g', str(genes_gtf),
-            '-s', str(genome_fa),
-            str(merged_gtf),
-        ], env=env)
-
+    p = run_step_command(job, 'cuffmerge', [
+        CUFFMERGE_BIN,
+        '-p', str(threads),
+        '-o', str(cuffmerge_dir),
+        '-g', str(genes_gtf),
+        '-s', str(genome_fa),
+        str(merged_gtf),
+    ], env=env)
+    return p.returncode
+
+
+def run_cuffquant(job: RNASeqModel, sample_name, env, threads=4):
+    cuffmerge_merged_gtf = job.result_dir.joinpath('cuffmerge', 'merged.gtf')
+    sample_dir = job.result_dir.joinpath('cuffquant', sample_name)
+    if not sample_dir.exists():
+        sample_dir.mkdir()
     # Run Cuffquant
-    cuffmerge_merged_gtf = cuffmerge_dir.joinpath('merged.gtf')
-    with cd(str(job.result_dir)):
-        for sample_name in sample_names:
-            sample_dir = cuffquant_dir.joinpath(sample_name)
-            sample_bam = job.result_dir.joinpath('STAR', sample_name, 'Aligned.sortedByCoord.out.bam')
-            if not sample_dir.exists():
-                sample_dir.mkdir()
-            sp.run([
-                CUFFQUANT_BIN,
-                '-p', '4',
-                '--library-type', 'fr-firststrand',
-                '--no-update-check',
-                '-o', str(sample_dir),
-                str(cuffmerge_merged_gtf),
-                str(sample_bam)
-            ], env=env)
-
-    # Run Cuffdiff
+    p = run_step_command(job, 'cuffquant.%s' % sample_name, [
+        CUFFQUANT_BIN,
+        '-p', str(threads),
+        '--library-type', 'fr-firststrand',
+        '--no-update-check',
+        '-o', str(sample_dir),
+        str(cuffmerge_merged_gtf),
+        str(sample_bam_path(job, sample_name))
+    ], env=env)
+    return p.returncode
+
+
+def run_cuffdiff(job: RNASeqModel, conditions, env, threads=4):
+    """Run Cuffdiff over the quantified samples.
+
+    Args:
+        conditions (OrderedDict): condition name to its sample names
+    """
+    cuffmerge_merged_gtf = job.result_dir.joinpath('cuffmerge', 'merged.gtf')
+    cuffquant_dir = job.result_dir.joinpath('cuffquant')
+    cuffdiff_dir = job.result_dir.joinpath('cuffdiff')
+
     # TODO: support more than 2 conditions
     labels = ','.join(conditions.keys())
     samples_per_condition = [
@@ -203,24 +439,342 @@ def run_cuffdiff(job: RNASeqModel, analysis_info):
         )
         for cond, sample_names in conditions.items()
     ]
-    with cd(str(job.result_dir)):
-        sp.run([
-            CUFFDIFF_BIN,
-            '-p', '4',
-            '-L', labels,
-            '-o', str(cuffdiff_dir),
-            '--library-type', 'fr-firststrand',
-            '--no-update-check',
-            str(cuffmerge_merged_gtf),
-            *samples_per_condition,
-        ], env=env)
-    return 0
+    p = run_step_command(job, 'cuffdiff', [
+        CUFFDIFF_BIN,
+        '-p', str(threads),
+        '-L', labels,
+        '-o', str(cuffdiff_dir),
+        '--library-type', 'fr-firststrand',
+        '--no-update-check',
+        str(cuffmerge_merged_gtf),
+        *samples_per_condition,
+    ], env=env)
+    return p.returncode
+
+
+def tool_version(tool_name):
+    return ALL_TOOLS_IN_USE.each_per_name[tool_name].db_name
+
+
+def checkpointed(
+    job: RNASeqModel, step_name, func, inputs, outputs, **params
+):
+    """Skip the step when a previous run of it is still up to date.
+
+    See :class:`analyses.checkpoints.StepCheckpoint` for the arguments.
+    """
+    checkpoint = StepCheckpoint(
+        job.result_dir.joinpath('.manifests'), step_name,
+        inputs=inputs, outputs=outputs, parameters=params,
+    )
+    return checkpoint.wrap(func)
+
+
+def cached(func, key, output_dir):
+    """Reuse outputs of the same step computed by any other analysis."""
+    stage_cache = get_stage_cache()
+    if stage_cache is None:
+        return func
+    return stage_cache.wrap(func, key, output_dir)
+
+
+def cache_key(tool, parameters, input_checksums):
+    """Return the stage cache key, or None if any input checksum is unknown.
+    """
+    if not all(input_checksums):
+        return None
+    return StageOutputCache.make_key(tool, parameters, input_checksums)
+
+
+def build_pipeline_graph(
+    job: RNASeqModel, analysis_info, data_source_mapping, budget,
+):
+    """Model every stage and per-sample step as a node of a StepGraph.
+
+    FastQC does not depend on anything, Cufflinks of a sample starts once
+    its alignment is done, and Cuffquant of a sample waits for both its
+    alignment and the Cuffmerge of all assemblies.
+
+    Per-sample steps are sized by the budget so that running as many
+    samples at once as the memory allows uses all the cores.
+
+    Every step is checkpointed, so steps that completed in a previous run
+    of the same analysis are not run again. FastQC, STAR and Cufflinks
+    steps also reuse the outputs of identical steps of other analyses.
+    """
+    graph = StepGraph()
+    result_dir = job.result_dir
+    genome_root = job.genome_reference.full_dir_path
+    conditions = get_samples(analysis_info)
+    # A sample may appear under multiple conditions, align it only once
+    sample_fastqs = OrderedDict()
+    sample_checksums = {}
+    for samples in conditions.values():
+        for sample_name, fastqs in samples:
+            sample_fastqs[sample_name] = [
+                data_source_mapping[fastq]['path'] for fastq in fastqs
+            ]
+            sample_checksums[sample_name] = [
+                data_source_mapping[fastq]['checksum'] for fastq in fastqs
+            ]
+    sample_names = list(sample_fastqs.keys())
+
+    # Stage QC:
+    if job.quality_check:
+        qc_env = get_rnaseq_env()  # Ensure java is available
+        for data_source in analysis_info['data_sources']:
+            ds_pth, ds_info = next(iter(data_source.items()))
+            step_name = 'fastqc:%s' % Path(ds_pth).name
+            fastqc_dir = fastqc_dir_path(job, ds_pth)
+            graph.add_step(
+                step_name,
+                checkpointed(
+                    job, step_name,
+                    cached(
+                        partial(run_fastqc, job, ds_pth, qc_env),
+                        cache_key(
+                            tool_version('FastQC'), {}, [ds_info['checksum']]
+                        ),
+                        fastqc_dir,
+                    ),
+                    inputs=[ds_pth],
+                    outputs=[fastqc_dir],
+                    tool=tool_version('FastQC'),
+                ),
+                stage='stage_qc',
+                cores=1, memory=FASTQC_MEMORY,
+                progress=partial(
+                    fastqc_progress,
+                    step_log_path(job, 'fastqc.%s' % Path(ds_pth).name),
+                ),
+            )
+
+    # Stage Alignment:
+    alignment_keys = {
+        sample_name: cache_key(
+            job.genome_aligner,
+            star_cache_parameters(job),
+            sample_checksums[sample_name],
+        )
+        for sample_name in sample_names
+    }
+    if job.genome_aligner.startswith('STAR'):
+        if get_genome_index_manager(STAR_BIN) is None:
+            star_memory = STAR_MEMORY
+        else:
+            # The genome index is loaded once and shared by all samples
+            star_memory = STAR_SHARED_GENOME_MEMORY
+        star_threads = budget.split(len(sample_names), star_memory)[1]
+        for sample_name, fastq_full_pths in sample_fastqs.items():
+            step_name = 'star:%s' % sample_name
+            graph.add_step(
+                step_name,
+                checkpointed(
+                    job, step_name,
+                    cached(
+                        partial(
+                            run_star, job, sample_name, fastq_full_pths,
+                            threads=star_threads, budget=budget,
+                        ),
+                        alignment_keys[sample_name],
+                        result_dir.joinpath('STAR', sample_name),
+                    ),
+                    inputs=[*fastq_full_pths, genome_root],
+                    outputs=[result_dir.joinpath('STAR', sample_name)],
+                    tool=job.genome_aligner,
+                    genome_reference=job.genome_reference.identifier,
+                ),
+                stage='stage_alignment',
+                cores=star_threads, memory=star_memory,
+                progress=partial(
+                    star_progress,
+                    result_dir.joinpath(
+                        'STAR', sample_name, 'Log.progress.out'
+                    ),
+                    # Paired-end reads are counted once per pair
+                    total_reads=estimate_read_count(fastq_full_pths[0]),
+                ),
+            )
+    else:
+        # Tophat is not supported
+        for sample_name in sample_names:
+            graph.add_step(
+                'star:%s' % sample_name, lambda: 1,
+                stage='stage_alignment',
+            )
+
+    # Stage Cufflinks:
+    cufflinks_threads = budget.split(len(sample_names), CUFFLINKS_MEMORY)[1]
+    for sample_name in sample_names:
+        step_name = 'cufflinks:%s' % sample_name
+        graph.add_step(
+            step_name,
+            checkpointed(
+                job, step_name,
+                cached(
+                    partial(
+                        run_cufflinks, job, sample_name,
+                        threads=cufflinks_threads,
+                    ),
+                    # Alignment of the same inputs gives the same BAM
+                    cache_key(
+                        tool_version('Cufflinks'),
+                        {'genome_reference': job.genome_reference.identifier},
+                        [alignment_keys[sample_name]],
+                    ),
+                    result_dir.joinpath('cufflinks', sample_name),
+                ),
+                inputs=[sample_bam_path(job, sample_name)],
+                outputs=[result_dir.joinpath('cufflinks', sample_name)],
+                tool=tool_version('Cufflinks'),
+                genome_reference=job.genome_reference.identifier,
+            ),
+            requires=['star:%s' % sample_name],
+            stage='stage_cufflinks',
+            cores=cufflinks_threads, memory=CUFFLINKS_MEMORY,
+            progress=partial(
+                cufflinks_progress,
+                step_log_path(job, 'cufflinks.%s' % sample_name, 'err'),
+            ),
+        )
+
+    # Stage Cuffdiff:
+    # Since Cufflinks-related tools call external command,
+    # update the PATH environment variable here
+    cuff_env = get_rnaseq_env(
+        '/usr/bin'  # Fix cuffmerge require /usr/bin/sort command
+    )
+    graph.add_step(
+        'cuffmerge',
+        checkpointed(
+            job, 'cuffmerge',
+            partial(
+                run_cuffmerge, job, sample_names, cuff_env,
+                threads=budget.cores,
+            ),
+            inputs=[
+                result_dir.joinpath(
+                    'cufflinks', sample_name, 'transcripts.gtf'
+                )
+                for sample_name in sample_names
+            ],
+            outputs=[result_dir.joinpath('cuffmerge')],
+            tool=tool_version('Cufflinks'),
+            genome_reference=job.genome_reference.identifier,
+        ),
+        requires=['cufflinks:%s' % sample_name for sample_name in sample_names],
+        stage='stage_cuffdiff',
+        cores=budget.cores, memory=CUFFLINKS_MEMORY,
+    )
+    cuffquant_threads = budget.split(len(sample_names), CUFFQUANT_MEMORY)[1]
+    for sample_name in sample_names:
+        step_name = 'cuffquant:%s' % sample_name
+        graph.add_step(
+            step_name,
+            checkpointed(
+                job, step_name,
+                partial(
+                    run_cuffquant, job, sample_name, cuff_env,
+                    threads=cuffquant_threads,
+                ),
+                inputs=[
+                    result_dir.joinpath('cuffmerge', 'merged.gtf'),
+                    sample_bam_path(job, sample_name),
+                ],
+                outputs=[result_dir.joinpath('cuffquant', sample_name)],
+                tool=tool_version('Cufflinks'),
+            ),
+            requires=['cuffmerge', 'star:%s' % sample_name],
+            stage='stage_cuffdiff',
+            cores=cuffquant_threads, memory=CUFFQUANT_MEMORY,
+            progress=partial(
+                cufflinks_progress,
+                step_log_path(job, 'cuffquant.%s' % sample_name, 'err'),
+            ),
+        )
+    condition_samples = OrderedDict(
+        (cond, [sample_name for sample_name, _ in samples])
+        for cond, samples in conditions.items()
+    )
+    graph.add_step(
+        'cuffdiff',
+        checkpointed(
+            job, 'cuffdiff',
+            partial(
+                run_cuffdiff, job, condition_samples, cuff_env,
+                threads=budget.cores,
+            ),
+            inputs=[result_dir.joinpath('cuffquant')],
+            outputs=[result_dir.joinpath('cuffdiff')],
+            tool=tool_version('Cufflinks'),
+            conditions=list(condition_samples.items()),
+        ),
+        requires=['cuffquant:%s' % sample_name for sample_name in sample_names],
+        stage='stage_cuffdiff',
+        cores=budget.cores, memory=CUFFDIFF_MEMORY,
+        progress=partial(
+            cufflinks_progress, step_log_path(job, 'cuffdiff', 'err'),
+        ),
+    )
+    return graph
+
+
+def unverified_data_sources(experiment):
+    """Return the data sources whose checksum is not verified yet."""
+    return experiment.data_sources.exclude(
+        checksum_status=ChecksumStatus.VERIFIED.name
+    ).distinct()
+
+
+def default_step_memory():
+    """Peak memory of the largest step when there is no history."""
+    if get_genome_index_manager(STAR_BIN) is None:
+        return STAR_MEMORY
+    return STAR_SHARED_GENOME_MEMORY
 
 
-def run_pipeline(job_pk, job_url):
+def shared_index_bytes(genome_reference):
+    """Size of the genome index the alignments share in memory.
+
+    Returns 0 when each alignment loads the index by itself.
+    """
+    genome_index_manager = get_genome_index_manager(STAR_BIN)
+    if genome_index_manager is None:
+        return 0
+    return genome_index_manager.index_size(genome_reference.full_dir_path)
+
+
+def requested_resources(job: RNASeqModel):
+    """Return the cores and memory to reserve in the queue for the job."""
+    num_samples = max(1, len(job.experiment.sample_names))
+    step_memory = job.estimated_memory or default_step_memory()
+    if get_genome_index_manager(STAR_BIN) is None:
+        memory = step_memory
+    else:
+        # Alignments of all samples run at once, sharing the genome index
+        # loaded once. The step memory does not include the index.
+        memory = (
+            shared_index_bytes(job.genome_reference) +
+            step_memory * num_samples
+        )
+    return 4 * num_samples, memory
+
+
+def run_pipeline(job_pk, job_url, cores=None, memory=None):
+    """Run the RNA-Seq pipeline of an analysis.
+
+    Args:
+        job_pk (int): Primary key of the analysis.
+        job_url (str): Full URL of the analysis to notify the user.
+        cores (int): CPU cores reserved for the analysis by the queue.
+            Use the budget of the whole worker process if not given.
+        memory (int): Memory in bytes reserved for the analysis by the
+            queue.
+    """
     job = RNASeqModel.objects.get(pk=job_pk)
     job_detail = job.execution_detail
     job.execution_status = ExecutionStatus.RUNNING.name
+    job.date_started = timezone.now()
     job.save()
     analysis_info = job.generate_analysis_info()
 
@@ -230,76 +784,82 @@ def run_pipeline(job_pk, job_url):
         ds_pth, ds_info = next(iter(data_source.items()))
         data_source_mapping[Path(ds_pth).name] = ds_info
 
-    # Stage QC:
-    fastqc_dir = job.result_dir.joinpath('fastqc')
-    if not fastqc_dir.exists():
-        fastqc_dir.mkdir()
-    if job.quality_check:
-        update_stage(job_detail, 'stage_qc', StageStatus.RUNNING)
-        returncode = run_fastqc(job, analysis_info)
-        if returncode:
-            update_stage(job_detail, 'stage_qc', StageStatus.FAILED)
-            # TODO: short circuit failure and notification
-            # End the pipeline now and notify user about why
-        else:
-            update_stage(job_detail, 'stage_qc', StageStatus.SUCCESSFUL)
-    else:
+    # Create the result folder of each stage
+    for stage_dir_name in [
+        'fastqc', 'STAR', 'cufflinks', 'cuffmerge', 'cuffquant', 'cuffdiff',
+    ]:
+        stage_dir = job.result_dir.joinpath(stage_dir_name)
+        if not stage_dir.exists():
+            stage_dir.mkdir()
+
+    if not job.quality_check:
         update_stage(job_detail, 'stage_qc', StageStatus.SKIPED)
 
-    # Stage Alignment:
-    update_stage(job_detail, 'stage_alignment', StageStatus.RUNNING)
-    if job.genome_aligner.startswith('STAR'):
-        # STAR
-        star_dir = job.result_dir.joinpath('STAR')
-        if not star_dir.exists():
-            star_dir.mkdir()
-        returncode = run_star(job, analysis_info, data_source_mapping)
-        if returncode:
-            update_stage(job_detail, 'stage_alignment', StageStatus.FAILED)
-        else:
-            update_stage(job_detail, 'stage_alignment', StageStatus.SUCCESSFUL)
+    # Run all stages, independent steps run concurrently within the
+    # cores and memory reserved for this analysis
+    if cores is None or memory is None:
+        budget = get_pipeline_budget()
     else:
-        # Tophat
-        update_stage(job_detail, 'stage_alignment', StageStatus.FAILED)
-
-    # Stage Cufflinks:
-    update_stage(job_detail, 'stage_cufflinks', StageStatus.RUNNING)
-    cufflinks_dir = job.result_dir.joinpath('cufflinks')
-    if not cufflinks_dir.exists():
-        cufflinks_dir.mkdir()
-    returncode = run_cufflinks(job, analysis_info)
-    if returncode:
-        update_stage(job_detail, 'stage_cufflinks', StageStatus.FAILED)
+        budget = ResourceBudget(cores, memory)
+    unverified = list(unverified_data_sources(job.experiment))
+    if unverified:
+        # Inputs may have changed since the analysis was submitted
+        logger.error(
+            'Analysis %d refuses unverified data sources: %s' % (
+                job.pk, ', '.join(ds.file_path for ds in unverified)
+            )
+        )
+        pipeline_succeeded = False
     else:
-        update_stage(job_detail, 'stage_cufflinks', StageStatus.SUCCESSFUL)
+        graph = build_pipeline_graph(
+            job, analysis_info, data_source_mapping, budget,
+        )
+        # Progress of a previous run is stale
+        job.step_progress.all().delete()
+        create_step_progress(job, graph)
+        # The alignments only reserve the memory to sort their reads, the
+        # shared genome index is reserved once. Leave enough for the
+        # largest step, so it can still run.
+        index_memory = max(0, min(
+            shared_index_bytes(job.genome_reference),
+            budget.memory - max(
+                (step.memory for step in graph.steps.values()), default=0,
+            ),
+        ))
+        with budget.reserved(0, index_memory), ProgressMonitor(
+            graph, partial(save_progress, job),
+            interval=settings.BIOCLOUD_PROGRESS_INTERVAL,
+        ):
+            pipeline_succeeded = graph.run(
+                budget,
+                on_stage_update=partial(stage_updated, job, job_detail),
+            )
 
-    # Stage Cuffdiff:
-    update_stage(job_detail, 'stage_cuffdiff', StageStatus.RUNNING)
-    cuffmerge_dir = job.result_dir.joinpath('cuffmerge')
-    cuffquant_dir = job.result_dir.joinpath('cuffquant')
-    cuffdiff_dir = job.result_dir.joinpath('cuffdiff')
-    for cuff_dir in [cuffmerge_dir, cuffquant_dir, cuffdiff_dir]:
-        if not cuff_dir.exists():
-            cuff_dir.mkdir()
-    returncode = run_cuffdiff(job, analysis_info)
-    if returncode:
-        update_stage(job_detail, 'stage_cuffdiff', StageStatus.FAILED)
-    else:
-        update_stage(job_detail, 'stage_cuffdiff', StageStatus.SUCCESSFUL)
-
-    # generating report
-    job_report = job.report
-    # TODO: check if report is successfully generated
-    sp.run([
-        'bc_report',
-        '-p', 'bc_pipelines.rna_seq.report.RNASeqReport',
-        str(job.result_dir),
-        str(job_report.full_path)
-    ])
+    if pipeline_succeeded:
+        # generating report
+        job_report = job.report
+        # TODO: check if report is successfully generated
+        run_step_command(job, 'bc_report', [
+            'bc_report',
+            '-p', 'bc_pipelines.rna_seq.report.RNASeqReport',
+            str(job.result_dir),
+            str(job_report.full_path)
+        ])
 
     # pipeline ends
     job.date_finished = timezone.now()
-    job.execution_status = ExecutionStatus.SUCCESSFUL.name
+    job.result_bytes = tree_size(job.result_dir)
+    record_usage(
+        job.owner, StorageArea.RESULTS, job.pk, job.result_bytes,
+    )
+    if pipeline_succeeded:
+        record_path_usage(
+            job.owner, StorageArea.REPORTS, job.report.pk,
+            job.report.full_path,
+        )
+        job.execution_status = ExecutionStatus.SUCCESSFUL.name
+    else:
+        job.execution_status = ExecutionStatus.FAILED.name
     job.save()
 
     # sending notification email
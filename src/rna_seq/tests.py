@@ -1,3 +1,288 @@
-from django.test import TestCase
+from datetime import timedelta
+import os
+from pathlib import Path
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from analyses.models import ExecutionStatus, GenomeReference, Report
+from analyses.resources import ResourceBudget
+from analyses.retention import (
+    RetentionPolicy, delete_artifact, load_manifest, sweep,
+)
+from analyses.stage_cache import tree_size
+from experiments.models import Experiment
+from users.models import StorageArea, StorageLedgerEntry
+from .models import RNASeqModel
+from .tasks import (
+    STAR_MEMORY, STAR_SHARED_GENOME_MEMORY, nullcontext, run_star,
+    star_cache_parameters, star_genome_args,
+)
+
+
+class StarArgumentsTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.genome_root = Path('/genomes/hg19')
+        self.job = SimpleNamespace(genome_reference=SimpleNamespace(
+            identifier='hg19', full_dir_path=self.genome_root,
+        ))
+
+    def test_genome_args(self):
+        private_args = star_genome_args(self.genome_root, False)
+        self.assertIn('--sjdbGTFfile', private_args)
+        self.assertNotIn('--genomeLoad', private_args)
+        shared_args = star_genome_args(self.genome_root, True)
+        self.assertIn('LoadAndKeep', shared_args)
+        self.assertNotIn('--sjdbGTFfile', shared_args)
+        # Fallback of a shared index loaded privately
+        fallback_args = star_genome_args(
+            self.genome_root, False, insert_junctions=False,
+        )
+        self.assertEqual(fallback_args, ['--genomeDir', '/genomes/hg19'])
+
+    def test_cache_parameters_depend_on_genome_load(self):
+        with mock.patch(
+            'rna_seq.tasks.get_genome_index_manager', return_value=None,
+        ):
+            private = star_cache_parameters(self.job)
+        with mock.patch(
+            'rna_seq.tasks.get_genome_index_manager',
+            return_value=mock.Mock(),
+        ):
+            shared = star_cache_parameters(self.job)
+        self.assertEqual(private['genome_load'], 'NoSharedMemory')
+        self.assertEqual(shared['genome_load'], 'LoadAndKeep')
+        self.assertTrue(private['junction_args'])
+        self.assertEqual(shared['junction_args'], [])
+        self.assertEqual(
+            private['genome_reference'], shared['genome_reference'],
+        )
+
+
+class StarGenomeFallbackTestCase(SimpleTestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        result_dir = Path(tmp_dir.name)
+        result_dir.joinpath('STAR').mkdir()
+        self.fastq = result_dir.joinpath('reads.fq')
+        self.fastq.write_bytes(b'@read1\nACGT\n+\nIIII\n')
+        self.job = SimpleNamespace(
+            result_dir=result_dir,
+            genome_reference=SimpleNamespace(
+                full_dir_path=result_dir.joinpath('genome'),
+            ),
+        )
+        # Loading the index into shared memory failed
+        manager = mock.Mock()
+        manager.attach.return_value = nullcontext(False)
+        for patcher in [
+            mock.patch(
+                'rna_seq.tasks.get_genome_index_manager',
+                return_value=manager,
+            ),
+            mock.patch(
+                'rna_seq.tasks.run_step_command',
+                side_effect=self.run_step_command,
+            ),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.commands = []
+
+    def run_step_command(self, job, log_name, args, env=None):
+        self.commands.append((log_name, self.budget.used_memory))
+        return SimpleNamespace(returncode=0)
+
+    def run_star(self):
+        # Memory reserved by the step itself
+        self.assertTrue(
+            self.budget.try_acquire(1, STAR_SHARED_GENOME_MEMORY)
+        )
+        return run_star(
+            self.job, 'sample1', [self.fastq], threads=1, budget=self.budget,
+        )
+
+    def test_private_index_memory_is_reserved(self):
+        self.budget = ResourceBudget(2, STAR_MEMORY)
+        self.assertEqual(self.run_star(), 0)
+        self.assertEqual(self.commands[0], ('star.sample1', STAR_MEMORY))
+        self.assertEqual(
+            self.budget.used_memory, STAR_SHARED_GENOME_MEMORY,
+        )
+
+    def test_fails_without_memory_for_private_index(self):
+        self.budget = ResourceBudget(2, STAR_SHARED_GENOME_MEMORY * 2)
+        self.assertTrue(self.budget.try_acquire(1, STAR_SHARED_GENOME_MEMORY))
+        self.assertEqual(self.run_star(), 1)
+        self.assertEqual(self.commands, [])
+        self.assertEqual(
+            self.budget.used_memory, STAR_SHARED_GENOME_MEMORY * 2,
+        )
+
+
+class RetentionTestCase(TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        tmp_dir = Path(tmp_dir.name)
+        settings_override = override_settings(
+            BIOCLOUD_RESULTS_DIR=tmp_dir.joinpath('results'),
+            BIOCLOUD_REPORTS_DIR=tmp_dir.joinpath('reports'),
+            BIOCLOUD_RETENTION_BAM_DAYS=30,
+            BIOCLOUD_RETENTION_ASSEMBLY_DAYS=7,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        owner = get_user_model().objects.create_user(
+            'user@example.com', 'password',
+        )
+        self.date_finished = timezone.now() - timedelta(days=60)
+        self.analysis = RNASeqModel.objects.create(
+            owner=owner, name='analysis',
+            genome_reference=GenomeReference.objects.create(
+                identifier='hg19', source='UCSC', organism='Homo sapiens',
+            ),
+            experiment=Experiment.objects.create(owner=owner, name='exp'),
+            genome_aligner='STAR_2.5.2a',
+            execution_status=ExecutionStatus.SUCCESSFUL.name,
+            date_finished=self.date_finished,
+            report=Report.objects.create(is_public=True),
+        )
+        self.result_dir = self.analysis.result_dir
+        for rel_path in [
+            'STAR/s1/Aligned.sortedByCoord.out.bam',
+            'STAR/s1/Aligned.sortedByCoord.out.bam.bai',
+            'cufflinks/s1/transcripts.gtf',
+            'cuffquant/s1/abundances.cxb',
+            'cuffdiff/gene_exp.diff',
+        ]:
+            path = self.result_dir.joinpath(rel_path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b'x' * 100)
+        patcher = mock.patch(
+            'rna_seq.retention.run_step_command',
+            side_effect=self.run_step_command,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_step_command(self, job, log_name, args, env=None):
+        if args[1] == 'view':
+            Path(args[args.index('-o') + 1]).write_bytes(b'x' * 50)
+        return SimpleNamespace(returncode=0)
+
+    def generate_report(self):
+        self.analysis.report.full_path.mkdir(parents=True)
+
+    def sweep(self, days):
+        return sweep(now=self.date_finished + timedelta(days=days))
+
+    def exists(self, rel_path):
+        return self.result_dir.joinpath(rel_path).exists()
+
+    def test_policies_not_due_yet(self):
+        self.generate_report()
+        self.assertEqual(self.sweep(days=0), 1)
+        self.assertFalse(self.exists('cuffquant/s1'))
+        self.assertTrue(self.exists('cufflinks/s1/transcripts.gtf'))
+        self.assertTrue(self.exists('STAR/s1/Aligned.sortedByCoord.out.bam'))
+        self.assertEqual(
+            list(load_manifest(self.result_dir)), ['cuffquant/s1'],
+        )
+
+    def test_due_policies(self):
+        self.generate_report()
+        self.assertEqual(self.sweep(days=30), 3)
+        self.assertFalse(self.exists('cufflinks/s1'))
+        self.assertFalse(self.exists('STAR/s1/Aligned.sortedByCoord.out.bam'))
+        self.assertFalse(
+            self.exists('STAR/s1/Aligned.sortedByCoord.out.bam.bai')
+        )
+        self.assertTrue(self.exists('STAR/s1/Aligned.sortedByCoord.out.cram'))
+        self.assertTrue(self.exists('cuffdiff/gene_exp.diff'))
+        manifest = load_manifest(self.result_dir)
+        self.assertEqual(
+            manifest['STAR/s1/Aligned.sortedByCoord.out.bam'], {
+                'action': 'compressed to CRAM',
+                'date_archived': (
+                    self.date_finished + timedelta(days=30)
+                ).isoformat(),
+                'replaced_by': 'STAR/s1/Aligned.sortedByCoord.out.cram',
+            },
+        )
+        self.assertEqual(manifest['cufflinks/s1']['action'], 'deleted')
+        self.assertIsNone(manifest['cufflinks/s1']['replaced_by'])
+        self.assertEqual(
+            StorageLedgerEntry.objects.get(
+                area=StorageArea.RESULTS.name, key=str(self.analysis.pk),
+            ).num_bytes,
+            tree_size(self.result_dir),
+        )
+        # Already archived
+        self.assertEqual(self.sweep(days=31), 0)
+
+    def test_after_report(self):
+        self.assertEqual(self.sweep(days=30), 1)
+        self.assertTrue(self.exists('cuffquant/s1/abundances.cxb'))
+        self.assertTrue(self.exists('cufflinks/s1/transcripts.gtf'))
+
+    def test_first_matching_policy_claims_the_path(self):
+        policies = [
+            RetentionPolicy('kept', 'cuffdiff', None, 0, False),
+            RetentionPolicy('deleted', '*', delete_artifact, 0, False),
+        ]
+        with mock.patch.object(
+            RNASeqModel, 'retention_policies', return_value=policies,
+        ):
+            self.assertEqual(self.sweep(days=0), 3)
+        self.assertTrue(self.exists('cuffdiff/gene_exp.diff'))
+        self.assertFalse(self.exists('STAR'))
+
+    def test_bam_shared_with_the_stage_cache_is_deferred(self):
+        bam_path = self.result_dir.joinpath(
+            'STAR/s1/Aligned.sortedByCoord.out.bam'
+        )
+        os.link(str(bam_path), str(self.result_dir.joinpath('cached.bam')))
+        self.assertEqual(self.sweep(days=30), 0)
+        self.assertTrue(bam_path.exists())
+        self.assertNotIn(
+            'STAR/s1/Aligned.sortedByCoord.out.bam',
+            load_manifest(self.result_dir),
+        )
+
+    def test_failed_analysis_is_kept(self):
+        RNASeqModel.objects.filter(pk=self.analysis.pk).update(
+            execution_status=ExecutionStatus.FAILED.name,
+        )
+        self.generate_report()
+        self.assertEqual(self.sweep(days=30), 0)
+
+    def test_archived_result_is_gone(self):
+        self.generate_report()
+        self.sweep(days=30)
+        auth_key = self.analysis.report.auth_key
+        response = self.client.get(reverse('access_result', kwargs={
+            'auth_key': auth_key,
+            'file_path': 'STAR/s1/Aligned.sortedByCoord.out.bam',
+        }))
+        self.assertEqual(response.status_code, 410)
+        self.assertIn(
+            b'STAR/s1/Aligned.sortedByCoord.out.cram', response.content,
+        )
+        response = self.client.get(reverse('access_result', kwargs={
+            'auth_key': auth_key, 'file_path': 'cufflinks/s1/genes.fpkm',
+        }))
+        self.assertEqual(response.status_code, 410)
+        response = self.client.get(reverse('access_result', kwargs={
+            'auth_key': auth_key, 'file_path': 'cuffdiff/gene_exp.diff',
+        }))
+        self.assertEqual(response.status_code, 200)
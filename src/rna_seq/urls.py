@@ -1,8 +1,13 @@
 from django.conf.urls import url
-from .views import RNASeqFormView, RNASeqDetailView
+from .views import (
+    RNASeqFormView, RNASeqDetailView, analysis_progress, step_metrics,
+)
 
 urlpatterns = [
     url(r'^new/$', RNASeqFormView.as_view(), name='new_rna_seq'),
     url(r'^view/(?P<pk>\d+)/$', RNASeqDetailView.as_view(),
         name='rna_seq_detail'),
+    url(r'^view/(?P<pk>\d+)/progress/$', analysis_progress,
+        name='rna_seq_progress'),
+    url(r'^metrics/$', step_metrics, name='rna_seq_step_metrics'),
 ]
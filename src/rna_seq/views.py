@@ -1,13 +1,25 @@
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
 from django.core.urlresolvers import reverse_lazy
+from django.db.models import Count, Max, Sum
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from django.utils.html import mark_safe
 from django.utils.translation import ugettext_lazy as _
 from django.views.generic import DetailView
 
 from analyses import pipelines
+from analyses.progress import critical_path_seconds
 from analyses.views import AbstractAnalysisFormView
 from analyses.forms import ReportUpdateForm
+from analyses.models import ExecutionStatus
+from core.decorators import ajax_required
 from .forms import RNASeqCreateForm
-from .models import ALL_TOOLS_IN_USE, RNASeqModel
+from .models import (
+    ALL_TOOLS_IN_USE, RNASeqModel, RNASeqExeDetail, RNASeqStepMetric,
+)
 
 
 @pipelines.register_view
@@ -46,5 +58,134 @@ class RNASeqDetailView(DetailView):
         context.update({
             'analysis': analysis,
             'analysis_detail': analysis.execution_detail,
+            'progress_interval': settings.BIOCLOUD_PROGRESS_INTERVAL,
         })
         return context
+
+
+@ajax_required
+@login_required
+def analysis_progress(request, pk):
+    """Progress of an analysis polled by its detail page.
+
+    The ETA is the time left along the longest path of the steps running
+    or not started yet, each estimated by its progress or its wall time in
+    previous analyses.
+    """
+    analysis = get_object_or_404(
+        RNASeqModel.objects.select_related('execution_detail'),
+        owner=request.user, pk=pk,
+    )
+    detail = analysis.execution_detail
+    now = timezone.now()
+    steps = []
+    remaining = {}
+    requires = {}
+    # In the order the steps were added to the pipeline, which is
+    # topological
+    for progress in analysis.step_progress.order_by('pk'):
+        remaining_seconds = progress.remaining_seconds(now)
+        steps.append({
+            'step': progress.step,
+            'stage': progress.stage,
+            'percentDone': progress.percent_done,
+            'throughput': progress.throughput,
+            'remainingSeconds': remaining_seconds,
+        })
+        remaining[progress.step] = remaining_seconds or 0
+        requires[progress.step] = progress.requires
+    if analysis.execution_status == ExecutionStatus.RUNNING.name and steps:
+        eta_seconds = critical_path_seconds(remaining, requires)
+    else:
+        eta_seconds = None
+    return JsonResponse({
+        'status': analysis.execution_status,
+        'stages': {
+            field.name: getattr(detail, field.name)
+            for field in RNASeqExeDetail._meta.get_fields()
+            if field.name.startswith('stage_')
+        },
+        'steps': steps,
+        'etaSeconds': eta_seconds,
+    })
+
+
+# (metric name, type, help, aggregated field) of the step metrics export
+STEP_METRICS = [
+    ('runs_total', 'counter', 'Commands finished', 'num_runs'),
+    ('failures_total', 'counter', 'Commands exited non-zero', 'num_failures'),
+    ('wall_seconds_total', 'counter', 'Wall-clock time', 'wall_time'),
+    ('user_seconds_total', 'counter', 'User CPU time', 'user_time'),
+    ('sys_seconds_total', 'counter', 'System CPU time', 'sys_time'),
+    ('max_rss_bytes', 'gauge', 'Largest max RSS of a command', 'max_rss'),
+    ('read_bytes_total', 'counter', 'Bytes read from disk', 'bytes_read'),
+    (
+        'written_bytes_total', 'counter', 'Bytes written to disk',
+        'bytes_written',
+    ),
+]
+
+
+def can_read_metrics(request):
+    """Whether the request is from a staff user or has the metrics token.
+
+    The client address cannot be trusted, as requests are proxied by nginx.
+    """
+    if request.user.is_authenticated() and request.user.is_staff:
+        return True
+    token = settings.BIOCLOUD_METRICS_TOKEN
+    if not token:
+        return False
+    scheme, _, given_token = (
+        request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    )
+    return (
+        scheme.lower() == 'bearer' and
+        constant_time_compare(given_token.strip(), token)
+    )
+
+
+def step_metrics(request):
+    """Export the resource usage of pipeline tools as plain text.
+
+    The format follows the Prometheus text exposition format, one sample
+    per tool. Only staff users and scrapers sending
+    ``BIOCLOUD_METRICS_TOKEN`` as a bearer token can read it.
+    """
+    if not can_read_metrics(request):
+        return HttpResponseForbidden()
+    per_tool = (
+        RNASeqStepMetric.objects
+        .order_by('tool')
+        .values('tool')
+        .annotate(
+            num_runs=Count('pk'),
+            wall_time=Sum('wall_time'),
+            user_time=Sum('user_time'),
+            sys_time=Sum('sys_time'),
+            max_rss=Max('max_rss'),
+            bytes_read=Sum('bytes_read'),
+            bytes_written=Sum('bytes_written'),
+        )
+    )
+    failures = dict(
+        RNASeqStepMetric.objects
+        .exclude(returncode=0)
+        .order_by('tool')
+        .values_list('tool')
+        .annotate(Count('pk'))
+    )
+    lines = []
+    for name, metric_type, help_text, field in STEP_METRICS:
+        full_name = 'biocloud_rnaseq_step_%s' % name
+        lines.append('# HELP %s %s' % (full_name, help_text))
+        lines.append('# TYPE %s %s' % (full_name, metric_type))
+        for row in per_tool:
+            row['num_failures'] = failures.get(row['tool'], 0)
+            lines.append('%s{tool="%s"} %s' % (
+                full_name, row['tool'], row[field] or 0
+            ))
+    return HttpResponse(
+        '\n'.join(lines) + '\n',
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
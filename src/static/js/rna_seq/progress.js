@@ -0,0 +1,52 @@
+// Poll the progress of a running analysis and update its detail page.
+// The container element carries the polling URL and interval:
+// <div id="analysis-progress" data-url="..." data-interval="30">
+var formatDuration = function(seconds) {
+    if (seconds === null) {
+        return '-';
+    }
+    var minutes = Math.ceil(seconds / 60);
+    if (minutes < 60) {
+        return minutes + ' min';
+    }
+    return Math.floor(minutes / 60) + ' h ' + (minutes % 60) + ' min';
+};
+
+var formatNumber = function(value, digits) {
+    return value === null ? '-' : value.toFixed(digits);
+};
+
+$(function() {
+    var $progress = $('#analysis-progress');
+    if ($progress.length === 0) {
+        return;
+    }
+    var url = $progress.data('url');
+    var interval = $progress.data('interval') * 1000;
+
+    var render = function(data) {
+        $.each(data.stages, function(stage, status) {
+            $('#' + stage.replace('_', '-')).text(status || 'WAITING');
+        });
+        var $tbody = $progress.find('tbody').empty();
+        data.steps.forEach(function(step) {
+            $('<tr>')
+                .append($('<td>').text(step.step))
+                .append($('<td>').text(formatNumber(step.percentDone, 1)))
+                .append($('<td>').text(formatNumber(step.throughput, 0)))
+                .append($('<td>').text(formatDuration(step.remainingSeconds)))
+                .appendTo($tbody);
+        });
+        $progress.find('.eta').text(formatDuration(data.etaSeconds));
+        return data.status === 'RUNNING' || data.status === 'QUEUEING';
+    };
+
+    var poll = function() {
+        $.getJSON(url).done(function(data) {
+            if (render(data)) {
+                setTimeout(poll, interval);
+            }
+        });
+    };
+    poll();
+});
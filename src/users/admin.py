@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.translation import ugettext_lazy as _
 
-from .models import EmailUser as User
+from .models import EmailUser as User, StorageLedgerEntry
 from .forms import AdminUserChangeForm, UserCreationForm
 
 
@@ -31,6 +31,10 @@ class UserAdmin(UserAdmin):
                 ),
             },
         ),
+        (
+            _('Storage'),
+            {'fields': ('storage_quota_gb', )},
+        ),
         (
             _('Important dates'),
             {'fields': ('last_login', 'date_joined')},
@@ -59,3 +63,16 @@ class UserAdmin(UserAdmin):
     search_fields = ('email',)
     ordering = ('email',)
     filter_horizontal = ('groups', 'user_permissions',)
+
+
+@admin.register(StorageLedgerEntry)
+class StorageLedgerEntryAdmin(admin.ModelAdmin):
+
+    list_display = ('owner', 'area', 'key', 'num_bytes', 'date_updated')
+    list_filter = ('area', )
+    search_fields = ('owner__email', )
+    readonly_fields = ('owner', 'area', 'key', 'num_bytes', 'date_updated')
+
+    def has_add_permission(self, request):
+        # Entries are only recorded as files change
+        return False
@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from users.storage import rebuild_usage, storage_usage
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the storage of users again from the file system, such as '
+        'after files were removed by hand.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'emails', nargs='*',
+            help='Emails of the users to measure. All users by default.',
+        )
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('pk')
+        if options['emails']:
+            users = users.filter(email__in=options['emails'])
+        for user in users:
+            rebuild_usage(user)
+            self.stdout.write('%s: %s' % (
+                user.email,
+                filesizeformat(sum(storage_usage(user).values())),
+            ))
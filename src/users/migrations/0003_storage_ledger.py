@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 12:10
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_emailuser_auth_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailuser',
+            name='storage_quota_gb',
+            field=models.PositiveIntegerField(blank=True, help_text="Storage the user's data sources, results and reports can take. Leave blank to use the site default. 0 means unlimited.", null=True, verbose_name='storage quota (GB)'),
+        ),
+        migrations.CreateModel(
+            name='StorageLedgerEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('area', models.CharField(choices=[('DATA_SOURCES', 'Data sources'), ('RESULTS', 'Analysis results'), ('REPORTS', 'Reports')], max_length=32)),
+                ('key', models.CharField(blank=True, max_length=255)),
+                ('num_bytes', models.BigIntegerField()),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='storage_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'storage ledger entry',
+                'verbose_name_plural': 'storage ledger entries',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='storageledgerentry',
+            unique_together=set([('owner', 'area', 'key')]),
+        ),
+    ]
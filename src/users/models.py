@@ -16,6 +16,8 @@ from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.translation import ugettext, ugettext_lazy as _
 
+from core.utils import ChoiceEnum
+
 logger = logging.getLogger(__name__)
 
 
@@ -154,6 +156,14 @@ class EmailUser(AbstractBaseUser, PermissionsMixin):
         verbose_name=_('date joined'),
         default=timezone.now,
     )
+    storage_quota_gb = models.PositiveIntegerField(
+        verbose_name=_('storage quota (GB)'),
+        blank=True, null=True,
+        help_text=_(
+            "Storage the user's data sources, results and reports can take. "
+            "Leave blank to use the site default. 0 means unlimited."
+        ),
+    )
 
     objects = EmailUserManager()
 
@@ -238,3 +248,41 @@ class EmailUser(AbstractBaseUser, PermissionsMixin):
                                .format(self, user_folder))
             else:
                 user_folder.mkdir()
+
+
+class StorageArea(ChoiceEnum):
+    DATA_SOURCES = _("Data sources")
+    RESULTS = _("Analysis results")
+    REPORTS = _("Reports")
+
+
+class StorageLedgerEntry(models.Model):
+    """Bytes a user takes in one storage area for one item.
+
+    The item is identified by a key within its area, the primary key of
+    an analysis for its results and of a report for its files. The data
+    sources of a user are a single item with an empty key. See
+    :mod:`users.storage` for how the entries are kept up to date.
+    """
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='storage_entries',
+    )
+    area = models.CharField(
+        choices=StorageArea.choices(),
+        max_length=32,
+    )
+    key = models.CharField(max_length=255, blank=True)
+    num_bytes = models.BigIntegerField()
+    date_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('storage ledger entry')
+        verbose_name_plural = _('storage ledger entries')
+        unique_together = ('owner', 'area', 'key')
+
+    def __str__(self):
+        return '%s %s/%s: %d bytes' % (
+            self.owner_id, self.area, self.key, self.num_bytes,
+        )
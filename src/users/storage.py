@@ -0,0 +1,157 @@
+"""Storage each user takes, kept up to date as files are added.
+
+Walking the data source, result and report folders to sum up the usage of
+a user takes minutes, so the usage is recorded in
+:class:`~users.models.StorageLedgerEntry` whenever an item changes: the
+data sources of a user when the file index is updated, the results of an
+analysis after each of its stages and its report once generated. Only the
+changed item is measured, and the usage of a user is the sum of its
+entries. The sums are cached until an entry of the user changes.
+"""
+from collections import OrderedDict
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+
+from analyses.stage_cache import tree_size
+from .models import StorageArea, StorageLedgerEntry
+
+GB = 1024 ** 3
+
+USAGE_CACHE_KEY = 'users:storage-usage:{pk}'
+
+
+def path_size(path):
+    """Return the bytes a file or a folder tree takes, 0 if missing."""
+    try:
+        if os.path.isdir(str(path)):
+            return tree_size(path)
+        return os.stat(str(path)).st_size
+    except OSError:
+        return 0
+
+
+def record_usage(owner, area, key, num_bytes):
+    """Set the bytes an item of a user takes.
+
+    Args:
+        owner: User owning the item.
+        area (StorageArea): Storage area of the item.
+        key (str): Identifier of the item within the area.
+        num_bytes (int): Bytes the item takes, 0 to forget it.
+    """
+    if not num_bytes:
+        forget_usage(owner, area, [key])
+        return
+    StorageLedgerEntry.objects.update_or_create(
+        owner=owner, area=area.name, key=str(key),
+        defaults={'num_bytes': num_bytes},
+    )
+    invalidate_usage(owner)
+
+
+def record_path_usage(owner, area, key, path):
+    """Measure a file or a folder tree and record it as an item."""
+    size = path_size(path)
+    record_usage(owner, area, key, size)
+    return size
+
+
+def forget_usage(owner, area, keys):
+    """Remove items of a user, once their files are deleted."""
+    StorageLedgerEntry.objects.filter(
+        owner=owner, area=area.name, key__in=[str(key) for key in keys],
+    ).delete()
+    invalidate_usage(owner)
+
+
+def forget_deleted_item(area, key):
+    """Remove an item once it is deleted, whoever owned it."""
+    entries = StorageLedgerEntry.objects.filter(area=area.name, key=str(key))
+    owner_pks = set(entries.values_list('owner_id', flat=True))
+    entries.delete()
+    for owner_pk in owner_pks:
+        cache.delete(USAGE_CACHE_KEY.format(pk=owner_pk))
+
+
+def invalidate_usage(owner):
+    """Forget the cached storage usage of a user."""
+    cache.delete(USAGE_CACHE_KEY.format(pk=owner.pk))
+
+
+def storage_usage(owner):
+    """Return the bytes a user takes in each storage area.
+
+    Returns:
+        OrderedDict: StorageArea to bytes, for all areas.
+    """
+    key = USAGE_CACHE_KEY.format(pk=owner.pk)
+    totals = cache.get(key)
+    if totals is None:
+        totals = dict(
+            StorageLedgerEntry.objects
+            .filter(owner=owner)
+            .values_list('area')
+            .annotate(Sum('num_bytes'))
+        )
+        cache.set(key, totals)
+    return OrderedDict(
+        (area, totals.get(area.name) or 0) for area in StorageArea
+    )
+
+
+def storage_quota(owner):
+    """Return the bytes a user is allowed to take, or None if unlimited.
+
+    The quota of the user overrides ``BIOCLOUD_STORAGE_QUOTA_GB``.
+    """
+    quota_gb = owner.storage_quota_gb
+    if quota_gb is None:
+        quota_gb = settings.BIOCLOUD_STORAGE_QUOTA_GB
+    if not quota_gb:
+        return None
+    return quota_gb * GB
+
+
+def storage_left(owner):
+    """Return the bytes a user can still take, or None if unlimited."""
+    quota = storage_quota(owner)
+    if quota is None:
+        return None
+    return quota - sum(storage_usage(owner).values())
+
+
+def rebuild_usage(owner):
+    """Measure everything a user owns again from the file system.
+
+    The index of the data sources of the user is updated as well.
+    """
+    # Imported here, the data source and analysis apps depend on this one
+    from data_sources.indexing import update_index
+    from rna_seq.models import RNASeqModel
+
+    update_index(owner)
+    results = []
+    reports = []
+    for analysis in (
+        RNASeqModel.objects.filter(owner=owner).select_related('report')
+    ):
+        results.append(str(analysis.pk))
+        record_path_usage(
+            owner, StorageArea.RESULTS, analysis.pk, analysis.result_dir,
+        )
+        if analysis.report_id is not None:
+            reports.append(str(analysis.report_id))
+            record_path_usage(
+                owner, StorageArea.REPORTS, analysis.report_id,
+                analysis.report.full_path,
+            )
+    for area, keys in [
+        (StorageArea.RESULTS, results), (StorageArea.REPORTS, reports),
+    ]:
+        StorageLedgerEntry.objects.filter(
+            owner=owner, area=area.name,
+        ).exclude(key__in=keys).delete()
+    invalidate_usage(owner)
@@ -1,3 +1,94 @@
-from django.test import TestCase
+from pathlib import Path
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from analyses.models import GenomeReference, Report
+from experiments.models import Experiment
+from rna_seq.models import RNASeqModel
+from .models import StorageArea, StorageLedgerEntry
+from .storage import (
+    GB, record_path_usage, record_usage, storage_left, storage_usage,
+)
+
+
+class StorageLedgerTestCase(TestCase):
+
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user(
+            'user@example.com', 'password',
+        )
+
+    def usage(self, area):
+        return storage_usage(self.owner)[area]
+
+    def create_analysis(self):
+        return RNASeqModel.objects.create(
+            owner=self.owner, name='analysis',
+            genome_reference=GenomeReference.objects.create(
+                identifier='hg19', source='UCSC', organism='Homo sapiens',
+            ),
+            experiment=Experiment.objects.create(
+                owner=self.owner, name='exp',
+            ),
+            genome_aligner='STAR_2.5.2a',
+            report=Report.objects.create(),
+        )
+
+    def test_usage_sums_the_items_of_each_area(self):
+        record_usage(self.owner, StorageArea.RESULTS, 1, 100)
+        record_usage(self.owner, StorageArea.RESULTS, 2, 50)
+        record_usage(self.owner, StorageArea.REPORTS, 1, 10)
+        self.assertEqual(
+            list(storage_usage(self.owner).values()), [0, 150, 10],
+        )
+        # The cached usage follows the updates
+        record_usage(self.owner, StorageArea.RESULTS, 1, 200)
+        self.assertEqual(self.usage(StorageArea.RESULTS), 250)
+        record_usage(self.owner, StorageArea.RESULTS, 2, 0)
+        self.assertEqual(self.usage(StorageArea.RESULTS), 200)
+        self.assertEqual(
+            StorageLedgerEntry.objects.filter(owner=self.owner).count(), 2,
+        )
+
+    def test_record_path_usage(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            result_dir = Path(tmp_dir)
+            result_dir.joinpath('a.txt').write_bytes(b'a' * 100)
+            result_dir.joinpath('sub').mkdir()
+            result_dir.joinpath('sub', 'b.txt').write_bytes(b'b' * 20)
+            record_path_usage(self.owner, StorageArea.RESULTS, 1, result_dir)
+            self.assertEqual(self.usage(StorageArea.RESULTS), 120)
+            record_path_usage(
+                self.owner, StorageArea.RESULTS, 1,
+                result_dir.joinpath('missing'),
+            )
+        self.assertEqual(self.usage(StorageArea.RESULTS), 0)
+
+    def test_storage_left(self):
+        record_usage(self.owner, StorageArea.DATA_SOURCES, '', GB)
+        with override_settings(BIOCLOUD_STORAGE_QUOTA_GB=0):
+            self.assertIsNone(storage_left(self.owner))
+        with override_settings(BIOCLOUD_STORAGE_QUOTA_GB=3):
+            self.assertEqual(storage_left(self.owner), 2 * GB)
+            self.owner.storage_quota_gb = 1
+            self.assertEqual(storage_left(self.owner), 0)
+
+    def test_deleted_analysis_is_forgotten(self):
+        analysis = self.create_analysis()
+        record_usage(self.owner, StorageArea.RESULTS, analysis.pk, 100)
+        record_usage(self.owner, StorageArea.REPORTS, analysis.report_id, 10)
+        self.assertEqual(self.usage(StorageArea.RESULTS), 100)
+        analysis.delete()
+        self.assertEqual(self.usage(StorageArea.RESULTS), 0)
+        self.assertEqual(self.usage(StorageArea.REPORTS), 10)
+
+    def test_deleted_report_is_forgotten(self):
+        analysis = self.create_analysis()
+        record_usage(self.owner, StorageArea.RESULTS, analysis.pk, 100)
+        record_usage(self.owner, StorageArea.REPORTS, analysis.report_id, 10)
+        self.assertEqual(self.usage(StorageArea.REPORTS), 10)
+        # The analysis of the report is deleted as well
+        analysis.report.delete()
+        self.assertEqual(list(storage_usage(self.owner).values()), [0, 0, 0])